@@ -1,13 +1,33 @@
 import os
 import io
+import time
+import queue
+import json
 import base64
+import asyncio
+import tempfile
+import threading
+import yaml
+import logging
+import numpy as np
 from pydantic import BaseModel
-from typing import Dict, Any, Union
-from starlette.responses import StreamingResponse, Response
-from fastapi import FastAPI, File, UploadFile, APIRouter, HTTPException
+from typing import Dict, Any, Union, Callable, Coroutine, Iterator, List, Tuple, Optional
+from starlette.datastructures import Headers
+from starlette.requests import ClientDisconnect
+from starlette.responses import StreamingResponse, Response, PlainTextResponse, JSONResponse
+from fastapi import FastAPI, File, UploadFile, APIRouter, HTTPException, Request, Query
 
+import setup_logger
 from constants import *
 from googlifier import Googlifier
+from degradation import DEGRADATION_LEVELS, GOOGLIFY, ANNOTATE
+from detectors.base_detector import get_field
+from inference_pool import InferencePool, PoolSaturatedError
+from job_queue import create_job_id, get_job_processor, is_webhook_allowed
+from image_operations import detect_image_format, convert_image_to_bytes, read_image_size
+from video_processing import MULTIPART_BOUNDARY, END_OF_STREAM, QueueFile, open_video, read_video_frames, \
+    read_multipart_frames, encode_multipart_part, googlify_video_frames, put_until_stopped, get_until_stopped
+from metrics import REGISTRY, POOL_IN_FLIGHT, POOL_REJECTED, REQUESTS_TOO_LARGE, JOBS
 
 
 # Initialize fastapi instance
@@ -15,13 +35,520 @@ app = FastAPI()
 dev_router = APIRouter()
 prod_router = APIRouter()
 
-googlifier = Googlifier(CONFIG_FILE_PATH)
+# Load configurations
+with open(CONFIG_FILE_PATH, "r") as file_object:
+    config = yaml.load(file_object, Loader=yaml.SafeLoader)
+inference_pool_config = get_field(config, "inference_pool")
+
+# Load the models of the Googlifier of every thread of the inference pool when the module is imported. When gunicorn
+# runs with "--preload" this happens once in the master process and the workers share their models through
+# copy-on-write memory instead of each worker loading them again during the warm-up.
+preloaded_googlifiers = [Googlifier(CONFIG_FILE_PATH) for _ in range(get_field(inference_pool_config, "max_workers"))]
+
+# The googlifier work is blocking, so it runs in a pool of threads with one Googlifier per thread
+inference_pool = InferencePool(lambda: Googlifier(CONFIG_FILE_PATH),
+                               max_workers=get_field(inference_pool_config, "max_workers"),
+                               max_queue_size=get_field(inference_pool_config, "max_queue_size"),
+                               preloaded_workers=list(preloaded_googlifiers))
+retry_after = get_field(inference_pool_config, "retry_after")
+
+# Load the size of the pipeline used to googlify videos
+video_config = get_field(config, "video")
+video_encode_workers = get_field(video_config, "encode_workers")
+video_queue_size = get_field(video_config, "queue_size")
+
+# Load the maximum number of images of a batch request
+batch_max_images = get_field(get_field(config, "batch"), "max_images")
+
+# Load the limits of the size of the requests, checked before reading the whole body or decoding the images
+limits_config = get_field(config, "limits")
+max_request_bytes = get_field(limits_config, "max_request_bytes")
+max_video_bytes = get_field(limits_config, "max_video_bytes")
+max_image_pixels = get_field(limits_config, "max_image_pixels")
+
+# Load the queue of the jobs. Its processors poll the queue from the processes started with src/cli_app/process_jobs.py
+# and, when api_processors is set, from threads of the API workers, each thread with its own Googlifier
+jobs_config = get_field(config, "jobs")
+job_processor = get_job_processor(jobs_config, lambda: Googlifier(CONFIG_FILE_PATH),
+                                  get_field(jobs_config, "api_processors", default=0))
+job_backend = job_processor.backend
+max_pending_jobs = get_field(jobs_config, "max_pending_jobs")
+
+# Load the latency budget of the requests that do not send one
+default_budget_ms = get_field(get_field(config, "deadline"), "default_budget_ms", default=0)
+
+# Set when the models of every thread of the inference pool are warmed up, until then "/readyz" reports the worker as not
+# ready so the load balancer does not send it requests that would pay for the setup of the models
+warmup_done = threading.Event()
+warmup_seconds: Union[float, None] = None
+
+# Number of chunks of a streamed response waiting to be sent to the client
+stream_queue_size = 8
+
+# Header with the latency budget of a request in milliseconds and header with the degradation level used to meet it
+LATENCY_BUDGET_HEADER = "X-Latency-Budget-Ms"
+DEGRADATION_LEVEL_HEADER = "X-Degradation-Level"
 
 
 class ImageBase64(BaseModel):
     base64_str: str
 
 
+class JobStatus(BaseModel):
+    id: str
+    status: str
+    created: float
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    images: int
+    errors: Optional[List[Optional[str]]] = None
+
+
+class EyeAnnotation(BaseModel):
+    box: Tuple[int, int, int, int]
+    eye_center: Tuple[int, int]
+    eye_radius: int
+    pupil_center: Tuple[int, int]
+    pupil_radius: int
+
+
+class Annotations(BaseModel):
+    width: int
+    height: int
+    faces: List[Tuple[int, int, int, int]]
+    eyes: List[EyeAnnotation]
+
+
+# Documentation of the endpoints that receive the image bytes as the request body
+IMAGE_REQUEST_BODY = {"requestBody": {
+    "required": True,
+    "content": {media_type: {"schema": {"type": "string", "format": "binary"}} for media_type in IMAGE_MEDIA_TYPES}}}
+
+# Documentation of the endpoint that receives several images as the request body
+BATCH_REQUEST_BODY = {"requestBody": {
+    "required": True,
+    "content": {
+        "application/json": {"schema": {"type": "object", "properties": {"images": {"type": "array", "items": {
+            "type": "object", "properties": {"base64_str": {"type": "string"}}}}}}},
+        "application/x-ndjson": {"schema": {"type": "string"}},
+        "multipart/form-data": {"schema": {"type": "object", "properties": {"files": {"type": "array", "items": {
+            "type": "string", "format": "binary"}}}}}}}}
+
+# Documentation of the endpoint that receives a job with one image as raw bytes or several images like a batch request
+JOB_REQUEST_BODY = {"requestBody": {
+    "required": True,
+    "content": {**IMAGE_REQUEST_BODY["requestBody"]["content"], **BATCH_REQUEST_BODY["requestBody"]["content"]}}}
+
+# Documentation of the endpoint that receives a video file or a multipart stream of images as the request body
+VIDEO_REQUEST_BODY = {"requestBody": {
+    "required": True,
+    "content": {media_type: {"schema": {"type": "string", "format": "binary"}}
+                for media_type in ["video/mp4", "video/x-msvideo", "multipart/x-mixed-replace"]}}}
+
+
+@app.on_event("startup")
+def start_job_processor():
+    job_processor.start()
+
+
+@app.on_event("startup")
+def start_warm_up():
+    threading.Thread(target=warm_up_inference_pool, name="warmup", daemon=True).start()
+
+
+def warm_up_inference_pool():
+    """ Warms up the Googlifier of each thread of the inference pool, creating the ones that do not exist yet, and
+    marks the worker as ready when they are all done. The models are expected to be loaded before, so a model loaded
+    by the warm-up is reported, since it takes memory of its own in each worker. """
+    global warmup_seconds
+    start = time.perf_counter()
+    model_load_count = Googlifier.model_load_count
+    inference_pool.run_on_all_workers(lambda googlifier: googlifier.warm_up())
+    warmup_seconds = time.perf_counter() - start
+    if Googlifier.model_load_count > model_load_count:
+        logging.getLogger(setup_logger.LOGGER_NAME).warning(
+            "%d models were loaded by the warm-up instead of being preloaded with the module.",
+            Googlifier.model_load_count - model_load_count)
+    warmup_done.set()
+
+
+@app.on_event("shutdown")
+def shutdown_inference_pool():
+    job_processor.stop()
+    inference_pool.shutdown()
+
+
+class RequestSizeLimitMiddleware:
+    """ ASGI middleware that rejects the requests whose Content-Length is over the limit before their body is read. The
+    video endpoint has its own limit. The bytes of the body are counted as they are received too, so the bodies sent
+    without Content-Length, or with a wrong one, are rejected as soon as they grow over the limit, whichever endpoint
+    or parser reads them."""
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        max_bytes = max_video_bytes if scope["path"].rstrip("/").endswith("/video") else max_request_bytes
+        try:
+            content_length = int(Headers(scope=scope).get("content-length") or 0)
+        except ValueError:
+            content_length = 0
+        if content_length > max_bytes:
+            REQUESTS_TOO_LARGE.inc(limit="request_bytes")
+            response = JSONResponse({"detail": "Request too large, the maximum is " + str(max_bytes) + " bytes."},
+                                    status_code=413)
+            await response(scope, receive, send)
+            return
+
+        received_bytes = 0
+
+        async def receive_limited() -> Dict[str, Any]:
+            nonlocal received_bytes
+            message = await receive()
+            if message["type"] == "http.request":
+                received_bytes += len(message.get("body", b""))
+                if received_bytes > max_bytes:
+                    REQUESTS_TOO_LARGE.inc(limit="request_bytes")
+                    raise HTTPException(status_code=413, detail="Request too large, the maximum is " + str(max_bytes) +
+                                                                " bytes.")
+            return message
+
+        await self.app(scope, receive_limited, send)
+
+
+app.add_middleware(RequestSizeLimitMiddleware)
+
+
+async def read_limited_body(request: Request, max_bytes: int) -> bytes:
+    """ Reads the body of a request, stopping as soon as it is larger than the limit.
+
+    Args:
+        request: The request.
+        max_bytes: The maximum size of the body in bytes.
+
+    Returns: The body or an HTTPException if it is too large.
+    """
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > max_bytes:
+            REQUESTS_TOO_LARGE.inc(limit="request_bytes")
+            raise HTTPException(status_code=413, detail="Request too large, the maximum is " + str(max_bytes) +
+                                                        " bytes.")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def is_image_too_large(image_byte_array: bytes) -> bool:
+    """ Checks whether an image has more pixels than max_image_pixels, reading its size from the header so the check
+    is done before decoding it. Images whose size can not be read are left to the decoder.
+
+    Args:
+        image_byte_array: The image as bytes.
+
+    Returns: Whether the image is too large.
+    """
+    image_size = read_image_size(image_byte_array)
+    if image_size is None or image_size[0] * image_size[1] <= max_image_pixels:
+        return False
+    REQUESTS_TOO_LARGE.inc(limit="image_pixels")
+    return True
+
+
+def check_image_size(image_byte_array: bytes):
+    """ Rejects an image that has more pixels than max_image_pixels.
+
+    Args:
+        image_byte_array: The image as bytes.
+
+    Returns: An HTTPException if the image is too large.
+    """
+    if is_image_too_large(image_byte_array):
+        raise HTTPException(status_code=413, detail="Image too large, the maximum is " + str(max_image_pixels) +
+                                                    " pixels.")
+
+
+def get_deadline(request: Request) -> Union[float, None]:
+    """ Gets the time by which a request should be answered, from its latency budget header or default_budget_ms.
+
+    Args:
+        request: The request.
+
+    Returns: The time.monotonic() time of the deadline, None if the request has no budget, or an HTTPException if the
+             header is not a number.
+    """
+    budget = request.headers.get(LATENCY_BUDGET_HEADER)
+    try:
+        budget_ms = float(budget) if budget is not None else default_budget_ms
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid " + LATENCY_BUDGET_HEADER + " header.")
+
+    if budget_ms <= 0:
+        return None
+    return time.monotonic() + budget_ms / 1000
+
+
+def select_image_format(accept: Union[str, None], input_format: str) -> Union[str, None]:
+    """ Selects the format of the output image from the Accept header of the request.
+
+    Args:
+        accept: The value of the Accept header. If None the format of the input image is used.
+        input_format: File extension of the format of the input image.
+
+    Returns: The file extension of the selected format or None if the header does not accept any supported format.
+    """
+    if not accept:
+        return input_format
+
+    # Sort the media types by their quality value, keeping the order of the header for equal values
+    media_types = []
+    for media_range in accept.split(","):
+        media_type, *params = [value.strip() for value in media_range.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            media_types.append((-quality, len(media_types), media_type.lower()))
+
+    for _, _, media_type in sorted(media_types):
+        if media_type in ["*/*", "image/*"]:
+            return input_format
+        if media_type in IMAGE_MEDIA_TYPES:
+            return IMAGE_MEDIA_TYPES[media_type]
+    return None
+
+
+def get_multipart_boundary(content_type: Union[str, None]) -> Union[str, None]:
+    """ Gets the boundary of a multipart stream from the Content-Type header of the request.
+
+    Args:
+        content_type: The value of the Content-Type header.
+
+    Returns: The boundary or None if the content type is not multipart.
+    """
+    if not content_type:
+        return None
+
+    media_type, *params = [value.strip() for value in content_type.split(";")]
+    if not media_type.lower().startswith("multipart/"):
+        return None
+    for param in params:
+        if param.lower().startswith("boundary="):
+            return param[len("boundary="):].strip('"')
+    return None
+
+
+async def read_batch_body(request: Request) -> List[Union[bytes, None]]:
+    """ Reads the images sent as the body of a batch request, as a JSON object with a list of "images" in base64, as
+    NDJSON with one {"base64_str": ...} object per line or as a multipart form with one file per image.
+
+    Args:
+        request: The request with the images as body.
+
+    Returns: A list with the bytes of each image, None for the images that could not be read, or an HTTPException if
+             the body is not valid.
+    """
+    content_type = (request.headers.get("content-type") or "").split(";")[0].strip().lower()
+    if content_type == "multipart/form-data":
+        form = await request.form()
+        return [await value.read() for _, value in form.multi_items() if not isinstance(value, str)]
+
+    body = await read_limited_body(request, max_request_bytes)
+    try:
+        if content_type in ["application/x-ndjson", "application/jsonl"]:
+            base64_strings = [json.loads(line)["base64_str"] for line in body.splitlines() if line.strip()]
+        else:
+            base64_strings = [image["base64_str"] for image in json.loads(body)["images"]]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid batch request.")
+    # Release the body before decoding, only the base64 strings are needed
+    del body
+
+    images = []
+    for base64_str in base64_strings:
+        try:
+            images.append(base64.b64decode(base64_str, validate=True))
+        except (ValueError, TypeError):
+            images.append(None)
+    return images
+
+
+def encode_batch_result(index: int, image_byte_array: Union[bytes, None] = None, error: Union[str, None] = None) \
+        -> bytes:
+    """ Encodes the result of an image of a batch request as a line of NDJSON.
+
+    Args:
+        index: The index of the image in the request.
+        image_byte_array: The image with googly eyes, if it was successful.
+        error: The reason why the image failed, if it was not successful.
+
+    Returns: The line as bytes.
+    """
+    result: Dict[str, Any] = {"index": index}
+    if error is None:
+        result["base64_str"] = base64.b64encode(image_byte_array).decode("utf-8")
+    else:
+        result["error"] = error
+    return (json.dumps(result) + "\n").encode()
+
+
+async def read_image_body(request: Request) -> Tuple[bytes, str]:
+    """ Reads the image sent as the body of the request.
+
+    Args:
+        request: The request with the image bytes as body.
+
+    Returns: A tuple with the image bytes and the file extension of its format or an HTTPException if the format is not
+             supported or the image is too large.
+    """
+    contents = await read_limited_body(request, max_request_bytes)
+
+    input_format = detect_image_format(contents)
+    if input_format is None:
+        raise HTTPException(status_code=400, detail="Unsupported file type.")
+    check_image_size(contents)
+
+    return contents, input_format
+
+
+def submit_googlifier(function: Callable[[Googlifier], Any]) -> "asyncio.Future[Any]":
+    """ Starts running a function using the Googlifier of one of the threads of the inference pool.
+
+    Args:
+        function: Callable that receives a Googlifier instance.
+
+    Returns: A future with the value returned by the function or an HTTPException if the service is saturated.
+    """
+    try:
+        future = inference_pool.submit(function)
+    except PoolSaturatedError:
+        POOL_REJECTED.inc()
+        raise HTTPException(status_code=503, detail="Service is busy, try again later.",
+                            headers={"Retry-After": str(retry_after)})
+
+    POOL_IN_FLIGHT.inc()
+    future.add_done_callback(lambda _: POOL_IN_FLIGHT.dec())
+    return future
+
+
+class RequestBodyStreamingResponse(StreamingResponse):
+    """ Streaming response whose request body is still being read while it is sent, by a task that also receives the
+    disconnection of the client. The response waits for that task instead of listening for the disconnection itself,
+    which would take the chunks of the body. """
+
+    def __init__(self, content: Any, body_read: asyncio.Event, media_type: str):
+        """
+        Args:
+            content: The async iterator with the chunks of the response.
+            body_read: Event set when the task reading the body is done, after the client disconnected.
+            media_type: The media type of the response.
+        """
+        super().__init__(content, media_type=media_type)
+        self.body_read = body_read
+
+    async def listen_for_disconnect(self, receive: Callable):
+        await self.body_read.wait()
+
+
+def stream_googlifier(generate: Callable[[Googlifier], Iterator[bytes]], media_type: str,
+                      cleanup: Union[Callable[[], Any], None] = None,
+                      read_body: Union[Callable[[], Coroutine], None] = None) -> StreamingResponse:
+    """ Streams the chunks generated by a function using the Googlifier of one of the threads of the inference pool. The
+    chunks are sent as they are generated through a bounded queue, so the function waits for slow clients and stops
+    when the client disconnects.
+
+    Args:
+        generate: Callable that receives a Googlifier instance and returns an iterator with the chunks of the response.
+        media_type: The media type of the response.
+        cleanup: Callable run when the function is done, e.g. to remove the temporary files it reads.
+        read_body: Coroutine function run on the event loop while the response is sent, which reads the body of the
+                   request for the function and then waits for the disconnection of the client.
+
+    Returns: The streamed response or an HTTPException if the service is saturated.
+    """
+    chunks: queue.Queue = queue.Queue(maxsize=stream_queue_size)
+    stop = threading.Event()
+    body_read = asyncio.Event()
+
+    def produce(googlifier: Googlifier):
+        generated_chunks = generate(googlifier)
+        try:
+            for chunk in generated_chunks:
+                if not put_until_stopped(chunks, chunk, stop):
+                    break
+        finally:
+            generated_chunks.close()
+            put_until_stopped(chunks, END_OF_STREAM, stop)
+
+    future = submit_googlifier(produce)
+    if cleanup is not None:
+        future.add_done_callback(lambda _: cleanup())
+
+    async def stream_chunks():
+        read_body_task = None
+        if read_body is not None:
+            read_body_task = asyncio.create_task(read_body())
+            read_body_task.add_done_callback(lambda _: body_read.set())
+        try:
+            while True:
+                chunk = await asyncio.to_thread(get_until_stopped, chunks, stop)
+                if chunk is END_OF_STREAM:
+                    break
+                yield chunk
+            await future
+        finally:
+            stop.set()
+            if read_body_task is not None:
+                read_body_task.cancel()
+
+    if read_body is not None:
+        return RequestBodyStreamingResponse(stream_chunks(), body_read, media_type)
+    return StreamingResponse(stream_chunks(), media_type=media_type)
+
+
+async def run_googlifier(function: Callable[[Googlifier], Any]) -> Any:
+    """ Runs a function using the Googlifier of one of the threads of the inference pool.
+
+    Args:
+        function: Callable that receives a Googlifier instance.
+
+    Returns: The value returned by the function or an HTTPException if the service is saturated.
+    """
+    return await submit_googlifier(function)
+
+
+async def run_googlifier_before_deadline(function: Callable[[Googlifier, int], Any], image_byte_array: bytes,
+                                        deadline: Union[float, None], operation: str = GOOGLIFY) -> Tuple[Any, str]:
+    """ Runs a function on an image using the Googlifier of one of the threads of the inference pool, degrading it as
+    needed to meet its deadline. The degradation level is selected once a thread is free, so the time waited in the
+    queue of the pool is taken into account.
+
+    Args:
+        function: Callable that receives a Googlifier instance and the index of the degradation level.
+        image_byte_array: The input image as bytes.
+        deadline: The time.monotonic() time by which the image should be done, None to never degrade it.
+        operation: The operation the function does on the image, GOOGLIFY or ANNOTATE, whose times are measured apart.
+
+    Returns: A tuple with the value returned by the function and the name of the degradation level, or an HTTPException
+             if the service is saturated.
+    """
+    def run(googlifier: Googlifier) -> Tuple[Any, int]:
+        degradation_level = googlifier.select_degradation_level(image_byte_array, deadline, operation)
+        return function(googlifier, degradation_level), degradation_level
+
+    result, degradation_level = await run_googlifier(run)
+    return result, DEGRADATION_LEVELS[degradation_level]
+
+
 @dev_router.post("/googlify_upload_file/")
 async def googlify_upload_file(file: UploadFile = File(...)) -> Any:
     """ The endpoint that adds googly eyes to your image.
@@ -37,42 +564,359 @@ async def googlify_upload_file(file: UploadFile = File(...)) -> Any:
         raise HTTPException(status_code=400, detail="Unsupported file type.")
 
     contents = await file.read()
+    check_image_size(contents)
 
     # preprocess
-    success, image_with_googly_eyes = googlifier.detect_eyes_and_googlify(contents)
+    success, image_with_googly_eyes = await run_googlifier(
+        lambda googlifier: googlifier.detect_eyes_and_googlify(contents))
 
     if not success:
-        return HTTPException(status_code=400, detail="Corrupt input file.")
+        raise HTTPException(status_code=400, detail="Corrupt input file.")
 
     return StreamingResponse(io.BytesIO(image_with_googly_eyes), media_type="image/png")
 
 
 @prod_router.post("/googlify/", response_model=ImageBase64)
-async def googlify(image_base64: ImageBase64) -> Any:
-    """ The endpoint that adds googly eyes to your image.
+async def googlify(image_base64: ImageBase64, request: Request, response: Response) -> Any:
+    """ The endpoint that adds googly eyes to your image. The latency budget of the request can be sent in the
+    X-Latency-Budget-Ms header, the degradation level used to meet it is returned in the X-Degradation-Level header.
 
     Args:
         image_base64: An image in the format base64.
+        request: The request, to read its headers.
+        response: The response, to set its headers.
 
     Returns: A dictionary with the service response or an HTTPException.
     """
+    deadline = get_deadline(request)
 
     try:
         contents = base64.b64decode(image_base64.base64_str)
     except:
         raise HTTPException(status_code=400, detail="Unsupported file type.")
-
+    # Release the base64 string, only the decoded bytes are needed from now on
+    image_base64.base64_str = ""
+    check_image_size(contents)
 
     # Googlify main function
-    success, image_with_googly_eyes = googlifier.detect_eyes_and_googlify(contents)
+    (success, image_with_googly_eyes), degradation_level = await run_googlifier_before_deadline(
+        lambda googlifier, level: googlifier.detect_eyes_and_googlify(contents, degradation_level=level), contents,
+        deadline)
 
     if not success:
-        return HTTPException(status_code=400, detail="Corrupt input file.")
+        raise HTTPException(status_code=400, detail="Corrupt input file.")
 
+    response.headers[DEGRADATION_LEVEL_HEADER] = degradation_level
     base64_image = base64.b64encode(image_with_googly_eyes).decode('utf-8')
+    del image_with_googly_eyes
 
     return {"base64_str": base64_image}
 
+@prod_router.post("/googlify/raw", response_class=Response, openapi_extra=IMAGE_REQUEST_BODY)
+async def googlify_raw(request: Request) -> Any:
+    """ The endpoint that adds googly eyes to your image, sent and returned as raw bytes. The format of the returned
+    image is chosen with the Accept header, by default it is the same as the input image. The latency budget of the
+    request can be sent in the X-Latency-Budget-Ms header, the degradation level used to meet it is returned in the
+    X-Degradation-Level header.
+
+    Args:
+        request: The request with the image bytes as body.
+
+    Returns: The image with googly eyes or an HTTPException.
+    """
+    deadline = get_deadline(request)
+    contents, input_format = await read_image_body(request)
+
+    image_format = select_image_format(request.headers.get("accept"), input_format)
+    if image_format is None:
+        raise HTTPException(status_code=406, detail="Unsupported output format.")
+
+    # Googlify main function
+    (success, image_with_googly_eyes), degradation_level = await run_googlifier_before_deadline(
+        lambda googlifier, level: googlifier.detect_eyes_and_googlify(contents, image_format, level), contents,
+        deadline)
+
+    if not success:
+        raise HTTPException(status_code=400, detail="Corrupt input file.")
+
+    media_type = next(key for key, value in IMAGE_MEDIA_TYPES.items() if value == image_format)
+    return Response(image_with_googly_eyes, media_type=media_type,
+                    headers={DEGRADATION_LEVEL_HEADER: degradation_level})
+
+
+@prod_router.post("/googlify/annotations", response_model=Annotations, openapi_extra=IMAGE_REQUEST_BODY)
+async def googlify_annotations(request: Request, response: Response) -> Any:
+    """ The endpoint that finds the faces and eyes in your image and returns where the googly eyes should be drawn,
+    without drawing them. The latency budget of the request can be sent in the X-Latency-Budget-Ms header, the
+    degradation level used to meet it is returned in the X-Degradation-Level header.
+
+    Args:
+        request: The request with the image bytes as body.
+        response: The response, to set its headers.
+
+    Returns: A dictionary with the faces, eyes and googly eyes parameters or an HTTPException.
+    """
+    deadline = get_deadline(request)
+    contents, _ = await read_image_body(request)
+
+    (success, annotations), degradation_level = await run_googlifier_before_deadline(
+        lambda googlifier, level: googlifier.detect_eyes_and_annotate(contents, level), contents, deadline, ANNOTATE)
+
+    if not success:
+        raise HTTPException(status_code=400, detail="Corrupt input file.")
+
+    response.headers[DEGRADATION_LEVEL_HEADER] = degradation_level
+    return annotations
+
+
+@prod_router.post("/googlify/video", response_class=StreamingResponse, openapi_extra=VIDEO_REQUEST_BODY)
+async def googlify_video(request: Request) -> Any:
+    """ The endpoint that adds googly eyes to a video file or to a multipart stream of images, such as MJPEG. The frames
+    are returned as they are processed in a "multipart/x-mixed-replace" stream of JPEG images, each part with the
+    headers "X-Frame-Index" and "X-Frames-Per-Second". The parts of a multipart stream are googlified as they arrive,
+    while a video file is read once it is fully received.
+
+    Args:
+        request: The request with the video file or the multipart stream as body.
+
+    Returns: The stream of frames with googly eyes or an HTTPException.
+    """
+    boundary = get_multipart_boundary(request.headers.get("content-type"))
+    if boundary is not None:
+        # The parts of a multipart stream are parsed as the body arrives, so live streams are googlified as they are
+        # received. The body is read by the event loop into a bounded queue read by the thread decoding the frames
+        body_chunks: queue.Queue = queue.Queue(maxsize=stream_queue_size)
+        body_stop = threading.Event()
+
+        async def read_body():
+            try:
+                async for chunk in request.stream():
+                    if chunk and not await asyncio.to_thread(put_until_stopped, body_chunks, chunk, body_stop):
+                        return
+                await asyncio.to_thread(put_until_stopped, body_chunks, END_OF_STREAM, body_stop)
+                # Once the body is read only the disconnection of the client is left to receive
+                while (await request.receive())["type"] != "http.disconnect":
+                    pass
+            except ClientDisconnect:
+                pass
+            except HTTPException as e:
+                await asyncio.to_thread(put_until_stopped, body_chunks, e, body_stop)
+
+        frames = read_multipart_frames(QueueFile(body_chunks, body_stop), boundary)
+        return stream_googlifier(lambda googlifier: generate_video_parts(googlifier, frames),
+                                 "multipart/x-mixed-replace; boundary=" + MULTIPART_BOUNDARY, cleanup=body_stop.set,
+                                 read_body=read_body)
+
+    # OpenCV only reads videos from files, so the body of a video file is written to a temporary file as it arrives
+    video_file = tempfile.NamedTemporaryFile()
+    try:
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > max_video_bytes:
+                REQUESTS_TOO_LARGE.inc(limit="request_bytes")
+                raise HTTPException(status_code=413, detail="Request too large, the maximum is " +
+                                                            str(max_video_bytes) + " bytes.")
+            # The body can be large, so it is written to disk from a worker thread not to block the event loop
+            await asyncio.to_thread(video_file.write, chunk)
+        await asyncio.to_thread(video_file.flush)
+
+        capture = open_video(video_file.name)
+        if capture is None:
+            raise HTTPException(status_code=400, detail="Unsupported file type.")
+        frames = read_video_frames(capture)
+        return stream_googlifier(lambda googlifier: generate_video_parts(googlifier, frames),
+                                 "multipart/x-mixed-replace; boundary=" + MULTIPART_BOUNDARY, cleanup=video_file.close)
+    except BaseException:
+        video_file.close()
+        raise
+
+
+def generate_video_parts(googlifier: Googlifier, frames: Iterator[np.ndarray]) -> Iterator[bytes]:
+    """ Draws the googly eyes on the frames of a video and encodes them as the JPEG parts of a multipart stream.
+
+    Args:
+        googlifier: The Googlifier instance used to draw the googly eyes.
+        frames: Iterator with the frames as numpy arrays in the BGR color space.
+
+    Returns: An iterator with the parts, each with the headers "X-Frame-Index" and "X-Frames-Per-Second".
+    """
+    encode_quality = googlifier.encoding_quality[".jpg"]
+    encoded_frames = googlify_video_frames(googlifier, frames,
+                                           lambda frame: convert_image_to_bytes(frame, ".jpg", encode_quality),
+                                           video_encode_workers, video_queue_size)
+    start = time.perf_counter()
+    for index, image_bytes in enumerate(encoded_frames):
+        frames_per_second = (index + 1) / max(time.perf_counter() - start, 1e-6)
+        headers = {"X-Frame-Index": index, "X-Frames-Per-Second": "%.1f" % frames_per_second}
+        yield encode_multipart_part(image_bytes, "image/jpeg", headers)
+
+
+@prod_router.post("/googlify/batch", response_class=StreamingResponse, openapi_extra=BATCH_REQUEST_BODY)
+async def googlify_batch(request: Request) -> Any:
+    """ The endpoint that adds googly eyes to several images in a single request. The images are sent as a JSON object
+    with a list of "images" in base64, as NDJSON with one {"base64_str": ...} object per line or as a multipart form with
+    one file per image. The results are streamed back as NDJSON as soon as each image is done, one line per image with
+    its "index" in the request and either its "base64_str" or an "error".
+
+    Args:
+        request: The request with the images as body.
+
+    Returns: The stream of results or an HTTPException.
+    """
+    images = await read_batch_body(request)
+    if len(images) > batch_max_images:
+        raise HTTPException(status_code=413, detail="Too many images, the maximum is " + str(batch_max_images) + ".")
+
+    def generate_results(googlifier: Googlifier) -> Iterator[bytes]:
+        # The images that could not be read or are too large are reported without going through the googlifier
+        valid_images = []
+        for index, image in enumerate(images):
+            if image is None:
+                yield encode_batch_result(index, error="Unsupported file type.")
+            elif is_image_too_large(image):
+                yield encode_batch_result(index, error="Image too large.")
+            else:
+                valid_images.append((index, image))
+
+        results = googlifier.detect_eyes_and_googlify_many([image for _, image in valid_images])
+        for valid_index, success, image_with_googly_eyes in results:
+            index = valid_images[valid_index][0]
+            if success:
+                yield encode_batch_result(index, image_byte_array=image_with_googly_eyes)
+            else:
+                yield encode_batch_result(index, error="Corrupt input file.")
+
+    return stream_googlifier(generate_results, "application/x-ndjson")
+
+
+@prod_router.post("/jobs", response_model=JobStatus, status_code=202, openapi_extra=JOB_REQUEST_BODY)
+async def submit_job(request: Request, response: Response,
+                     output_format: Union[str, None] = Query(None, alias="format"),
+                     webhook: Union[str, None] = None) -> Any:
+    """ The endpoint that submits a job to add googly eyes to one image, sent as raw bytes like in "googlify/raw", or to
+    several images, sent like in "googlify/batch". The job is processed in the background, its status is polled at
+    "/jobs/{id}", which is also returned in the Location header, and its images are fetched at
+    "/jobs/{id}/images/{index}" once it is done.
+
+    Args:
+        request: The request with the image or images as body.
+        response: The response, to set its headers.
+        output_format: The "format" of the output images, one of "jpg", "png" or "webp". By default a single image keeps
+                       its format and several images are encoded as PNG.
+        webhook: An http or https url that receives the status of the job as JSON when it finishes. Its host must be
+                 one of the webhook_hosts of the config file.
+
+    Returns: The status of the queued job or an HTTPException.
+    """
+    image_format = None
+    if output_format is not None:
+        image_format = "." + output_format.lower().lstrip(".")
+        if image_format not in IMAGE_MEDIA_TYPES.values():
+            raise HTTPException(status_code=400, detail="Unsupported output format.")
+    if webhook is not None and not is_webhook_allowed(webhook, job_processor.webhook_hosts):
+        raise HTTPException(status_code=400, detail="Invalid webhook url, its host is not allowed.")
+
+    content_type = (request.headers.get("content-type") or "").split(";")[0].strip().lower()
+    if content_type in ["multipart/form-data", "application/json", "application/x-ndjson", "application/jsonl"]:
+        images = await read_batch_body(request)
+        if len(images) > batch_max_images:
+            raise HTTPException(status_code=413, detail="Too many images, the maximum is " + str(batch_max_images) +
+                                                        ".")
+        # The whole job is rejected up front, so it does not take a place in the queue to fail
+        for image in images:
+            if image is None or detect_image_format(image) is None:
+                raise HTTPException(status_code=400, detail="Unsupported file type.")
+            check_image_size(image)
+    else:
+        image, input_format = await read_image_body(request)
+        images = [image]
+        image_format = image_format or input_format
+
+    if await asyncio.to_thread(job_backend.count_pending) >= max_pending_jobs:
+        POOL_REJECTED.inc()
+        raise HTTPException(status_code=503, detail="Service is busy, try again later.",
+                            headers={"Retry-After": str(retry_after)})
+
+    job_id = create_job_id()
+    await asyncio.to_thread(job_backend.add, job_id, images, {"format": image_format, "webhook": webhook})
+    JOBS.inc(status="submitted")
+
+    response.headers["Location"] = "/jobs/" + job_id
+    return await asyncio.to_thread(job_backend.get, job_id)
+
+
+@prod_router.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str) -> Any:
+    """ The endpoint with the status of a job: "queued", "running", "done" if any of its images succeeded or "failed".
+    Once it is finished the "errors" list has the error of each image, None for the ones that succeeded.
+
+    Args:
+        job_id: The id returned when the job was submitted.
+
+    Returns: The status of the job or an HTTPException if it does not exist or expired.
+    """
+    status = await asyncio.to_thread(job_backend.get, job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return status
+
+
+@prod_router.get("/jobs/{job_id}/images/{index}", response_class=Response)
+async def get_job_image(job_id: str, index: int) -> Any:
+    """ The endpoint with an output image of a finished job.
+
+    Args:
+        job_id: The id returned when the job was submitted.
+        index: The index of the image in the job.
+
+    Returns: The image with googly eyes or an HTTPException if the job is not finished or the image failed.
+    """
+    status = await asyncio.to_thread(job_backend.get, job_id)
+    if status is None or not 0 <= index < status["images"]:
+        raise HTTPException(status_code=404, detail="Image not found.")
+    if "errors" not in status:
+        raise HTTPException(status_code=409, detail="Job not finished.")
+    if status["errors"][index] is not None:
+        raise HTTPException(status_code=422, detail=status["errors"][index])
+
+    image_with_googly_eyes = await asyncio.to_thread(job_backend.get_output, job_id, index)
+    if image_with_googly_eyes is None:
+        raise HTTPException(status_code=404, detail="Image not found.")
+    media_type = next(key for key, value in IMAGE_MEDIA_TYPES.items()
+                      if value == detect_image_format(image_with_googly_eyes))
+    return Response(image_with_googly_eyes, media_type=media_type)
+
+
+@prod_router.get("/healthz")
+async def healthz() -> Any:
+    """ The liveness endpoint, it answers as long as the worker is serving requests.
+
+    Returns: The status of the worker.
+    """
+    return {"status": "ok"}
+
+
+@prod_router.get("/readyz")
+async def readyz() -> Any:
+    """ The readiness endpoint, it only reports the worker as ready once the models are warmed up.
+
+    Returns: The status of the worker and the seconds taken by the warm-up, with status code 503 until it is done.
+    """
+    if not warmup_done.is_set():
+        return JSONResponse({"status": "warming_up"}, status_code=503)
+    return {"status": "ready", "warmup_seconds": warmup_seconds}
+
+
+@prod_router.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> Any:
+    """ The endpoint with the metrics of the service, aggregated over all the workers, in the Prometheus text format.
+
+    Returns: The metrics as plain text.
+    """
+    return PlainTextResponse(REGISTRY.generate_latest(), media_type="text/plain; version=0.0.4")
+
+
 # Only include the "googlify_upload_file" in development mode for easy testing with using the swagger interface.
 app.include_router(prod_router)
 if os.environ.get('RUNNING_MODE') == 'dev':
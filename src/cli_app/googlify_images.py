@@ -0,0 +1,207 @@
+"""
+This is an app to add googly eyes to all the images of a directory, or of a manifest file with one image path per line,
+from the command line. The images are processed by a pool of processes, each with its own Googlifier, and written to
+the output directory keeping their relative paths. Images whose output already exists are skipped, so an interrupted
+run continues where it stopped when it is started again. At the end it prints the throughput and the time spent in each
+stage of the googlifier, to size the hardware of large backfills.
+"""
+
+import os
+import sys
+import mmap
+import time
+import json
+import argparse
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Tuple, Union
+
+import cv2 as cv
+
+from googlifier import Googlifier
+from constants import *
+from metrics import STAGE_DURATION
+from image_operations import detect_image_format
+
+# Extensions of the files of a directory that are googlified
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+# The Googlifier of the worker process, created once by init_worker
+googlifier: Union[Googlifier, None] = None
+
+
+def init_worker(config_file_path: str):
+    """ Creates the Googlifier of a worker process.
+
+    Args:
+        config_file_path: The path of the config file.
+    """
+    global googlifier
+    # The parallelism comes from the processes, so the OpenCV threads of each one would only compete for the CPUs
+    cv.setNumThreads(1)
+    googlifier = Googlifier(config_file_path)
+    # Each image of a backfill is only seen once, so caching its results would only take memory and disk
+    googlifier.result_cache = None
+
+
+def list_images(input_path: str) -> Iterator[Tuple[str, str]]:
+    """ Lists the images of a directory, recursively and in a stable order, or of a manifest file.
+
+    Args:
+        input_path: The path of a directory or of a manifest file with one image path per line. Relative paths are
+                    relative to the directory of the manifest and empty lines and lines starting with "#" are ignored.
+
+    Returns: An iterator of tuples with the path of each image and its path relative to the input, used for the output.
+    """
+    if os.path.isdir(input_path):
+        for directory, subdirectories, filenames in os.walk(input_path):
+            subdirectories.sort()
+            for filename in sorted(filenames):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    path = os.path.join(directory, filename)
+                    yield path, os.path.relpath(path, input_path)
+        return
+
+    manifest_directory = os.path.dirname(os.path.abspath(input_path))
+    with open(input_path, "r") as manifest:
+        for line in manifest:
+            path = line.strip()
+            if not path or path.startswith("#"):
+                continue
+            if os.path.isabs(path):
+                yield path, os.path.relpath(path, os.path.splitdrive(path)[0] + os.sep)
+            else:
+                yield os.path.join(manifest_directory, path), os.path.normpath(path)
+
+
+def get_output_path(output_directory: str, relative_path: str, image_format: Union[str, None]) -> str:
+    """ Gets the path of the output of an image.
+
+    Args:
+        output_directory: The directory of the outputs.
+        relative_path: The path of the image relative to the input.
+        image_format: File extension of the format of the output image. If None the extension of the input is kept.
+
+    Returns: The path of the output image.
+    """
+    root, extension = os.path.splitext(relative_path)
+    return os.path.join(output_directory, root + (image_format or extension))
+
+
+def googlify_file(input_path: str, output_path: str, image_format: Union[str, None]) \
+        -> Tuple[str, Union[str, None], int, int, Dict[str, object]]:
+    """ Draws the googly eyes on an image file in a worker process. The file is memory-mapped, so it is decoded straight
+    from the page cache, and the output is written to a temporary file that is renamed when complete, so an interrupted
+    run never leaves partial outputs behind.
+
+    Args:
+        input_path: The path of the input image.
+        output_path: The path of the output image.
+        image_format: File extension of the format of the output image. If None the format of the input is kept.
+
+    Returns: A tuple with the input path, the error or None if it succeeded, the size of the input in bytes, the id of
+             the worker process and the snapshot of its stage durations.
+    """
+    error = None
+    size = 0
+    try:
+        with open(input_path, "rb") as file_object:
+            size = os.fstat(file_object.fileno()).st_size
+            if size == 0:
+                error = "Empty file."
+            else:
+                with mmap.mmap(file_object.fileno(), 0, access=mmap.ACCESS_READ) as image_byte_array:
+                    output_format = image_format or detect_image_format(image_byte_array)
+                    if output_format is None:
+                        error = "Unsupported file type."
+                    else:
+                        success, image_with_googly_eyes = googlifier.detect_eyes_and_googlify(image_byte_array,
+                                                                                              output_format)
+                        if success:
+                            os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+                            with open(output_path + ".tmp", "wb") as output_file:
+                                output_file.write(image_with_googly_eyes)
+                            os.replace(output_path + ".tmp", output_path)
+                        else:
+                            error = "Corrupt input file."
+    except Exception as e:
+        error = repr(e)
+    return input_path, error, size, os.getpid(), STAGE_DURATION.snapshot()
+
+
+def summarize_stages(snapshots: List[Dict[str, object]]) -> Dict[str, Tuple[int, float]]:
+    """ Adds up the stage durations of the worker processes.
+
+    Args:
+        snapshots: The last snapshot of the stage durations of each worker process.
+
+    Returns: A dictionary with the number of calls and the total seconds of each stage.
+    """
+    stages: Dict[str, Tuple[int, float]] = {}
+    for snapshot in snapshots:
+        for label_values, value in snapshot.items():
+            # The value of a histogram is the count of each bucket followed by the sum and the count
+            stage = json.loads(label_values)[0]
+            count, seconds = stages.get(stage, (0, 0.0))
+            stages[stage] = (count + int(value[-1]), seconds + float(value[-2]))
+    return stages
+
+
+def main(arguments: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Adds googly eyes to all the images of a directory or manifest.")
+    parser.add_argument("input", help="Path of a directory with images or of a manifest file with one path per line.")
+    parser.add_argument("output", help="Path of the output directory.")
+    parser.add_argument("--format", choices=["jpg", "png", "webp"],
+                        help="Format of the output images. By default each image keeps its format.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Number of worker processes. The number of CPUs by default.")
+    parser.add_argument("--chunk-size", type=int, default=4, help="Number of images sent to a worker at once.")
+    parser.add_argument("--overwrite", action="store_true", help="Googlify the images whose output already exists.")
+    args = parser.parse_args(arguments)
+
+    image_format = "." + args.format if args.format else None
+    input_paths, output_paths = [], []
+    skipped = 0
+    for input_path, relative_path in list_images(args.input):
+        output_path = get_output_path(args.output, relative_path, image_format)
+        if not args.overwrite and os.path.exists(output_path):
+            skipped += 1
+            continue
+        input_paths.append(input_path)
+        output_paths.append(output_path)
+    print('%d images to googlify, %d skipped because their output exists.' % (len(input_paths), skipped))
+
+    done = failed = input_bytes = 0
+    snapshots: Dict[int, Dict[str, object]] = {}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                             initargs=(CONFIG_FILE_PATH,)) as executor:
+        results = executor.map(googlify_file, input_paths, output_paths, repeat(image_format),
+                               chunksize=args.chunk_size)
+        for input_path, error, size, worker_id, snapshot in results:
+            # The snapshots are cumulative, so only the last one of each worker is kept
+            snapshots[worker_id] = snapshot
+            input_bytes += size
+            if error is None:
+                done += 1
+            else:
+                failed += 1
+                print('Failed %s: %s' % (input_path, error), file=sys.stderr)
+            if (done + failed) % 100 == 0:
+                print('%d images, %.1f images per second.' % (done + failed,
+                                                              (done + failed) / (time.perf_counter() - start)))
+
+    elapsed = max(time.perf_counter() - start, 1e-6)
+    print('Googlified %d images, %d failed, in %.1f seconds with %d workers (%.1f images per second, %.1f MB per '
+          'second).' % (done, failed, elapsed, args.workers, (done + failed) / elapsed, input_bytes / elapsed / 1e6))
+
+    stages = summarize_stages(list(snapshots.values()))
+    if stages:
+        print(f"{'stage':>20} {'calls':>8} {'total (s)':>10} {'mean (ms)':>10}")
+        for stage, (count, seconds) in sorted(stages.items(), key=lambda item: -item[1][1]):
+            print(f"{stage:>20} {count:>8} {seconds:>10.1f} {seconds / max(count, 1) * 1e3:>10.2f}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,48 @@
+"""
+This is an app to add googly eyes to a video file, a video stream or the webcam from the command line.
+"""
+
+import time
+import argparse
+import yaml
+import cv2 as cv
+
+from googlifier import Googlifier
+from constants import *
+from detectors.base_detector import get_field
+from video_processing import open_video, read_video_frames, googlify_video_frames
+
+parser = argparse.ArgumentParser(description="Adds googly eyes to a video.")
+parser.add_argument("input", help="Path of the input video, url of a video stream or index of a camera.")
+parser.add_argument("output", help="Path of the output video.")
+parser.add_argument("--fourcc", default="mp4v", help="Four character code of the codec of the output video.")
+args = parser.parse_args()
+
+with open(CONFIG_FILE_PATH, "r") as file_object:
+    video_config = get_field(yaml.load(file_object, Loader=yaml.SafeLoader), "video")
+
+capture = open_video(int(args.input) if args.input.isdigit() else args.input)
+if capture is None:
+    print('Error opening video capture.')
+    exit(1)
+
+fps = capture.get(cv.CAP_PROP_FPS) or 30.0
+size = (int(capture.get(cv.CAP_PROP_FRAME_WIDTH)), int(capture.get(cv.CAP_PROP_FRAME_HEIGHT)))
+writer = cv.VideoWriter(args.output, cv.VideoWriter_fourcc(*args.fourcc), fps, size)
+
+googly = Googlifier(CONFIG_FILE_PATH)
+
+# The frames are decoded and googlified in parallel, the writer only receives the frames with googly eyes
+frame_count = 0
+start = time.perf_counter()
+for frame in googlify_video_frames(googly, read_video_frames(capture), None,
+                                   get_field(video_config, "encode_workers"), get_field(video_config, "queue_size")):
+    writer.write(frame)
+    frame_count += 1
+    if frame_count % 100 == 0:
+        print('%d frames, %.1f frames per second.' % (frame_count, frame_count / (time.perf_counter() - start)))
+
+writer.release()
+elapsed = time.perf_counter() - start
+print('Googlified %d frames in %.1f seconds (%.1f frames per second).' % (frame_count, elapsed,
+                                                                         frame_count / max(elapsed, 1e-6)))
@@ -0,0 +1,36 @@
+"""
+This is an app to process the jobs submitted to the "/jobs" endpoint of the service in a separate process, so the
+processors can be scaled independently of the API workers. It polls the job queue of the config file until it is
+interrupted.
+"""
+
+import os
+import signal
+import threading
+import argparse
+import yaml
+
+from googlifier import Googlifier
+from constants import *
+from detectors.base_detector import get_field
+from job_queue import get_job_processor
+
+parser = argparse.ArgumentParser(description="Processes the jobs submitted to the service.")
+parser.add_argument("--processors", type=int, default=os.cpu_count() or 1,
+                    help="Number of threads processing jobs, each with its own models. The number of CPUs by default.")
+args = parser.parse_args()
+
+with open(CONFIG_FILE_PATH, "r") as file_object:
+    jobs_config = get_field(yaml.load(file_object, Loader=yaml.SafeLoader), "jobs")
+
+job_processor = get_job_processor(jobs_config, lambda: Googlifier(CONFIG_FILE_PATH), args.processors)
+
+# Stop after the jobs being processed are done on Ctrl+C or when the container is stopped
+stop = threading.Event()
+signal.signal(signal.SIGINT, lambda *_: stop.set())
+signal.signal(signal.SIGTERM, lambda *_: stop.set())
+
+job_processor.start()
+print('Processing jobs with %d threads.' % args.processors)
+stop.wait()
+job_processor.stop()
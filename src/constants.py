@@ -1,4 +1,7 @@
 import os
 
-# Config file
-CONFIG_FILE_PATH = os.getcwd() + "/src/config.yaml"
+# Config file, it can be replaced with the CONFIG_FILE_PATH environment variable
+CONFIG_FILE_PATH = os.environ.get("CONFIG_FILE_PATH", os.getcwd() + "/src/config.yaml")
+
+# Supported image media types and the corresponding file extension used to encode them
+IMAGE_MEDIA_TYPES = {"image/jpeg": ".jpg", "image/png": ".png", "image/webp": ".webp"}
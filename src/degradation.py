@@ -0,0 +1,90 @@
+import threading
+from typing import Dict, List, Union
+
+# Degradation levels from the best quality to the fastest. Each level keeps the degradations of the previous ones:
+# - "reduced": the detection runs on a smaller image and the output is encoded with a faster, lower quality.
+# - "fewer_faces": only the largest faces get googly eyes.
+# - "geometric_eyes": the eyes are placed from the proportions of the face box instead of detecting its landmarks.
+DEGRADATION_LEVELS = ("full", "reduced", "fewer_faces", "geometric_eyes")
+FULL, REDUCED, FEWER_FACES, GEOMETRIC_EYES = range(len(DEGRADATION_LEVELS))
+
+# Position of the centers of the eyes relative to the face box, for the boxes of the face detectors enlarged by about
+# 15%, and size of the eye boxes relative to the distance between the eyes, used by the "geometric_eyes" level
+GEOMETRIC_EYE_X_RATIOS = (0.33, 0.67)
+GEOMETRIC_EYE_Y_RATIO = 0.4
+GEOMETRIC_EYE_WIDTH_RATIO = 0.45
+GEOMETRIC_EYE_HEIGHT_RATIO = 0.25
+
+# Operations whose times are measured apart, since the annotations do not pay for drawing and encoding the image
+OPERATIONS = ("googlify", "annotate")
+GOOGLIFY, ANNOTATE = OPERATIONS
+
+# Weight of the last image in the moving average of the time taken by each level
+SMOOTHING = 0.2
+
+# Fraction by which the times of the levels better than the one used are lowered with each image. Those levels are not
+# measured while they are skipped, so without it a single slow image would degrade every later image of the process
+STALE_DECAY = 0.05
+
+# Smallest size used to estimate the time of an image, the detection takes about the same time for smaller images
+MIN_MEGAPIXELS = 0.25
+
+
+class DegradationPolicy:
+    """ Chooses the degradation level of each image so that it is done before its deadline. It keeps a moving average of
+    the time per megapixel taken by each level of each operation on the previous images of the process and picks the
+    best level that is expected to finish in time. Levels that were never used are assumed to be fast enough, so they
+    get measured, and the times of the skipped levels decay, so they get measured again once the load is gone."""
+
+    def __init__(self, smoothing: float = SMOOTHING, stale_decay: float = STALE_DECAY):
+        self.smoothing = smoothing
+        self.stale_decay = stale_decay
+        self.seconds_per_megapixel: Dict[str, List[Union[float, None]]] = {
+            operation: [None] * len(DEGRADATION_LEVELS) for operation in OPERATIONS}
+        self._lock = threading.Lock()
+
+    def select_level(self, remaining_seconds: float, megapixels: float, operation: str = GOOGLIFY) -> int:
+        """ Selects the best degradation level expected to finish in the remaining time.
+
+        Args:
+            remaining_seconds: The time left until the deadline.
+            megapixels: The size of the image in megapixels.
+            operation: The operation done on the image, one of OPERATIONS.
+
+        Returns: The index of the level in DEGRADATION_LEVELS. The fastest level if none is expected to finish in time.
+        """
+        if remaining_seconds <= 0:
+            return len(DEGRADATION_LEVELS) - 1
+
+        megapixels = max(megapixels, MIN_MEGAPIXELS)
+        with self._lock:
+            for level, seconds_per_megapixel in enumerate(self.seconds_per_megapixel[operation]):
+                if seconds_per_megapixel is None or seconds_per_megapixel * megapixels <= remaining_seconds:
+                    return level
+        return len(DEGRADATION_LEVELS) - 1
+
+    def record(self, level: int, seconds: float, megapixels: float, operation: str = GOOGLIFY):
+        """ Adds the time taken by an image to the moving average of its level and lowers the times of the better
+        levels, which were skipped.
+
+        Args:
+            level: The index of the level used in DEGRADATION_LEVELS.
+            seconds: The time taken by the image.
+            megapixels: The size of the image in megapixels.
+            operation: The operation done on the image, one of OPERATIONS.
+        """
+        seconds_per_megapixel = seconds / max(megapixels, MIN_MEGAPIXELS)
+        with self._lock:
+            levels = self.seconds_per_megapixel[operation]
+            previous = levels[level]
+            if previous is None:
+                levels[level] = seconds_per_megapixel
+            else:
+                levels[level] = previous + self.smoothing * (seconds_per_megapixel - previous)
+            for better_level in range(level):
+                if levels[better_level] is not None:
+                    levels[better_level] *= 1 - self.stale_decay
+
+
+# The policy shared by the Googlifier instances of the process
+DEGRADATION_POLICY = DegradationPolicy()
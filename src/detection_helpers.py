@@ -1,4 +1,6 @@
-from typing import Tuple, List
+from typing import Tuple, List, Union
+
+import numpy as np
 
 
 def make_bbox_larger(coordinates: Tuple[int, int, int, int], percentage: float) -> Tuple[float, float, float, float]:
@@ -11,16 +13,23 @@ def make_bbox_larger(coordinates: Tuple[int, int, int, int], percentage: float)
 
     Returns: The new bounding box coordinates in the format (xmin, ymin, xmax, ymax).
     """
+    boxes = make_bboxes_larger(np.array([coordinates], dtype=np.float64), percentage)
+    xmin, ymin, xmax, ymax = [float(i) for i in boxes[0]]
+    return xmin, ymin, xmax, ymax
 
-    xmin, ymin, xmax, ymax = [float(i) for i in coordinates]
-    width = xmax - xmin
-    height = ymax - ymin
-    xmin -= percentage * float(width)
-    xmax += percentage * float(width)
-    ymin -= percentage * float(height)
-    ymax += percentage * float(height)
 
-    return xmin, ymin, xmax, ymax
+def make_bboxes_larger(boxes: np.ndarray, percentage: float) -> np.ndarray:
+    """ Makes several bounding boxes larger at once. Works like make_bbox_larger over an array of boxes.
+
+    Args:
+        boxes: Array with shape (N, 4) where each row is a bounding box in the format (xmin, ymin, xmax, ymax).
+        percentage: The percentage by which to enlarge the bounding boxes.
+
+    Returns: Array with shape (N, 4) with the new bounding boxes in the format (xmin, ymin, xmax, ymax).
+    """
+    boxes = boxes.astype(np.float64)
+    sizes = boxes[:, 2:4] - boxes[:, 0:2]
+    return np.hstack((boxes[:, 0:2] - percentage * sizes, boxes[:, 2:4] + percentage * sizes))
 
 
 def clip_detections(detections: List[Tuple[int, int, int, int]], image_shape) -> List[Tuple[int, int, int, int]]:
@@ -34,38 +43,263 @@ def clip_detections(detections: List[Tuple[int, int, int, int]], image_shape) ->
 
     Returns: The list of detections clipped to the boundary of the image in the same format as the input.
     """
+    if not detections:
+        return []
+
+    clipped_detections = clip_boxes(np.array(detections), image_shape)
+    return [(int(x), int(y), int(w), int(h)) for x, y, w, h in clipped_detections]
+
+
+def clip_boxes(boxes: np.ndarray, image_shape) -> np.ndarray:
+    """ Clips several detections to the boundaries of the image at once. Works like clip_detections over an array.
+
+    Args:
+        boxes: Array with shape (N, 4) where each row is a detection in the format (x, y, width, height).
+        image_shape: Tuple with the shape of the image in the format (h, w, c).
+
+    Returns: Array with shape (M, 4), M <= N, with the detections clipped to the boundary of the image in the same
+             format as the input. Detections completely outside the image are removed.
+    """
+    img_height, img_width = image_shape[:2]
+    x, y, w, h = boxes.T
+    x_end = x + w
+    y_end = y + h
+
+    # Remove the detections completely outside the image
+    inside = (x <= img_width) & (y <= img_height) & (x_end >= 0) & (y_end >= 0)
+
+    # Clip the corners to the image and recompute the width and height from them
+    x_start = np.clip(x, 0, img_width)
+    y_start = np.clip(y, 0, img_height)
+    x_end = np.clip(x_end, 0, img_width)
+    y_end = np.clip(y_end, 0, img_height)
+
+    clipped_boxes = np.stack((x_start, y_start, x_end - x_start, y_end - y_start), axis=1)
+    return clipped_boxes[inside]
+
+
+def rescale_detections(detections: List[Tuple[int, int, int, int]], factor: float) \
+        -> List[Tuple[int, int, int, int]]:
+    """ Rescales the detections found in a resized image to the coordinates of an image with a different size.
+
+    Args:
+        detections: List made out of tuples representing the coordinates of a detection in the format:
+                    (x, y, width, height).
+        factor: The factor by which the coordinates are multiplied.
+
+    Returns: The list of rescaled detections in the same format as the input.
+    """
+    if factor == 1:
+        return detections
+
+    return [(int(round(x * factor)), int(round(y * factor)), int(round(w * factor)), int(round(h * factor)))
+            for x, y, w, h in detections]
+
+
+def non_max_suppression(boxes: np.ndarray, scores: np.ndarray, iou_thresh: float) -> np.ndarray:
+    """ Removes the boxes that overlap a box with a higher score by more than the intersection over union threshold.
+
+    Args:
+        boxes: Array with shape (N, 4) where each row is a bounding box in the format (xmin, ymin, xmax, ymax).
+        scores: Array with shape (N,) with the score of each box.
+        iou_thresh: The intersection over union above which the box with the lower score is removed.
+
+    Returns: Array with the indexes of the boxes that were kept, sorted by decreasing score.
+    """
+    areas = np.prod(np.maximum(boxes[:, 2:4] - boxes[:, 0:2], 0), axis=1)
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while order.size > 0:
+        best, order = order[0], order[1:]
+        keep.append(best)
+        top_left = np.maximum(boxes[best, 0:2], boxes[order, 0:2])
+        bottom_right = np.minimum(boxes[best, 2:4], boxes[order, 2:4])
+        intersections = np.prod(np.maximum(bottom_right - top_left, 0), axis=1)
+        unions = areas[best] + areas[order] - intersections
+        iou = np.divide(intersections, unions, out=np.zeros_like(intersections), where=unions > 0)
+        order = order[iou <= iou_thresh]
+    return np.array(keep, dtype=np.int64)
+
+
+def ssd_detections_to_boxes(detections: np.ndarray, image_shape, confidence_thresh: float,
+                            enlarge_percentage: float, nms_thresh: Union[float, None] = None) -> np.ndarray:
+    """ Converts the raw output of a SSD detector into bounding boxes in image coordinates. The detections are filtered
+    by confidence, optionally filtered with non maximum suppression, enlarged and clipped to the image.
+
+    Args:
+        detections: Array with shape (N, 7) where each row has the format
+                    (image_id, label, confidence, xmin, ymin, xmax, ymax) with coordinates relative to the image size.
+        image_shape: Tuple with the shape of the image in the format (h, w, c).
+        confidence_thresh: Detections with a confidence lower or equal to this value are removed.
+        enlarge_percentage: The percentage by which to enlarge the bounding boxes.
+        nms_thresh: The intersection over union threshold for non maximum suppression. If None it is not applied.
+
+    Returns: Array with shape (M, 4) with the integer coordinates of each detection in the format
+             (x, y, width, height).
+    """
+    h, w = image_shape[:2]
+
+    # Filter out detections with lower confidence
+    detections = detections[detections[:, 2] > confidence_thresh]
+    boxes = detections[:, 3:7] * np.array([w, h, w, h])
+    if nms_thresh:
+        boxes = boxes[non_max_suppression(boxes, detections[:, 2], nms_thresh)]
+
+    boxes = make_bboxes_larger(boxes, enlarge_percentage)
+    # Truncate like int() does to keep the same coordinates as a box built from python floats
+    boxes = np.stack((boxes[:, 0], boxes[:, 1], boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]), axis=1)
+    boxes = np.trunc(boxes).astype(np.int64)
+
+    # Making sure all the face detections lie within the image
+    return clip_boxes(boxes, image_shape)
+
+
+def scores_and_boxes_to_ssd_detections(scores: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    """ Converts the output of a detector that returns the class scores and the boxes of its anchors separately, such as
+    the Ultra-Light-Fast face detector, into the format of the raw output of a SSD detector.
+
+    Args:
+        scores: Array with shape (N, 2) with the scores of the background and face classes of each anchor.
+        boxes: Array with shape (N, 4) where each row has the format (xmin, ymin, xmax, ymax) with coordinates relative
+               to the image size.
+
+    Returns: Array with shape (N, 7) where each row has the format (image_id, label, confidence, xmin, ymin, xmax, ymax).
+    """
+    detections = np.zeros((len(scores), 7), dtype=np.float32)
+    detections[:, 1] = 1
+    detections[:, 2] = scores[:, 1]
+    detections[:, 3:7] = boxes
+    return detections
+
+
+def get_rois_bounds(rois: List[Tuple[int, int, int, int]], image_shape, margin_percentage: float) \
+        -> Tuple[int, int, int, int]:
+    """ Gets the smallest box of the image that contains all the regions of interest, each enlarged by a margin.
+
+    Args:
+        rois: List made out of tuples representing the coordinates of a region of interest in the format:
+              (x, y, width, height).
+        image_shape: Tuple with the shape of the image in the format (h, w, c).
+        margin_percentage: The percentage of the size of each region of interest added around it.
+
+    Returns: The integer coordinates of the box in the format (xmin, ymin, xmax, ymax), clipped to the image.
+    """
+    img_height, img_width = image_shape[:2]
+    boxes = np.array(rois, dtype=np.float64).reshape(-1, 4)
+    boxes = make_bboxes_larger(np.hstack((boxes[:, 0:2], boxes[:, 0:2] + boxes[:, 2:4])), margin_percentage)
+    xmin, ymin = np.floor(boxes[:, 0:2].min(axis=0)).astype(np.int64)
+    xmax, ymax = np.ceil(boxes[:, 2:4].max(axis=0)).astype(np.int64)
+    return (int(np.clip(xmin, 0, img_width)), int(np.clip(ymin, 0, img_height)),
+            int(np.clip(xmax, 0, img_width)), int(np.clip(ymax, 0, img_height)))
+
+
+def eye_keypoints_to_boxes(eye_keypoints: np.ndarray, width_ratio: float, height_ratio: float) -> np.ndarray:
+    """ Converts the centers of the eyes given by a landmark model with a few keypoints into eye bounding boxes. The
+    size of the boxes is proportional to the distance between the two eyes of each face.
+
+    Args:
+        eye_keypoints: Array with shape (N, 2, 2) with the (x, y) centers of the two eyes of each face, the eye on the
+                       left of the image first.
+        width_ratio: The width of an eye box divided by the distance between the eyes.
+        height_ratio: The height of an eye box divided by the distance between the eyes.
 
-    clipped_detections: List[Tuple] = []
-    for i in range(len(detections)):
-        x, y, w, h = detections[i]
-        x_end = x + w
-        y_end = y + h
-        img_height, img_width, _ = image_shape
+    Returns: Array with shape (2 * N, 4) with the integer coordinates of each eye in the format (x, y, width, height),
+             with the two eyes of each face one after the other.
+    """
+    eye_keypoints = np.asarray(eye_keypoints, dtype=np.float64).reshape(-1, 2, 2)
+    distances = np.linalg.norm(eye_keypoints[:, 1] - eye_keypoints[:, 0], axis=1)
+    sizes = np.repeat(np.stack((distances * width_ratio, distances * height_ratio), axis=1), 2, axis=0)
+    centers = eye_keypoints.reshape(-1, 2)
+    return np.round(np.hstack((centers - sizes / 2, sizes))).astype(np.int64)
+
+
+def estimate_eye_keypoints(faces: List[Tuple[int, int, int, int]], eye_x_ratios: Tuple[float, float],
+                           eye_y_ratio: float) -> np.ndarray:
+    """ Estimates the centers of the eyes of each face from the proportions of the face box, without looking at the
+    image. It is much faster than detecting the landmarks but misplaces the eyes of faces that are tilted or turned.
+
+    Args:
+        faces: List made out of tuples representing the coordinates of each face in the format: (x, y, width, height).
+        eye_x_ratios: The horizontal position of the centers of the left and right eyes relative to the face box width.
+        eye_y_ratio: The vertical position of the centers of the eyes relative to the face box height.
 
-        # The detection is completely outside or the image
-        if x > img_width or y > img_height or x_end < 0 or y_end < 0:
+    Returns: Array with shape (N, 2, 2) with the (x, y) centers of the two eyes of each face, the eye on the left of the
+             image first, as expected by eye_keypoints_to_boxes.
+    """
+    faces = np.array(faces, dtype=np.float64).reshape(-1, 4)
+    eye_keypoints = np.empty((len(faces), 2, 2), dtype=np.float64)
+    for eye_index, eye_x_ratio in enumerate(eye_x_ratios):
+        eye_keypoints[:, eye_index, 0] = faces[:, 0] + faces[:, 2] * eye_x_ratio
+        eye_keypoints[:, eye_index, 1] = faces[:, 1] + faces[:, 3] * eye_y_ratio
+    return eye_keypoints
+
+
+def get_largest_boxes_indices(boxes: List[Tuple[int, int, int, int]], max_boxes: int) -> List[int]:
+    """ Gets the indices of the largest boxes by area.
+
+    Args:
+        boxes: List made out of tuples representing the coordinates of each box in the format: (x, y, width, height).
+        max_boxes: The maximum number of boxes to keep.
+
+    Returns: The indices of the largest max_boxes boxes, in the order in which they are in the list.
+    """
+    if len(boxes) <= max_boxes:
+        return list(range(len(boxes)))
+    areas = [box[2] * box[3] for box in boxes]
+    return sorted(sorted(range(len(boxes)), key=lambda index: areas[index], reverse=True)[:max_boxes])
+
+
+def get_tiles(image_shape, tile_size: int, overlap: float) -> List[Tuple[int, int, int, int]]:
+    """ Splits an image into a grid of square tiles that overlap, evenly spread so that they cover the whole image.
+
+    Args:
+        image_shape: Tuple with the shape of the image in the format (h, w, c).
+        tile_size: The side of the tiles in pixels. Sides of the image smaller than it are not split.
+        overlap: The minimum fraction of the side of a tile shared with the next tile.
+
+    Returns: List with the coordinates of each tile in the format (x, y, width, height).
+    """
+    starts = []
+    for length in image_shape[1::-1]:
+        if length <= tile_size:
+            starts.append([(0, length)])
             continue
+        stride = tile_size * (1 - overlap)
+        number_of_tiles = int(np.ceil((length - tile_size) / stride)) + 1
+        starts.append([(int(start), tile_size) for start in np.round(np.linspace(0, length - tile_size,
+                                                                                   number_of_tiles))])
+    return [(x, y, width, height) for y, height in starts[1] for x, width in starts[0]]
+
+
+def tile_ssd_detections_to_image(detections: np.ndarray, tile: Tuple[int, int, int, int], image_shape,
+                                 border_margin: float) -> np.ndarray:
+    """ Converts the raw output of a SSD detector on a tile of an image into detections relative to the whole image.
+    The detections touching a side of the tile that is inside the image are removed, since they are cut by the tile and
+    are found whole by the overlapping tile or by the pass on the whole image.
+
+    Args:
+        detections: Array with shape (N, 7) where each row has the format
+                    (image_id, label, confidence, xmin, ymin, xmax, ymax) with coordinates relative to the tile size.
+        tile: The coordinates of the tile in the format (x, y, width, height).
+        image_shape: Tuple with the shape of the image in the format (h, w, c).
+        border_margin: The distance to a side of the tile, relative to the tile size, under which a detection touches
+                       it.
+
+    Returns: Array with shape (M, 7) with the detections kept and their coordinates relative to the image size.
+    """
+    img_height, img_width = image_shape[:2]
+    x, y, width, height = tile
+    cut = np.zeros(len(detections), dtype=bool)
+    if x > 0:
+        cut |= detections[:, 3] < border_margin
+    if y > 0:
+        cut |= detections[:, 4] < border_margin
+    if x + width < img_width:
+        cut |= detections[:, 5] > 1 - border_margin
+    if y + height < img_height:
+        cut |= detections[:, 6] > 1 - border_margin
 
-        # If one of the sides of the detection is outside the image it clips it to its boundaries.
-        clipped_detection = list(detections[i])
-        if x < 0:
-            clipped_detection[0] = 0
-            # When clipping x the width of the detection should account for the change
-            # The width should be reduced by the distance between x and 0 in order for the x_end to be in the same
-            # place as before. Works similarly for the height.
-            clipped_detection[2] += int(x)
-            w = clipped_detection[2]
-        if y < 0:
-            clipped_detection[1] = 0
-            # When clipping y the height of the detection should account for the change
-            clipped_detection[3] += int(y)
-            h = clipped_detection[3]
-
-        if x + w > img_width:
-            clipped_detection[2] = int(img_width - x)
-        if y + h > img_height:
-            clipped_detection[3] = int(img_height - y)
-
-        clipped_detections.append(tuple(clipped_detection))
-
-    return clipped_detections
+    detections = detections[~cut].copy()
+    detections[:, [3, 5]] = (x + detections[:, [3, 5]] * width) / img_width
+    detections[:, [4, 6]] = (y + detections[:, [4, 6]] * height) / img_height
+    return detections
@@ -20,15 +20,60 @@ class BaseDetector(ABC):
     def detect(self, image: np.ndarray, roi: Union[List[Tuple[int, int, int, int]], None] = None) \
             -> List[Tuple[int, int, int, int]]: ...
 
+    def detect_many(self, images: List[np.ndarray], rois: Union[List[List[Tuple[int, int, int, int]]], None] = None) \
+            -> List[List[Tuple[int, int, int, int]]]:
+        """ Performs detection on several images. Detectors that can process a batch of images at once override it.
+
+        Args:
+            images: List of images to use for detection.
+            rois: List with the regions of interest of each image. If None the detection is performed in the whole
+                  images.
+
+        Returns:
+            List with the list of coordinates with detections of each image.
+        """
+        if rois is None:
+            return [self.detect(image) for image in images]
+        return [self.detect(image, roi) for image, roi in zip(images, rois)]
+
+
+class BaseFaceEyesDetector(ABC):
+    """ Base class of the detectors that find the faces and their eyes with a single model, so the eyes detection stage
+    is skipped."""
+
+    @abstractmethod
+    def __init__(self, config: Dict):
+        self.config = config
+
+    @abstractmethod
+    def load(self): ...
+
+    @abstractmethod
+    def detect_faces_and_eyes(self, image: np.ndarray) \
+            -> Tuple[List[Tuple[int, int, int, int]], List[Tuple[int, int, int, int]]]: ...
+
+    def detect_faces_and_eyes_many(self, images: List[np.ndarray]) \
+            -> List[Tuple[List[Tuple[int, int, int, int]], List[Tuple[int, int, int, int]]]]:
+        """ Performs detection on several images. Detectors that can process a batch of images at once override it.
+
+        Args:
+            images: List of images to use for detection.
+
+        Returns:
+            List with a tuple with the list of faces and the list of eyes of each image.
+        """
+        return [self.detect_faces_and_eyes(image) for image in images]
+
 
 # Auxiliary functions
-def get_detector(name: str) -> abc.ABCMeta:
-    """ Load the detector dynamically in runtime.
+def load_class(name: str) -> type:
+    """ Load a class dynamically in runtime, such as the detectors or the backends of the caches and queues set in the
+    config file.
 
     Args:
-        name: String with the name of the detector in format "module.class".
+        name: String with the name of the class in format "module.class".
 
-    Returns: A metaclass to be used to instantiate a detector.
+    Returns: The class.
     """
     if os.getcwd() not in sys.path:
         sys.path.insert(0, os.getcwd())
@@ -39,19 +84,35 @@ def get_detector(name: str) -> abc.ABCMeta:
     for comp in groups[1:]:
         mod = getattr(mod, comp)
 
-    if isinstance(mod, abc.ABCMeta):
+    if isinstance(mod, type):
         return mod
 
+    raise Exception("The name '" + name + "' is not a valid class. Check your config file.")
+
+
+def get_detector(name: str) -> abc.ABCMeta:
+    """ Load the detector dynamically in runtime.
+
+    Args:
+        name: String with the name of the detector in format "module.class".
+
+    Returns: A metaclass to be used to instantiate a detector.
+    """
+    detector_class = load_class(name)
+    if isinstance(detector_class, abc.ABCMeta):
+        return detector_class
+
     raise Exception("The name '" + name + "' is not a valid detector class. Check your config file.")
 
 
-def get_field(config: Dict, field: str, eval_field: bool = False) -> Any:
-    """ Get a field from a dictionary. If the field does not exist raises an Exception.
+def get_field(config: Dict, field: str, eval_field: bool = False, default: Any = None) -> Any:
+    """ Get a field from a dictionary. If the field does not exist and no default is given raises an Exception.
 
     Args:
         config: Dictionary to get the field value from.
         field: A string with the name of the key in the dictionary config.
         eval_field: Whether the field requires a literal evaluation.
+        default: Value returned when the field does not exist. If None the field is required.
 
     Returns:
         The value in the dict corresponding to the key named with field variable.
@@ -61,4 +122,24 @@ def get_field(config: Dict, field: str, eval_field: bool = False) -> Any:
         if eval_field:
             return literal_eval(value)
         return value
+    if default is not None:
+        return default
     raise Exception("Field '" + field + "' not found in the config file. Check your config file.")
+
+
+def get_option(options: Dict[str, Any], name: str, field: str) -> Any:
+    """ Get the value of an option chosen by name in the config file. If the name is not a valid option raises an
+    Exception.
+
+    Args:
+        options: Dictionary with the name and value of each valid option.
+        name: The name of the chosen option.
+        field: A string with the name of the field of the config file, used in the error message.
+
+    Returns:
+        The value of the chosen option.
+    """
+    if name in options:
+        return options[name]
+    raise Exception("'" + str(name) + "' is not a valid " + field + ", use one of " + str(list(options)) +
+                    ". Check your config file.")
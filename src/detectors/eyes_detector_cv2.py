@@ -1,24 +1,89 @@
 import os
-from typing import List, Tuple, Union
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple, Union
 
 import cv2 as cv
 import numpy as np
 
+from src.detection_helpers import get_rois_bounds, get_largest_boxes_indices
 from src.detectors.base_detector import BaseDetector, get_field
+from src.model_store import ModelLoad, load_file_storage_model
+
+# Margin added around the faces when cropping the image for the landmark fit, as a percentage of the size of each face.
+# The LBF features are sampled around the landmarks, slightly outside the face box, so they must stay in the crop.
+FIT_MARGIN_PERCENTAGE = 0.25
 
 
 class EyesDetectorCV2(BaseDetector):
     """Class that implements eye detection using the LBF landmark face detector from OpenCV"""
 
+    # Threads that fit the landmarks of chunks of faces, shared by all the instances that use the same model. Each thread
+    # has its own landmark detector, since they can not be shared between threads. Their landmark detectors are loaded
+    # with the executor and taken by each thread on its first fit, so they are loaded before forking worker processes.
+    _fit_executors: Dict[str, ThreadPoolExecutor] = {}
+    _fit_executors_lock = threading.Lock()
+    _fit_landmark_detectors: Dict[str, queue.Queue] = {}
+    _thread_landmark_detectors = threading.local()
+
     def __init__(self, config):
         self.landmark_detector = None
+        self.fit_executor = None
+        self.model_loads: List[ModelLoad] = []
         self.model_path = os.getcwd() + get_field(config, "model_path")
+        self.binary_cache_dir = get_field(config, "binary_cache_dir", default="")
+        self.max_faces = get_field(config, "max_faces", default=0)
+        self.min_face_size = get_field(config, "min_face_size", default=0)
+        self.fit_workers = get_field(config, "fit_workers", default=0)
+        self.min_faces_per_chunk = get_field(config, "min_faces_per_chunk", default=0)
         self.load()
 
     def load(self):
-        """ Loads the model for detection."""
-        self.landmark_detector = cv.face.createFacemarkLBF()
-        self.landmark_detector.loadModel(self.model_path)
+        """ Loads the model for detection. The YAML model is slow to parse, so when binary_cache_dir is set it is
+        loaded from a copy with the matrices in binary, created the first time the model is loaded."""
+        self.landmark_detector = load_file_storage_model("lbf", self.model_path, self.load_landmark_detector,
+                                                         self.model_loads, self.binary_cache_dir)
+        if self.fit_workers > 0:
+            with EyesDetectorCV2._fit_executors_lock:
+                if self.model_path not in EyesDetectorCV2._fit_executors:
+                    landmark_detectors: queue.Queue = queue.Queue()
+                    for _ in range(self.fit_workers):
+                        landmark_detectors.put(load_file_storage_model("lbf", self.model_path,
+                                                                       self.load_landmark_detector, self.model_loads,
+                                                                       self.binary_cache_dir))
+                    EyesDetectorCV2._fit_landmark_detectors[self.model_path] = landmark_detectors
+                    EyesDetectorCV2._fit_executors[self.model_path] = ThreadPoolExecutor(
+                        max_workers=self.fit_workers, thread_name_prefix="landmark-fit")
+                self.fit_executor = EyesDetectorCV2._fit_executors[self.model_path]
+
+    def get_thread_landmark_detector(self):
+        """ Gets the landmark detector of the current thread of the fit executor, taking one of the landmark detectors
+        loaded with the executor on the first call.
+
+        Returns: The landmark detector owned by the current thread.
+        """
+        landmark_detectors = getattr(EyesDetectorCV2._thread_landmark_detectors, "landmark_detectors", None)
+        if landmark_detectors is None:
+            landmark_detectors = EyesDetectorCV2._thread_landmark_detectors.landmark_detectors = {}
+        if self.model_path not in landmark_detectors:
+            # The executor has as many threads as landmark detectors were loaded, so there is always one left
+            landmark_detectors[self.model_path] = \
+                EyesDetectorCV2._fit_landmark_detectors[self.model_path].get_nowait()
+        return landmark_detectors[self.model_path]
+
+    @staticmethod
+    def load_landmark_detector(model_path: str):
+        """ Creates the LBF landmark detector from a model file.
+
+        Args:
+            model_path: The path of the model file.
+
+        Returns: The landmark detector.
+        """
+        landmark_detector = cv.face.createFacemarkLBF()
+        landmark_detector.loadModel(model_path)
+        return landmark_detector
 
     def detect(self, image: np.ndarray, roi: Union[List[Tuple[int, int, int, int]], None] = None) \
             -> List[Tuple[int, int, int, int]]:
@@ -32,13 +97,69 @@ class EyesDetectorCV2(BaseDetector):
         Returns:
             List of coordinates with detections.
         """
-        gray_image = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
-        _, landmarks = self.landmark_detector.fit(gray_image, np.array(roi))
+        if not roi:
+            return []
+
+        # Faces too small to give usable eyes are skipped and only the largest max_faces are fitted
+        indices = [index for index, (_, _, width, height) in enumerate(roi)
+                   if min(width, height) >= self.min_face_size]
+        if self.max_faces > 0 and len(indices) > self.max_faces:
+            indices = [indices[index] for index in get_largest_boxes_indices([roi[index] for index in indices],
+                                                                              self.max_faces)]
+        if not indices:
+            return []
+
+        # The faces are split in chunks of nearby faces, so each chunk crops a small part of the image, and the chunks
+        # are fitted concurrently by the threads of the fit executor and the current thread. Without a minimum number
+        # of faces per chunk all the faces are fitted at once
+        number_of_chunks = 1
+        if self.fit_executor is not None and self.min_faces_per_chunk > 0:
+            number_of_chunks = max(min(self.fit_workers + 1, len(indices) // self.min_faces_per_chunk), 1)
+        indices.sort(key=lambda index: (roi[index][1], roi[index][0]))
+        chunks = [[roi[index] for index in chunk] for chunk in np.array_split(indices, number_of_chunks)]
+        futures = [self.fit_executor.submit(self.fit_eyes_in_thread, image, chunk) for chunk in chunks[1:]]
+        eyes_per_chunk = [self.fit_eyes(self.landmark_detector, image, chunks[0])] + \
+                         [future.result() for future in futures]
+
+        # The eyes are returned in the order of the faces, the two eyes of each face one after the other
+        eyes_per_face = dict(zip(indices, [eyes for chunk_eyes in eyes_per_chunk for eyes in chunk_eyes]))
+        return [eye for index in sorted(eyes_per_face) for eye in eyes_per_face[index]]
+
+    def fit_eyes_in_thread(self, image: np.ndarray, faces: List[Tuple[int, int, int, int]]) \
+            -> List[List[Tuple[int, int, int, int]]]:
+        """ Fits the landmarks of some faces with the landmark detector of the current thread of the fit executor.
+
+        Args:
+            image: Image to use for detection.
+            faces: List of coordinates of the faces.
+
+        Returns:
+            List with the coordinates of the two eyes of each face.
+        """
+        return self.fit_eyes(self.get_thread_landmark_detector(), image, faces)
+
+    @staticmethod
+    def fit_eyes(landmark_detector, image: np.ndarray, faces: List[Tuple[int, int, int, int]]) \
+            -> List[List[Tuple[int, int, int, int]]]:
+        """ Fits the landmarks of some faces and takes the boxes of the eyes.
+
+        Args:
+            landmark_detector: The LBF landmark detector used for the fit.
+            image: Image to use for detection.
+            faces: List of coordinates of the faces.
+
+        Returns:
+            List with the coordinates of the two eyes of each face.
+        """
+        # Only the part of the image around the faces is converted to grayscale and fitted
+        xmin, ymin, xmax, ymax = get_rois_bounds(faces, image.shape, FIT_MARGIN_PERCENTAGE)
+        gray_image = cv.cvtColor(image[ymin:ymax, xmin:xmax], cv.COLOR_BGR2GRAY)
+        faces = np.array(faces) - np.array([xmin, ymin, 0, 0])
+        _, landmarks = landmark_detector.fit(gray_image, faces)
         eyes = []
         for landmark in landmarks:
-            left_eye = cv.boundingRect(landmark[0][36:42])
-            right_eye = cv.boundingRect(landmark[0][42:48])
+            left_eye = cv.boundingRect(landmark[0][36:42] + np.array([xmin, ymin], dtype=np.float32))
+            right_eye = cv.boundingRect(landmark[0][42:48] + np.array([xmin, ymin], dtype=np.float32))
 
-            eyes.append(tuple(left_eye))
-            eyes.append(tuple(right_eye))
+            eyes.append([tuple(left_eye), tuple(right_eye)])
         return eyes
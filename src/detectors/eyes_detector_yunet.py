@@ -0,0 +1,95 @@
+import os
+from typing import List, Tuple, Union
+
+import cv2 as cv
+import numpy as np
+
+from src.detection_helpers import get_rois_bounds, eye_keypoints_to_boxes
+from src.detectors.base_detector import BaseDetector, get_field
+from src.model_store import ModelLoad, load_model
+
+# Margin added around each face when cropping it for the keypoint detection, as a percentage of the size of the face
+ROI_MARGIN_PERCENTAGE = 0.1
+
+
+class EyesDetectorYuNet(BaseDetector):
+    """Class that implements eye detection using the eye keypoints of the YuNet face detector from OpenCV. The network
+    only runs on a small copy of each face, so it is much cheaper than fitting the 68 LBF landmarks"""
+
+    def __init__(self, config):
+        self.keypoint_detector = None
+        self.model_loads: List[ModelLoad] = []
+        self.model_path = os.getcwd() + get_field(config, "model_path")
+        self.confidence_thresh = get_field(config, "confidence_thresh")
+        self.nms_thresh = get_field(config, "nms_thresh", default=0.3)
+        self.roi_size = get_field(config, "roi_size", default=160)
+        self.eye_width_ratio = get_field(config, "eye_width_ratio", default=0.45)
+        self.eye_height_ratio = get_field(config, "eye_height_ratio", default=0.25)
+        self.load()
+
+    def load(self):
+        """ Loads the model for detection. """
+        self.keypoint_detector = load_model("yunet", self.model_path, self.create_keypoint_detector, self.model_loads)
+
+    def create_keypoint_detector(self, model_path: str) -> cv.FaceDetectorYN:
+        """ Creates the YuNet face detector, which returns five keypoints of each face, the first two being the eyes.
+
+        Args:
+            model_path: The path of the ONNX model.
+
+        Returns: The YuNet face detector.
+        """
+        return cv.FaceDetectorYN.create(model_path, "", (self.roi_size, self.roi_size), self.confidence_thresh,
+                                        self.nms_thresh)
+
+    def detect(self, image: np.ndarray, roi: Union[List[Tuple[int, int, int, int]], None] = None) \
+            -> List[Tuple[int, int, int, int]]:
+        """ Performs detection on the image taking into account the regions of interest (roi).
+        If the roi is None then the detection is performed in the whole image.
+
+        Args:
+            image: Image to use for detection.
+            roi: List of coordinates of regions of interest where to look for the detections.
+
+        Returns:
+            List of coordinates with detections.
+        """
+        if roi is None:
+            roi = [(0, 0, image.shape[1], image.shape[0])]
+
+        eye_keypoints = [self.detect_eye_keypoints(image, face) for face in roi]
+        eye_keypoints = [keypoints for keypoints in eye_keypoints if keypoints is not None]
+        if not eye_keypoints:
+            return []
+
+        eyes = eye_keypoints_to_boxes(np.array(eye_keypoints), self.eye_width_ratio, self.eye_height_ratio)
+        return [tuple(eye) for eye in eyes.tolist()]
+
+    def detect_eye_keypoints(self, image: np.ndarray, face: Tuple[int, int, int, int]) -> Union[np.ndarray, None]:
+        """ Detects the centers of the eyes of a face on a copy of the face resized so its largest side is roi_size.
+
+        Args:
+            image: Image to use for detection.
+            face: The coordinates of the face in the format (x, y, width, height).
+
+        Returns: Array with shape (2, 2) with the (x, y) centers of the eyes in image coordinates, the eye on the left
+                 of the image first, or None if no face is found in the region.
+        """
+        xmin, ymin, xmax, ymax = get_rois_bounds([face], image.shape, ROI_MARGIN_PERCENTAGE)
+        if xmax <= xmin or ymax <= ymin:
+            return None
+
+        scale = self.roi_size / max(xmax - xmin, ymax - ymin)
+        size = (max(int(round((xmax - xmin) * scale)), 1), max(int(round((ymax - ymin) * scale)), 1))
+        interpolation = cv.INTER_AREA if scale < 1 else cv.INTER_LINEAR
+        face_image = cv.resize(image[ymin:ymax, xmin:xmax], size, interpolation=interpolation)
+
+        self.keypoint_detector.setInputSize(size)
+        _, detections = self.keypoint_detector.detect(face_image)
+        if detections is None or len(detections) == 0:
+            return None
+
+        # Each row has the format (x, y, w, h, right eye, left eye, nose tip, mouth corners, score)
+        best_detection = detections[np.argmax(detections[:, 14])]
+        scale_x, scale_y = size[0] / (xmax - xmin), size[1] / (ymax - ymin)
+        return best_detection[4:8].reshape(2, 2) / np.array([scale_x, scale_y]) + np.array([xmin, ymin])
@@ -1,17 +1,44 @@
 import os
+import threading
 import cv2 as cv
 import numpy as np
-from typing import Tuple, List, Union
+from typing import Tuple, List, Union, Dict
 
-from src.detection_helpers import make_bbox_larger, clip_detections
-from src.detectors.base_detector import BaseDetector, get_field
+from src.detection_helpers import ssd_detections_to_boxes, get_tiles, tile_ssd_detections_to_image
+from src.detectors.base_detector import BaseDetector, get_field, get_option
+from src.dynamic_batcher import DynamicBatcher
+from src.model_store import ModelLoad, load_model
+
+
+# Names of the OpenCV DNN backends and targets that can be set in the config file
+DNN_BACKENDS = {"default": cv.dnn.DNN_BACKEND_DEFAULT, "opencv": cv.dnn.DNN_BACKEND_OPENCV,
+                "openvino": cv.dnn.DNN_BACKEND_INFERENCE_ENGINE, "cuda": cv.dnn.DNN_BACKEND_CUDA,
+                "vulkan": cv.dnn.DNN_BACKEND_VKCOM}
+DNN_TARGETS = {"cpu": cv.dnn.DNN_TARGET_CPU, "opencl": cv.dnn.DNN_TARGET_OPENCL,
+               "opencl_fp16": cv.dnn.DNN_TARGET_OPENCL_FP16, "cuda": cv.dnn.DNN_TARGET_CUDA,
+               "cuda_fp16": cv.dnn.DNN_TARGET_CUDA_FP16, "myriad": cv.dnn.DNN_TARGET_MYRIAD,
+               "vulkan": cv.dnn.DNN_TARGET_VULKAN}
+
+# Threshold of the non maximum suppression that merges the detections of the tiles when none is set in the config file,
+# the overlapping tiles and the pass on the whole image find the same faces several times
+TILE_NMS_THRESH = 0.3
+
+# Distance to the inner sides of a tile, relative to the tile size, under which a detection is considered cut by them
+TILE_BORDER_MARGIN = 0.01
 
 
 class FaceDetectorCV2(BaseDetector):
     """Class that implements face detection using a caffe model from OpenCV"""
 
+    # Batchers shared by all the instances that use the same model, so that images from concurrent requests can be
+    # grouped in the same forward pass.
+    _batchers: Dict[Tuple[str, str], DynamicBatcher] = {}
+    _batchers_lock = threading.Lock()
+
     def __init__(self, config):
         self.face_detector = None
+        self.batcher = None
+        self.model_loads: List[ModelLoad] = []
         self.model_path_protobuf = os.getcwd() + get_field(config, "model_path_protobuf")
         self.model_path_caffe = os.getcwd() + get_field(config, "model_path_caffe")
         self.confidence_thresh = get_field(config, "confidence_thresh")
@@ -19,11 +46,65 @@ class FaceDetectorCV2(BaseDetector):
         self.input_size = get_field(config, "input_size", eval_field=True)
         self.mean_normalization = get_field(config, "mean_normalization", eval_field=True)
         self.scale_factor = get_field(config, "scale_factor")
+        self.nms_thresh = get_field(config, "nms_thresh", default=0.0)
+        self.batch_size = get_field(config, "batch_size")
+        self.max_batch_wait_ms = get_field(config, "max_batch_wait_ms")
+        self.backend = get_option(DNN_BACKENDS, get_field(config, "backend", default="default"), "backend")
+        self.target = get_option(DNN_TARGETS, get_field(config, "target", default="cpu"), "target")
+        self.num_threads = get_field(config, "num_threads", default=0)
+        self.tile_size = get_field(config, "tile_size", default=0)
+        self.tile_overlap = get_field(config, "tile_overlap", default=0.25)
         self.load()
 
     def load(self):
-        """ Loads the model for detection."""
-        self.face_detector = cv.dnn.readNetFromCaffe(self.model_path_protobuf, self.model_path_caffe)
+        """ Loads the model for detection. When batching is enabled the model is only loaded by the first instance,
+        which owns the batcher shared with the other instances."""
+        if self.batch_size <= 1:
+            self.face_detector = self.load_network()
+            return
+
+        key = (self.model_path_protobuf, self.model_path_caffe)
+        with FaceDetectorCV2._batchers_lock:
+            if key not in FaceDetectorCV2._batchers:
+                self.face_detector = self.load_network()
+                FaceDetectorCV2._batchers[key] = DynamicBatcher(self.forward, self.batch_size, self.max_batch_wait_ms)
+            self.batcher = FaceDetectorCV2._batchers[key]
+
+    def load_network(self) -> cv.dnn.Net:
+        """ Reads the caffe model measuring the time and memory it takes and sets the backend and target that run it.
+        The number of threads of OpenCV is set for the whole process, so that several workers in the same host can be
+        pinned to a few threads each instead of all of them using every core.
+
+        Returns: The network of the model.
+        """
+        if self.num_threads > 0:
+            cv.setNumThreads(self.num_threads)
+
+        face_detector = load_model("ssd_face", self.model_path_caffe,
+                                   lambda model_path: cv.dnn.readNetFromCaffe(self.model_path_protobuf, model_path),
+                                   self.model_loads)
+        face_detector.setPreferableBackend(self.backend)
+        face_detector.setPreferableTarget(self.target)
+        return face_detector
+
+    def forward(self, images: List[np.ndarray]) -> List[np.ndarray]:
+        """ Runs a single forward pass of the model on a batch of images already resized to the input size.
+
+        Args:
+            images: List of images resized to the input size of the model.
+
+        Returns:
+            List with the raw detections of each image as an array with shape (N, 7), where each row has the format
+            (image_id, label, confidence, xmin, ymin, xmax, ymax) with coordinates relative to the image size.
+        """
+        blob = cv.dnn.blobFromImages(images, self.scale_factor, self.input_size, self.mean_normalization)
+
+        # Feed the blob as input to the DNN Face Detector model
+        self.face_detector.setInput(blob)
+        detections = self.face_detector.forward()[0, 0]
+
+        # The detections of the whole batch come together, the first column tells to which image they belong
+        return [detections[detections[:, 0] == i] for i in range(len(images))]
 
     def detect(self, image: np.ndarray, roi: Union[List[Tuple[int, int, int, int]], None] = None) \
             -> List[Tuple[int, int, int, int]]:
@@ -37,28 +118,93 @@ class FaceDetectorCV2(BaseDetector):
         Returns:
             List of coordinates with detections.
         """
-        h, w = image.shape[:2]
-        # Preprocess the image by resizing it and converting it to a blob
+        if self.get_tiles(image.shape):
+            return self.detect_many([image])[0]
+
+        # Preprocess the image by resizing it to the input size of the model
         resized_image = cv.resize(image, self.input_size)
-        blob = cv.dnn.blobFromImage(resized_image, self.scale_factor, self.input_size,
-                                    self.mean_normalization)
 
-        # Feed the blob as input to the DNN Face Detector model
-        self.face_detector.setInput(blob)
-        detections = self.face_detector.forward()
-        faces = []
-        for i in range(0, detections.shape[2]):
-            confidence = detections[0, 0, i, 2]
+        if self.batcher is not None:
+            detections = self.batcher.submit(resized_image)
+        else:
+            detections = self.forward([resized_image])[0]
+
+        return self.detections_to_faces(detections, image.shape)
+
+    def detect_many(self, images: List[np.ndarray], rois: Union[List[List[Tuple[int, int, int, int]]], None] = None) \
+            -> List[List[Tuple[int, int, int, int]]]:
+        """ Performs detection on several images, running them through the model in batches of batch_size images. The
+        regions of interest are ignored, the detection is always performed in the whole images. When tiling is enabled
+        the tiles of the large images go through the model in the same batches as the whole images, and their
+        detections are merged with the ones of the whole image.
+
+        Args:
+            images: List of images to use for detection.
+            rois: List with the regions of interest of each image.
+
+        Returns:
+            List with the list of coordinates with detections of each image.
+        """
+        tiles = [self.get_tiles(image.shape) for image in images]
+        resized_images = []
+        for image, image_tiles in zip(images, tiles):
+            resized_images.append(cv.resize(image, self.input_size))
+            resized_images += [cv.resize(image[y:y + height, x:x + width], self.input_size)
+                               for x, y, width, height in image_tiles]
 
-            # Filter out detections with lower confidence
-            if confidence > self.confidence_thresh:
-                # Get the bounding box for the face
-                box = detections[0, 0, i, 3:7] * np.array([w, h, w, h])
-                (startX, startY, endX, endY) = make_bbox_larger(box, self.enlarge_face_percentage)
-                faces.append((int(startX), int(startY), int(endX - startX), int(endY - startY)))
+        if self.batcher is not None:
+            detections = self.batcher.submit_many(resized_images)
+        else:
+            detections = []
+            for start in range(0, len(resized_images), max(self.batch_size, 1)):
+                detections += self.forward(resized_images[start:start + max(self.batch_size, 1)])
 
-        if faces:
-            # Making sure all the face detections lie within the image
-            faces = clip_detections(faces, image.shape)
+        faces = []
+        start = 0
+        for image, image_tiles in zip(images, tiles):
+            if not image_tiles:
+                faces.append(self.detections_to_faces(detections[start], image.shape))
+                start += 1
+                continue
 
+            # The detections of the tiles are moved to the coordinates of the whole image and merged with its own
+            image_detections = [detections[start]]
+            image_detections += [tile_ssd_detections_to_image(tile_detections, tile, image.shape, TILE_BORDER_MARGIN)
+                                 for tile_detections, tile in zip(detections[start + 1:], image_tiles)]
+            faces.append(self.detections_to_faces(np.concatenate(image_detections), image.shape,
+                                                  self.nms_thresh or TILE_NMS_THRESH))
+            start += 1 + len(image_tiles)
         return faces
+
+    def get_tiles(self, image_shape) -> List[Tuple[int, int, int, int]]:
+        """ Gets the tiles in which an image is split for the detection. Only images with a side larger than the tile
+        size are tiled, the smaller faces of large group photos get lost when the whole image is shrunk to the input
+        size of the model.
+
+        Args:
+            image_shape: Tuple with the shape of the image in the format (h, w, c).
+
+        Returns:
+            List with the coordinates of each tile in the format (x, y, width, height). Empty if the image is not
+            tiled.
+        """
+        if self.tile_size <= 0 or max(image_shape[:2]) <= self.tile_size:
+            return []
+        return get_tiles(image_shape, self.tile_size, self.tile_overlap)
+
+    def detections_to_faces(self, detections: np.ndarray, image_shape, nms_thresh: Union[float, None] = None) \
+            -> List[Tuple[int, int, int, int]]:
+        """ Converts the raw detections of the model for an image into the coordinates of the faces.
+
+        Args:
+            detections: Array with shape (N, 7) with the raw detections of the model for the image.
+            image_shape: Tuple with the shape of the image in the format (h, w, c).
+            nms_thresh: Threshold of the non maximum suppression. If None the one of the config file is used.
+
+        Returns:
+            List of coordinates with detections.
+        """
+        faces = ssd_detections_to_boxes(detections, image_shape, self.confidence_thresh,
+                                        self.enlarge_face_percentage,
+                                        self.nms_thresh if nms_thresh is None else nms_thresh)
+        return [tuple(face) for face in faces.tolist()]
@@ -0,0 +1,125 @@
+import os
+import threading
+import cv2 as cv
+import numpy as np
+import onnxruntime as ort
+from typing import Tuple, List, Union, Dict
+
+from src.detection_helpers import ssd_detections_to_boxes, scores_and_boxes_to_ssd_detections
+from src.detectors.base_detector import BaseDetector, get_field
+from src.model_store import ModelLoad, load_model, get_quantized_model_path
+
+
+class FaceDetectorONNX(BaseDetector):
+    """Class that implements face detection using an ONNX model, such as the Ultra-Light-Fast face detector, run by
+    ONNX Runtime on the CPU"""
+
+    # Sessions shared by all the instances that use the same model and options. Unlike the OpenCV networks, ONNX Runtime
+    # sessions can run from several threads at once, so one session per process is enough.
+    _sessions: Dict[Tuple, ort.InferenceSession] = {}
+    _sessions_lock = threading.Lock()
+
+    def __init__(self, config):
+        self.session = None
+        self.input_name = None
+        self.model_loads: List[ModelLoad] = []
+        self.model_path = os.getcwd() + get_field(config, "model_path")
+        self.confidence_thresh = get_field(config, "confidence_thresh")
+        self.enlarge_face_percentage = get_field(config, "enlarge_face_percentage")
+        self.input_size = get_field(config, "input_size", eval_field=True)
+        self.mean_normalization = get_field(config, "mean_normalization", eval_field=True)
+        self.scale_factor = get_field(config, "scale_factor")
+        self.swap_rb = get_field(config, "swap_rb", default=False)
+        self.nms_thresh = get_field(config, "nms_thresh", default=0.0)
+        self.batch_size = get_field(config, "batch_size", default=1)
+        self.intra_op_num_threads = get_field(config, "intra_op_num_threads", default=0)
+        self.inter_op_num_threads = get_field(config, "inter_op_num_threads", default=0)
+        self.quantize = get_field(config, "quantize", default=False)
+        self.quantized_cache_dir = get_field(config, "quantized_cache_dir") if self.quantize else ""
+        self.load()
+
+    def load(self):
+        """ Loads the model for detection. When quantize is set the model is run from a copy with its weights quantized
+        to int8, created the first time the model is loaded."""
+        model_path = self.model_path
+        if self.quantize:
+            model_path = get_quantized_model_path(self.model_path, self.quantized_cache_dir)
+
+        key = (model_path, self.intra_op_num_threads, self.inter_op_num_threads)
+        with FaceDetectorONNX._sessions_lock:
+            if key not in FaceDetectorONNX._sessions:
+                FaceDetectorONNX._sessions[key] = load_model("onnx_face", model_path, self.create_session,
+                                                             self.model_loads)
+            self.session = FaceDetectorONNX._sessions[key]
+        self.input_name = self.session.get_inputs()[0].name
+
+    def create_session(self, model_path: str) -> ort.InferenceSession:
+        """ Creates the ONNX Runtime session that runs the model with the configured number of threads. A number of
+        threads of 0 lets ONNX Runtime use its default, which is one thread per physical core.
+
+        Args:
+            model_path: The path of the ONNX model.
+
+        Returns: The session.
+        """
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.intra_op_num_threads
+        options.inter_op_num_threads = self.inter_op_num_threads
+        options.execution_mode = ort.ExecutionMode.ORT_PARALLEL if self.inter_op_num_threads > 1 \
+            else ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        return ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+
+    def forward(self, images: List[np.ndarray]) -> List[np.ndarray]:
+        """ Runs a single forward pass of the model on a batch of images already resized to the input size.
+
+        Args:
+            images: List of images resized to the input size of the model.
+
+        Returns:
+            List with the raw detections of each image as an array with shape (N, 7), where each row has the format
+            (image_id, label, confidence, xmin, ymin, xmax, ymax) with coordinates relative to the image size.
+        """
+        blob = cv.dnn.blobFromImages(images, self.scale_factor, self.input_size, self.mean_normalization,
+                                     swapRB=self.swap_rb)
+        scores, boxes = self.session.run(None, {self.input_name: blob})
+        return [scores_and_boxes_to_ssd_detections(image_scores, image_boxes)
+                for image_scores, image_boxes in zip(scores, boxes)]
+
+    def detect(self, image: np.ndarray, roi: Union[List[Tuple[int, int, int, int]], None] = None) \
+            -> List[Tuple[int, int, int, int]]:
+        """ Performs detection on the image taking into account the regions of interest (roi).
+        If the roi is None then the detection is performed in the whole image.
+
+        Args:
+            image: Image to use for detection.
+            roi: List of coordinates of regions of interest where to look for the detections.
+
+        Returns:
+            List of coordinates with detections.
+        """
+        return self.detect_many([image])[0]
+
+    def detect_many(self, images: List[np.ndarray], rois: Union[List[List[Tuple[int, int, int, int]]], None] = None) \
+            -> List[List[Tuple[int, int, int, int]]]:
+        """ Performs detection on several images, running them through the model in batches of batch_size images. The
+        regions of interest are ignored, the detection is always performed in the whole images.
+
+        Args:
+            images: List of images to use for detection.
+            rois: List with the regions of interest of each image.
+
+        Returns:
+            List with the list of coordinates with detections of each image.
+        """
+        resized_images = [cv.resize(image, self.input_size) for image in images]
+        detections = []
+        for start in range(0, len(resized_images), self.batch_size):
+            detections += self.forward(resized_images[start:start + self.batch_size])
+
+        faces = []
+        for image_detections, image in zip(detections, images):
+            boxes = ssd_detections_to_boxes(image_detections, image.shape, self.confidence_thresh,
+                                            self.enlarge_face_percentage, self.nms_thresh)
+            faces.append([tuple(face) for face in boxes.tolist()])
+        return faces
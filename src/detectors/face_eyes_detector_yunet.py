@@ -0,0 +1,66 @@
+import os
+from typing import List, Tuple
+
+import cv2 as cv
+import numpy as np
+
+from src.detection_helpers import make_bboxes_larger, clip_boxes, eye_keypoints_to_boxes
+from src.detectors.base_detector import BaseFaceEyesDetector, get_field
+from src.model_store import ModelLoad, load_model
+
+
+class FaceEyesDetectorYuNet(BaseFaceEyesDetector):
+    """Class that implements face and eye detection in a single forward pass using the YuNet face detector from OpenCV,
+    which returns the eye keypoints of each face along with its bounding box"""
+
+    def __init__(self, config):
+        self.face_detector = None
+        self.model_loads: List[ModelLoad] = []
+        self.model_path = os.getcwd() + get_field(config, "model_path")
+        self.confidence_thresh = get_field(config, "confidence_thresh")
+        self.nms_thresh = get_field(config, "nms_thresh", default=0.3)
+        self.top_k = get_field(config, "top_k", default=5000)
+        self.enlarge_face_percentage = get_field(config, "enlarge_face_percentage", default=0.0)
+        self.eye_width_ratio = get_field(config, "eye_width_ratio", default=0.45)
+        self.eye_height_ratio = get_field(config, "eye_height_ratio", default=0.25)
+        self.load()
+
+    def load(self):
+        """ Loads the model for detection. """
+        self.face_detector = load_model("yunet", self.model_path, self.create_face_detector, self.model_loads)
+
+    def create_face_detector(self, model_path: str) -> cv.FaceDetectorYN:
+        """ Creates the YuNet face detector. Its input size is set to the size of each image before running it.
+
+        Args:
+            model_path: The path of the ONNX model.
+
+        Returns: The YuNet face detector.
+        """
+        return cv.FaceDetectorYN.create(model_path, "", (320, 320), self.confidence_thresh, self.nms_thresh,
+                                        self.top_k)
+
+    def detect_faces_and_eyes(self, image: np.ndarray) \
+            -> Tuple[List[Tuple[int, int, int, int]], List[Tuple[int, int, int, int]]]:
+        """ Detects all the faces in the image and the eyes of each face with a single forward pass of the network.
+
+        Args:
+            image: Image to use for detection.
+
+        Returns:
+            A tuple with the list of faces and the list of eyes, both made out of tuples with the coordinates in the
+            format (x, y, width, height). The two eyes of each face are one after the other.
+        """
+        self.face_detector.setInputSize((image.shape[1], image.shape[0]))
+        _, detections = self.face_detector.detect(image)
+        if detections is None or len(detections) == 0:
+            return [], []
+
+        # Each row has the format (x, y, w, h, right eye, left eye, nose tip, mouth corners, score)
+        boxes = np.hstack((detections[:, 0:2], detections[:, 0:2] + detections[:, 2:4]))
+        boxes = make_bboxes_larger(boxes, self.enlarge_face_percentage)
+        boxes = np.stack((boxes[:, 0], boxes[:, 1], boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]), axis=1)
+        faces = clip_boxes(np.trunc(boxes).astype(np.int64), image.shape)
+
+        eyes = eye_keypoints_to_boxes(detections[:, 4:8], self.eye_width_ratio, self.eye_height_ratio)
+        return [tuple(face) for face in faces.tolist()], [tuple(eye) for eye in eyes.tolist()]
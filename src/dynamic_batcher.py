@@ -0,0 +1,89 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Tuple
+
+
+class DynamicBatcher:
+    """ Class that groups items submitted concurrently from different threads into batches. A batch is processed as
+    soon as it holds batch_size items or when the first item in it has waited max_wait_ms milliseconds.
+    """
+
+    def __init__(self, process_batch: Callable[[List[Any]], List[Any]], batch_size: int, max_wait_ms: float):
+        """
+        Args:
+            process_batch: Callable that receives a list of items and returns a list with one result per item, in the
+                           same order. It is always called from the same thread.
+            batch_size: Maximum number of items in a batch.
+            max_wait_ms: Maximum time in milliseconds to wait for a batch to be filled.
+        """
+        self.process_batch = process_batch
+        self.batch_size = batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def submit(self, item: Any) -> Any:
+        """ Adds an item to the next batch and waits for its result.
+
+        Args:
+            item: The item to be processed.
+
+        Returns: The result corresponding to the item.
+        """
+        return self.submit_many([item])[0]
+
+    def submit_many(self, items: List[Any]) -> List[Any]:
+        """ Adds several items to the next batches at once and waits for their results. The items are grouped in
+        batches together with the items submitted concurrently by other threads.
+
+        Args:
+            items: The items to be processed.
+
+        Returns: List with the result corresponding to each item, in the same order.
+        """
+        # The thread is only started when needed, so the batcher can be created before forking worker processes
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="dynamic-batcher", daemon=True)
+                self._thread.start()
+
+        futures = []
+        for item in items:
+            future: Future = Future()
+            self._queue.put((item, future))
+            futures.append(future)
+        return [future.result() for future in futures]
+
+    def _collect_batch(self) -> List[Tuple[Any, Future]]:
+        """ Waits for the first item and then collects items until the batch is full or the waiting time is over.
+
+        Returns: List of tuples with each item and the future where its result should be set.
+        """
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            items = [item for item, _ in batch]
+            try:
+                results = self.process_batch(items)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
@@ -0,0 +1,155 @@
+from typing import List, Tuple, Union
+
+import cv2 as cv
+import numpy as np
+
+from image_operations import GooglyEye
+
+# Movement of the pupils, with the distances measured in eye radiuses per frame
+PUPIL_GRAVITY = np.array([0.0, 0.08])
+PUPIL_DAMPING = 0.85
+PUPIL_BOUNCE = 0.6
+
+
+class PupilState:
+    """ Class with the state of the pupil of a googly eye. The offset and velocity are relative to the center of the eye
+    and measured in eye radiuses, so the pupil keeps its movement when the eye changes size. """
+
+    def __init__(self, size_ratio: float, rng: Union[np.random.Generator, None] = None):
+        """
+        Args:
+            size_ratio: The diameter of the pupil relative to the radius of the eye.
+            rng: The random generator of the initial offset of the pupil. If None a new unseeded generator is used.
+        """
+        if rng is None:
+            rng = np.random.default_rng()
+        self.size_ratio = size_ratio
+        max_offset = self.get_max_offset()
+        self.offset = rng.uniform(-max_offset, max_offset, 2) / 2
+        self.velocity = np.zeros(2)
+
+    def get_max_offset(self) -> float:
+        """ Gets the maximum distance between the center of the pupil and the center of the eye, so the pupil stays
+        inside the eye. """
+        return 1 - self.size_ratio / 2
+
+    def update(self, eye_motion: np.ndarray):
+        """ Moves the pupil one frame. The pupil falls with gravity, lags behind the movement of the eye and bounces on
+        the border of the eye losing part of its speed.
+
+        Args:
+            eye_motion: The movement of the center of the eye since the last frame, in eye radiuses.
+        """
+        self.velocity = PUPIL_DAMPING * self.velocity - eye_motion + PUPIL_GRAVITY
+        self.offset = self.offset + self.velocity
+
+        max_offset = self.get_max_offset()
+        distance = float(np.linalg.norm(self.offset))
+        if distance > max_offset:
+            normal = self.offset / distance
+            self.offset = normal * max_offset
+            normal_speed = float(np.dot(self.velocity, normal))
+            if normal_speed > 0:
+                self.velocity = self.velocity - (1 + PUPIL_BOUNCE) * normal_speed * normal
+
+
+class EyeTracker:
+    """ Class that keeps the googly eyes of a video stream between frames. The eyes found by the detectors are followed
+    in the next frames with sparse optical flow, which is much cheaper than detecting them again, and each eye keeps its
+    pupil so that it wobbles smoothly instead of jumping around. """
+
+    def __init__(self, max_tracking_error: float, rng: Union[np.random.Generator, None] = None):
+        """
+        Args:
+            max_tracking_error: The maximum optical flow error of an eye before it is considered lost.
+            rng: The random generator of the pupils of the new eyes. A seeded generator gives the same googly eyes to
+                 the same video, if None the pupils are random.
+        """
+        self.max_tracking_error = max_tracking_error
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.eyes: List[Tuple[int, int, int, int]] = []
+        self.pupils: List[PupilState] = []
+        self.frames_since_detection = 0
+        self.previous_gray = None
+
+    def track(self, frame: np.ndarray) -> bool:
+        """ Moves the eyes to their position in a new frame.
+
+        Args:
+            frame: The new frame as a numpy array in the BGR color space.
+
+        Returns: Whether all the eyes were followed. If False the eyes should be detected again.
+        """
+        gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+        if self.previous_gray is None or self.previous_gray.shape != gray.shape:
+            return False
+
+        self.frames_since_detection += 1
+        if not self.eyes:
+            self.previous_gray = gray
+            return True
+
+        points = np.array([[x + w / 2, y + h / 2] for x, y, w, h in self.eyes], dtype=np.float32).reshape(-1, 1, 2)
+        new_points, status, error = cv.calcOpticalFlowPyrLK(self.previous_gray, gray, points, None,
+                                                            winSize=(21, 21), maxLevel=3)
+        if new_points is None or not status.all() or (error > self.max_tracking_error).any():
+            return False
+
+        motions = (new_points - points).reshape(-1, 2)
+        self.eyes = [(int(round(x + dx)), int(round(y + dy)), w, h)
+                     for (x, y, w, h), (dx, dy) in zip(self.eyes, motions)]
+        self.move_pupils(motions)
+        self.previous_gray = gray
+        return True
+
+    def update_detections(self, eyes: List[Tuple[int, int, int, int]], frame: np.ndarray):
+        """ Replaces the eyes with new detections. Each new eye keeps the pupil of the closest previous eye, if it is
+        close enough to be the same eye, and otherwise gets a new pupil.
+
+        Args:
+            eyes: A list made out of tuples representing the coordinates of an eye in the format (x, y, width, height).
+            frame: The frame where the eyes were detected as a numpy array in the BGR color space.
+        """
+        previous_centers = np.array([[x + w / 2, y + h / 2] for x, y, w, h in self.eyes]).reshape(-1, 2)
+        available = list(range(len(self.eyes)))
+        pupils = []
+        motions = []
+        for x, y, w, h in eyes:
+            center = np.array([x + w / 2, y + h / 2])
+            distances = [np.linalg.norm(previous_centers[i] - center) for i in available]
+            if distances and min(distances) < max(w, h):
+                match = available.pop(int(np.argmin(distances)))
+                pupils.append(self.pupils[match])
+                motions.append(center - previous_centers[match])
+            else:
+                pupils.append(PupilState(self.rng.uniform(0.45, 1), self.rng))
+                motions.append(np.zeros(2))
+
+        self.eyes = list(eyes)
+        self.pupils = pupils
+        self.move_pupils(np.array(motions).reshape(-1, 2))
+        self.frames_since_detection = 0
+        self.previous_gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+
+    def move_pupils(self, motions: np.ndarray):
+        """ Moves the pupils one frame given the movement of their eyes.
+
+        Args:
+            motions: Array with shape (N, 2) with the movement of each eye in pixels.
+        """
+        for pupil, motion, googly_eye in zip(self.pupils, motions, self.get_googly_eyes()):
+            pupil.update(motion / max(googly_eye.eye_radius, 1))
+
+    def get_googly_eyes(self) -> List[GooglyEye]:
+        """ Gets the googly eyes of the current frame.
+
+        Returns: A list with the parameters of the googly eye of each eye.
+        """
+        googly_eyes = []
+        for (x, y, w, h), pupil in zip(self.eyes, self.pupils):
+            eye_center = (x + w // 2, y + h // 2)
+            radius = int(round((w + h) * 0.75))
+            pupil_center = (int(round(eye_center[0] + pupil.offset[0] * radius)),
+                            int(round(eye_center[1] + pupil.offset[1] * radius)))
+            googly_eyes.append(GooglyEye(eye_center, radius, pupil_center, int(radius * pupil.size_ratio / 2)))
+        return googly_eyes
@@ -1,77 +1,727 @@
+import time
 import yaml
+import threading
 import logging
+import itertools
 import numpy as np
-from typing import List, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterable, Iterator, List, Tuple, Union
 
 import setup_logger
 from detectors.base_detector import get_detector, get_field
-from image_operations import convert_bytes_to_image, convert_image_to_bytes, draw_googly_eyes_on_image
+from detection_helpers import rescale_detections, estimate_eye_keypoints, eye_keypoints_to_boxes, \
+    get_largest_boxes_indices
+from degradation import DEGRADATION_LEVELS, DEGRADATION_POLICY, REDUCED, FEWER_FACES, GEOMETRIC_EYES, GOOGLIFY, \
+    ANNOTATE, GEOMETRIC_EYE_X_RATIOS, GEOMETRIC_EYE_Y_RATIO, GEOMETRIC_EYE_WIDTH_RATIO, GEOMETRIC_EYE_HEIGHT_RATIO
+from result_cache import get_result_cache, get_config_hash
+from eye_tracking import EyeTracker
+from model_store import get_peak_rss_bytes
+from metrics import STAGE_DURATION, IMAGES, FACES_PER_IMAGE, EYES_PER_IMAGE, INPUT_BYTES, INPUT_PIXELS, IN_FLIGHT, \
+    MODEL_LOAD_DURATION, MODEL_MEMORY, IMAGE_MEMORY, PEAK_RESIDENT_MEMORY, DEGRADED_IMAGES, WARMUP_DURATION, \
+    JPEG_REGION_ENCODING
+from image_operations import convert_bytes_to_image, convert_image_to_bytes, detect_image_format, \
+    generate_googly_eyes, read_image_size, get_decode_reduction, downscale_image, render_googly_eyes, \
+    get_googly_eyes_bounds
+from jpeg_splicing import encode_jpeg_regions
+
+# Sections of the config file that change the detections or the rendered images, hashed into the result cache keys
+CACHE_KEY_SECTIONS = ("detector", "face_detector", "eyes_detector", "preprocessing", "deadline", "output_encoding",
+                      "rendering")
+
+# Number of rows and columns of the grid of faces fitted by the eyes detector during the warm-up
+WARMUP_GRID_SIZE = 4
 
 
 class Googlifier:
     """ Class responsible for generating the googly eye filter """
 
+    # Threads that decode, draw and encode the images of batches, shared by the Googlifier instances of the process
+    _batch_executors: Dict[int, ThreadPoolExecutor] = {}
+    _batch_executors_lock = threading.Lock()
+    # Number of model files loaded by the detectors of the Googlifier instances of the process
+    model_load_count = 0
+    _model_load_count_lock = threading.Lock()
+
     def __init__(self, config_file_path: str):
         # Load configurations
         with open(config_file_path, "r") as file_object:
             config = yaml.load(file_object, Loader=yaml.SafeLoader)
 
-        face_detector_config = get_field(config, "face_detector")
-        eyes_detector_config = get_field(config, "eyes_detector")
+        # Load the combined face and eyes detector. When it is configured it replaces the face and eyes detectors, so
+        # the faces and eyes are found with a single model
+        detector_config = get_field(config, "detector", default={})
+        self.face_eyes_detector = None
+        self.face_detector = None
+        self.eyes_detector = None
+        if detector_config:
+            detector_name = get_field(detector_config, "model_class")
+            config_dict = get_field(detector_config, "parameters")
+            self.face_eyes_detector = get_detector(detector_name)(config_dict)
+        else:
+            face_detector_config = get_field(config, "face_detector")
+            eyes_detector_config = get_field(config, "eyes_detector")
+
+            # Load face detection model
+            detector_name = get_field(face_detector_config, "model_class")
+            config_dict = get_field(face_detector_config,"parameters")
+            self.face_detector = get_detector(detector_name)(config_dict)
+
+            # Load eye detection model
+            detector_name = get_field(eyes_detector_config, "model_class")
+            config_dict = get_field(eyes_detector_config,"parameters")
+            self.eyes_detector = get_detector(detector_name)(config_dict)
+
+        # Report the time and memory taken by the models loaded by the detectors
+        for detector in [self.face_detector, self.eyes_detector, self.face_eyes_detector]:
+            for model_load in getattr(detector, "model_loads", []):
+                MODEL_LOAD_DURATION.observe(model_load.seconds, model=model_load.name)
+                MODEL_MEMORY.set(model_load.memory_bytes, model=model_load.name)
+                with Googlifier._model_load_count_lock:
+                    Googlifier.model_load_count += 1
+
+        # Load the size of the largest side of the images used for detection
+        preprocessing_config = get_field(config, "preprocessing")
+        self.max_working_size = get_field(preprocessing_config, "max_working_size")
+
+        # Load the quality used to encode each output format
+        output_encoding_config = get_field(config, "output_encoding")
+        self.encoding_quality = {".jpg": get_field(output_encoding_config, "jpeg_quality"),
+                                 ".webp": get_field(output_encoding_config, "webp_quality"),
+                                 ".png": get_field(output_encoding_config, "png_compression")}
+        # JPEG outputs of JPEG inputs with restart markers only encode again the parts of the input around the eyes
+        self.jpeg_region_encoding = get_field(output_encoding_config, "jpeg_region_encoding", default=False)
+
+        # Load what is degraded to finish the images before their deadline, see DEGRADATION_LEVELS
+        deadline_config = get_field(config, "deadline")
+        self.degraded_working_size = get_field(deadline_config, "degraded_working_size")
+        self.degraded_encoding_quality = {".jpg": get_field(deadline_config, "degraded_jpeg_quality"),
+                                          ".webp": get_field(deadline_config, "degraded_webp_quality"),
+                                          ".png": get_field(deadline_config, "degraded_png_compression")}
+        self.degraded_max_faces = get_field(deadline_config, "degraded_max_faces")
+        # The time taken by each level is shared by the Googlifier instances of the process
+        self.degradation_policy = DEGRADATION_POLICY
+
+        # Load how often the detectors run on video frames, the eyes are tracked in the frames in between
+        video_config = get_field(config, "video")
+        self.detection_interval = get_field(video_config, "detection_interval")
+        self.max_tracking_error = get_field(video_config, "max_tracking_error")
+
+        # Load the seed of the random pupils, so the same image always gets the same googly eyes. 0 keeps them random
+        self.rendering_seed = get_field(get_field(config, "rendering"), "seed", default=0)
 
-        # Load face detection model
-        detector_name = get_field(face_detector_config, "model_class")
-        config_dict = get_field(face_detector_config,"parameters")
-        self.face_detector = get_detector(detector_name)(config_dict)
+        # Load the parallelism used to googlify several images at once
+        batch_config = get_field(config, "batch")
+        self.batch_workers = get_field(batch_config, "max_workers")
+        self.batch_chunk_size = get_field(batch_config, "chunk_size")
+        # The batches run from several threads of the inference pool or of the job processors share the same threads,
+        # so they do not multiply the threads of the process
+        with Googlifier._batch_executors_lock:
+            if self.batch_workers not in Googlifier._batch_executors:
+                Googlifier._batch_executors[self.batch_workers] = ThreadPoolExecutor(
+                    max_workers=self.batch_workers, thread_name_prefix="googlifier-batch")
+            self.batch_executor = Googlifier._batch_executors[self.batch_workers]
 
-        # Load eye detection model
-        detector_name = get_field(eyes_detector_config, "model_class")
-        config_dict = get_field(eyes_detector_config,"parameters")
-        self.eyes_detector = get_detector(detector_name)(config_dict)
+        # Get the cache of results shared by the Googlifier instances of the process
+        self.result_cache = get_result_cache(get_field(config, "cache"))
+        # Results of other configurations are never served, even when they share the cache backend
+        self.cache_context = get_config_hash(config, CACHE_KEY_SECTIONS)
+
+        # Load the sizes of the synthetic images run through the detectors by warm_up
+        warmup_config = get_field(config, "warmup", default={})
+        self.warmup_image_sizes = get_field(warmup_config, "image_sizes", eval_field=True, default=())
+        self.warmup_repetitions = get_field(warmup_config, "repetitions", default=0)
 
         # Create the Logger
         self.logger = logging.getLogger(setup_logger.LOGGER_NAME)
 
-    def detect_eyes_and_googlify(self, image_byte_array: bytes) -> Tuple[bool, bytes]:
+    def warm_up(self) -> float:
+        """ Runs the detectors on synthetic images of the sizes set in the config file. The first run of the models
+        sets up their networks and allocates their buffers, which takes seconds, so warming them up before serving keeps
+        that time out of the first requests. Each face detection is followed by a landmark fit on a grid of faces
+        covering the image, so the eyes detector is warmed up even though the synthetic images have no faces, including
+        the threads that fit the faces of crowded images.
+
+        Returns: The seconds taken by the warm-up.
+        """
+        start = time.perf_counter()
+        rng = np.random.default_rng(0)
+        for _ in range(self.warmup_repetitions):
+            for width, height in self.warmup_image_sizes:
+                image, _ = downscale_image(rng.integers(0, 256, (height, width, 3), dtype=np.uint8),
+                                           self.max_working_size)
+                working_height, working_width = image.shape[:2]
+                faces = [(x, y, working_width // WARMUP_GRID_SIZE, working_height // WARMUP_GRID_SIZE)
+                         for y in range(0, working_height - working_height // WARMUP_GRID_SIZE + 1,
+                                        working_height // WARMUP_GRID_SIZE)
+                         for x in range(0, working_width - working_width // WARMUP_GRID_SIZE + 1,
+                                        working_width // WARMUP_GRID_SIZE)]
+                if self.face_eyes_detector is not None:
+                    self.face_eyes_detector.detect_faces_and_eyes(image)
+                else:
+                    self.face_detector.detect(image)
+                    self.eyes_detector.detect(image, faces)
+
+        seconds = time.perf_counter() - start
+        WARMUP_DURATION.observe(seconds)
+        self.logger.info("Warmed up the models in " + format(seconds, ".3f") + " seconds.")
+        return seconds
+
+    def detect_eyes_and_googlify(self, image_byte_array: bytes, image_format: Union[str, None] = None,
+                                 degradation_level: int = 0) -> Tuple[bool, bytes]:
         """ Detects all the faces in the input image, then for each face detect the facial landmarks.  From the facial
         landmarks it extracts the eyes coordinates and draws the googly eyes on top.
 
         Args:
             image_byte_array: Input image as a byte array.
+            image_format: File extension of the format of the output image, one of ".png", ".jpg" or ".webp". If None
+                          the output image is encoded as PNG.
+            degradation_level: The index in DEGRADATION_LEVELS of the quality traded for speed, usually chosen with
+                               select_degradation_level. Degraded results are cached apart from the others.
 
         Returns:
             A tuple with: A boolean representing whether the operation was successful, it is false if the provided input
             image is corrupt in some way that does not allow to be converted to a numpy array;
             The image with the googly eyes drawn on top of the detected eyes. If no eyes are detected it simply returns
-            the same image.
+            the same image, only re-encoded if a different output format was requested.
+        """
+        INPUT_BYTES.observe(len(image_byte_array))
+        start = time.perf_counter()
+        with IN_FLIGHT.track_inprogress(), STAGE_DURATION.time(stage="total"):
+            output_format = image_format or ".png"
+
+            # Reuse the output of a previous request with the same image
+            cache_key = self.get_cache_key(image_byte_array, degradation_level)
+            if cache_key is not None:
+                cached_image = self.result_cache.get_rendered(cache_key, output_format)
+                if cached_image is not None:
+                    IMAGES.inc(result="cached")
+                    return True, cached_image
+
+            # Convert image from bytes to numpy array
+            image = self.decode_image(image_byte_array)
+            if image is None:
+                IMAGES.inc(result="corrupt")
+                return False, image_byte_array
+
+            # Detect all faces and their eyes in input image
+            detections = self.get_cached_detections(cache_key)
+            if detections is None:
+                faces, eyes = self.detect_faces_and_eyes(image, degradation_level=degradation_level)
+                self.cache_detections(cache_key, image.shape[1], image.shape[0], faces, eyes)
+            else:
+                faces, eyes = detections["faces"], detections["eyes"]
+
+            image_bytes = self.googlify_and_cache(image_byte_array, image, faces, eyes, image_format, cache_key,
+                                                  degradation_level)
+
+        # Only the images that went through the detection tell how long each level takes
+        if detections is None:
+            self.degradation_policy.record(degradation_level, time.perf_counter() - start,
+                                           image.shape[0] * image.shape[1] / 1e6, GOOGLIFY)
+        return True, image_bytes
+
+    def detect_eyes_and_googlify_many(self, image_byte_arrays: Iterable[bytes], image_format: Union[str, None] = None) \
+            -> Iterator[Tuple[int, bool, bytes]]:
+        """ Draws the googly eyes on several images. The images are processed in chunks of batch_chunk_size images: they
+        are decoded in parallel, their faces are detected in batches and the googly eyes are drawn and encoded in
+        parallel by the batch threads of the process. The results are returned as soon as each image is done, so they
+        may come out of order.
+
+        Args:
+            image_byte_arrays: Iterable with the input images as byte arrays.
+            image_format: File extension of the format of the output images, one of ".png", ".jpg" or ".webp". If None
+                          the output images are encoded as PNG.
+
+        Returns:
+            An iterator of tuples, one per input image, with: The index of the image in the input; A boolean
+            representing whether the operation was successful for that image, it is false if the image is corrupt or
+            could not be processed; The image with the googly eyes or the input image if the operation failed.
+        """
+        output_format = image_format or ".png"
+        # Futures of the images being drawn and encoded with their index and input bytes
+        pending: Dict[Future, Tuple[int, bytes]] = {}
+        executor = self.batch_executor
+        indexed_images = enumerate(image_byte_arrays)
+        while True:
+            chunk = list(itertools.islice(indexed_images, self.batch_chunk_size))
+            if not chunk:
+                break
+
+            # Return the images already rendered and decode the rest in parallel
+            undecoded = []
+            for index, image_byte_array in chunk:
+                INPUT_BYTES.observe(len(image_byte_array))
+                cache_key = self.get_cache_key(image_byte_array)
+                cached_image = None if cache_key is None else \
+                    self.result_cache.get_rendered(cache_key, output_format)
+                if cached_image is not None:
+                    IMAGES.inc(result="cached")
+                    yield index, True, cached_image
+                else:
+                    undecoded.append((index, image_byte_array, cache_key))
+
+            decoded = []
+            for (index, image_byte_array, cache_key), image in zip(
+                    undecoded, executor.map(lambda item: self.decode_image(item[1]), undecoded)):
+                if image is None:
+                    IMAGES.inc(result="corrupt")
+                    yield index, False, image_byte_array
+                else:
+                    decoded.append((index, image_byte_array, cache_key, image))
+
+            # Detect the faces of all the images of the chunk that are not cached at once
+            detections = {index: self.get_cached_detections(cache_key) for index, _, cache_key, _ in decoded}
+            undetected = [item for item in decoded if detections[item[0]] is None]
+            try:
+                detected = self.detect_faces_and_eyes_many([image for _, _, _, image in undetected])
+            except Exception as e:
+                self.logger.info("Error detecting the faces and eyes of a batch of images: " + repr(e))
+                for index, image_byte_array, _, _ in undetected:
+                    yield index, False, image_byte_array
+                decoded = [item for item in decoded if detections[item[0]] is not None]
+                detected = []
+            for (index, _, cache_key, image), (faces, eyes) in zip(undetected, detected):
+                self.cache_detections(cache_key, image.shape[1], image.shape[0], faces, eyes)
+                detections[index] = {"faces": faces, "eyes": eyes}
+
+            for index, image_byte_array, cache_key, image in decoded:
+                future = executor.submit(self.googlify_and_cache, image_byte_array, image,
+                                         detections[index]["faces"], detections[index]["eyes"], image_format,
+                                         cache_key)
+                pending[future] = (index, image_byte_array)
+
+            # Return the images of the previous chunks that are already done while the next chunk is processed
+            for future in [future for future in pending if future.done()]:
+                yield self.get_batch_result(future, *pending.pop(future))
+
+        for future in as_completed(list(pending)):
+            yield self.get_batch_result(future, *pending.pop(future))
+
+    def get_batch_result(self, future: Future, index: int, image_byte_array: bytes) -> Tuple[int, bool, bytes]:
+        """ Gets the result of an image of detect_eyes_and_googlify_many from the future that rendered it.
+
+        Args:
+            future: The finished future with the image with googly eyes.
+            index: The index of the image in the input.
+            image_byte_array: Input image as a byte array.
+
+        Returns: A tuple with the index of the image, whether it was successful and the output image.
         """
-        # Convert image from bytes to numpy array
         try:
-            image = convert_bytes_to_image(image_byte_array)
+            return index, True, future.result()
         except Exception as e:
-            self.logger.info("Error converting image from bytes to numpy array: " + repr(e))
-            return False, image_byte_array
+            self.logger.info("Error drawing the googly eyes on an image of a batch: " + repr(e))
+            return index, False, image_byte_array
 
-        # Detect all faces in input image
-        faces = self.detect_faces(image)
+    def googlify_and_cache(self, image_byte_array: bytes, image: np.ndarray, faces: List[Tuple[int, int, int, int]],
+                           eyes: List[Tuple[int, int, int, int]], image_format: Union[str, None],
+                           cache_key: Union[str, None], degradation_level: int = 0) -> bytes:
+        """ Draws the googly eyes on a decoded image and adds the output to the result cache.
 
+        Args:
+            image_byte_array: Input image as a byte array.
+            image: Input image as a numpy array in the BGR color space.
+            faces: List with the faces in the format (x, y, width, height).
+            eyes: List with the eyes in the format (x, y, width, height).
+            image_format: File extension of the format of the output image. If None the output image is encoded as PNG.
+            cache_key: The key of the image in the result cache. If None the cache is not used.
+            degradation_level: The index in DEGRADATION_LEVELS of the quality traded for speed.
+
+        Returns: The output image as bytes.
+        """
+        image_bytes = self.googlify_decoded_image(image_byte_array, image, faces, eyes, image_format,
+                                                  degradation_level)
+        if cache_key is not None:
+            self.result_cache.set_rendered(cache_key, image_format or ".png", image_bytes)
+
+        # The input bytes, the decoded image and the output bytes are the largest buffers held at once for an image
+        output_bytes = len(image_bytes) if image_bytes is not image_byte_array else 0
+        IMAGE_MEMORY.observe(len(image_byte_array) + image.nbytes + output_bytes)
+        PEAK_RESIDENT_MEMORY.set(get_peak_rss_bytes())
+        return image_bytes
+
+    def googlify_decoded_image(self, image_byte_array: bytes, image: np.ndarray,
+                               faces: List[Tuple[int, int, int, int]], eyes: List[Tuple[int, int, int, int]],
+                               image_format: Union[str, None], degradation_level: int = 0) -> bytes:
+        """ Draws the googly eyes on a decoded image and encodes it.
+
+        Args:
+            image_byte_array: Input image as a byte array.
+            image: Input image as a numpy array in the BGR color space.
+            faces: List with the faces in the format (x, y, width, height).
+            eyes: List with the eyes in the format (x, y, width, height).
+            image_format: File extension of the format of the output image. If None the output image is encoded as PNG,
+                          unless there are no eyes, in which case the input bytes are returned.
+            degradation_level: The index in DEGRADATION_LEVELS of the quality traded for speed. From the "reduced"
+                               level the image is encoded with the faster degraded_encoding_quality.
+
+        Returns: The output image as bytes.
+        """
         if not faces:
             self.logger.info("No faces detected in the image.")
-            return True, image_byte_array
+            IMAGES.inc(result="no_faces")
+            return self.encode_unchanged_image(image_byte_array, image, image_format, degradation_level)
 
-        # Detect eyes in all detected faces
-        eyes = self.detect_eyes(image, faces)
         if not eyes:
             self.logger.info("No eyes detected in any detected face.")
-            return True, image_byte_array
+            IMAGES.inc(result="no_eyes")
+            return self.encode_unchanged_image(image_byte_array, image, image_format, degradation_level)
 
         # Draw googly eyes on image
-        image = draw_googly_eyes_on_image(eyes, image)
+        with STAGE_DURATION.time(stage="drawing"):
+            googly_eyes = generate_googly_eyes(eyes, self.create_rng())
+            image = render_googly_eyes(googly_eyes, image)
 
         # Convert image from numpy array to bytes
-        image_bytes = convert_image_to_bytes(image)
+        output_format = image_format or ".png"
+        with STAGE_DURATION.time(stage="encode"):
+            image_bytes = None
+            if self.jpeg_region_encoding and output_format == ".jpg" and \
+                    detect_image_format(image_byte_array) == ".jpg":
+                image_bytes = encode_jpeg_regions(image_byte_array, image, get_googly_eyes_bounds(googly_eyes))
+                JPEG_REGION_ENCODING.inc(result="full" if image_bytes is None else "spliced")
+            if image_bytes is None:
+                image_bytes = convert_image_to_bytes(image, output_format,
+                                                     self.get_encoding_quality(output_format, degradation_level))
+        IMAGES.inc(result="googlified")
+        return image_bytes
 
-        return True, image_bytes
+    def detect_eyes_and_annotate(self, image_byte_array: bytes, degradation_level: int = 0) \
+            -> Tuple[bool, Dict[str, Any]]:
+        """ Detects all the faces in the input image, then the eyes in each face and generates the googly eyes for them,
+        without drawing them on the image. This allows the clients to draw the googly eyes themselves.
+
+        Args:
+            image_byte_array: Input image as a byte array.
+            degradation_level: The index in DEGRADATION_LEVELS of the quality traded for speed, usually chosen with
+                               select_degradation_level. Degraded results are cached apart from the others.
+
+        Returns:
+            A tuple with: A boolean representing whether the operation was successful, it is false if the provided input
+            image is corrupt in some way that does not allow to be converted to a numpy array;
+            A dictionary with the "width" and "height" of the image, the "faces" in the format (x, y, width, height)
+            and the "eyes", each with its "box" in the format (x, y, width, height) and the parameters of its googly
+            eye ("eye_center", "eye_radius", "pupil_center" and "pupil_radius").
+        """
+        INPUT_BYTES.observe(len(image_byte_array))
+        start = time.perf_counter()
+        with IN_FLIGHT.track_inprogress(), STAGE_DURATION.time(stage="total"):
+            cache_key = self.get_cache_key(image_byte_array, degradation_level)
+            detections = self.get_cached_detections(cache_key)
+            if detections is None:
+                # The full resolution image is not needed, so only a reduced copy is decoded
+                image, scale = self.decode_working_image(image_byte_array, degradation_level)
+                if image is None:
+                    IMAGES.inc(result="corrupt")
+                    return False, {}
+
+                faces, eyes = self.detect_faces_and_eyes(image, scale, degradation_level)
+                height, width = [int(round(size / scale)) for size in image.shape[:2]]
+                self.cache_detections(cache_key, width, height, faces, eyes)
+            else:
+                width, height = detections["width"], detections["height"]
+                faces, eyes = detections["faces"], detections["eyes"]
+
+            IMAGES.inc(result="annotated" if eyes else "no_faces" if not faces else "no_eyes")
+            googly_eyes = generate_googly_eyes(eyes, self.create_rng())
+            annotations = {"width": width, "height": height, "faces": faces,
+                           "eyes": [{"box": eye, **googly_eye._asdict()} for eye, googly_eye in zip(eyes, googly_eyes)]}
+
+        # The annotations do not draw nor encode the image, so their times are measured apart from the googlified images
+        if detections is None:
+            self.degradation_policy.record(degradation_level, time.perf_counter() - start, width * height / 1e6,
+                                           ANNOTATE)
+        return True, annotations
+
+    def select_degradation_level(self, image_byte_array: bytes, deadline: Union[float, None],
+                                 operation: str = GOOGLIFY) -> int:
+        """ Selects how much quality is traded for speed so that an image is done before its deadline, from the time
+        each degradation level took on the previous images of the process. It should be called right before processing
+        the image, so the time it waited in the queue is taken into account.
+
+        Args:
+            image_byte_array: Input image as a byte array.
+            deadline: The time.monotonic() time by which the image should be done. If None the image is not degraded.
+            operation: The operation done on the image, GOOGLIFY for detect_eyes_and_googlify or ANNOTATE for
+                       detect_eyes_and_annotate, whose times are measured apart.
+
+        Returns: The index of the selected level in DEGRADATION_LEVELS.
+        """
+        if deadline is None:
+            return 0
+
+        # The size is read from the header, images whose size can not be read are estimated as small ones
+        image_size = read_image_size(image_byte_array)
+        megapixels = image_size[0] * image_size[1] / 1e6 if image_size is not None else 0.0
+        degradation_level = self.degradation_policy.select_level(deadline - time.monotonic(), megapixels, operation)
+        DEGRADED_IMAGES.inc(level=DEGRADATION_LEVELS[degradation_level])
+        if degradation_level > 0:
+            self.logger.info("Degrading the image to the level '" + DEGRADATION_LEVELS[degradation_level] +
+                             "' to meet its deadline.")
+        return degradation_level
+
+    def get_working_size(self, degradation_level: int = 0) -> int:
+        """ Gets the size of the largest side of the images used for detection.
+
+        Args:
+            degradation_level: The index in DEGRADATION_LEVELS of the quality traded for speed.
+
+        Returns: The size in pixels.
+        """
+        if degradation_level >= REDUCED:
+            return min(self.max_working_size, self.degraded_working_size)
+        return self.max_working_size
+
+    def get_encoding_quality(self, image_format: str, degradation_level: int = 0) -> int:
+        """ Gets the quality used to encode an output format.
+
+        Args:
+            image_format: File extension of the format of the output image.
+            degradation_level: The index in DEGRADATION_LEVELS of the quality traded for speed.
+
+        Returns: The quality, or the compression level for PNG.
+        """
+        if degradation_level >= REDUCED:
+            return self.degraded_encoding_quality[image_format]
+        return self.encoding_quality[image_format]
+
+    def create_rng(self) -> Union[np.random.Generator, None]:
+        """ Creates the random generator of the pupils of an image.
+
+        Returns: A generator seeded with rendering_seed or None if the pupils are random.
+        """
+        if not self.rendering_seed:
+            return None
+        return np.random.default_rng(self.rendering_seed)
+
+    def create_eye_tracker(self) -> EyeTracker:
+        """ Creates the state of a new video stream, which has to be passed to googlify_frame with each of its frames.
+        Its pupils are drawn from create_rng, so a rendering seed gives the same googly eyes to the same video.
+
+        Returns: An eye tracker without eyes.
+        """
+        return EyeTracker(self.max_tracking_error, self.create_rng())
+
+    def googlify_frame(self, frame: np.ndarray, eye_tracker: EyeTracker) -> np.ndarray:
+        """ Draws the googly eyes on a frame of a video stream. The faces and eyes are only detected every
+        detection_interval frames, or when an eye is lost, and they are tracked with optical flow in the frames in
+        between. The pupils keep their state between frames so they wobble with the movement of the eyes.
+
+        Args:
+            frame: The frame as a numpy array in the BGR color space. The googly eyes are drawn on it in place.
+            eye_tracker: The state of the video stream, created with create_eye_tracker.
+
+        Returns: The frame with the googly eyes drawn on top of the eyes.
+        """
+        with STAGE_DURATION.time(stage="frame"):
+            detection_due = eye_tracker.frames_since_detection + 1 >= self.detection_interval
+            if detection_due or not eye_tracker.track(frame):
+                _, eyes = self.detect_faces_and_eyes(frame)
+                eye_tracker.update_detections(eyes, frame)
+
+            with STAGE_DURATION.time(stage="drawing"):
+                return render_googly_eyes(eye_tracker.get_googly_eyes(), frame)
+
+    def get_cache_key(self, image_byte_array: bytes, degradation_level: int = 0) -> Union[str, None]:
+        """ Gets the key of the input image in the result cache, which depends on the configuration of the googlifier
+        and on the degradation level too, so degraded results are never served to requests of another level.
+
+        Args:
+            image_byte_array: Input image as a byte array.
+            degradation_level: The index in DEGRADATION_LEVELS of the quality traded for speed.
+
+        Returns: The key of the image or None if the result cache is not enabled.
+        """
+        if self.result_cache is None:
+            return None
+        return self.result_cache.get_key(image_byte_array, self.cache_context + ":" + str(degradation_level))
+
+    def get_cached_detections(self, cache_key: Union[str, None]) -> Union[Dict[str, Any], None]:
+        """ Gets the detections of an image from the result cache.
+
+        Args:
+            cache_key: The key of the image in the result cache. If None the cache is not used.
+
+        Returns: A dictionary with the "width", "height", "faces" and "eyes" of the image or None if they are not cached.
+        """
+        if cache_key is None:
+            return None
+        return self.result_cache.get_detections(cache_key)
+
+    def cache_detections(self, cache_key: Union[str, None], width: int, height: int,
+                         faces: List[Tuple[int, int, int, int]], eyes: List[Tuple[int, int, int, int]]):
+        """ Adds the detections of an image to the result cache.
+
+        Args:
+            cache_key: The key of the image in the result cache. If None the cache is not used.
+            width: The width of the full resolution image.
+            height: The height of the full resolution image.
+            faces: List with the faces in the format (x, y, width, height).
+            eyes: List with the eyes in the format (x, y, width, height).
+        """
+        if cache_key is not None:
+            self.result_cache.set_detections(cache_key, width, height, faces, eyes)
+
+    def detect_faces_and_eyes(self, image: np.ndarray, scale: float = 1.0, degradation_level: int = 0) \
+            -> Tuple[List[Tuple[int, int, int, int]], List[Tuple[int, int, int, int]]]:
+        """ Detects all the faces in the input image and the eyes in each face. The detection runs on a copy of the image
+        downscaled to max_working_size and the detections are mapped back to the full resolution image.
+
+        Args:
+            image: Input image as a numpy array in the BGR color space.
+            scale: The scale of the input image relative to the full resolution image, when it was decoded reduced.
+            degradation_level: The index in DEGRADATION_LEVELS of the quality traded for speed. From the "reduced" level
+                               the detection runs on an image downscaled to degraded_working_size, from "fewer_faces"
+                               only the degraded_max_faces largest faces are kept and from "geometric_eyes" the eyes are
+                               estimated from the face boxes instead of detected.
+
+        Returns: A tuple with the list of faces and the list of eyes, both made out of tuples with the coordinates in the
+                 full resolution image in the format (x, y, width, height). The list of eyes is empty if no faces are
+                 detected.
+        """
+        with STAGE_DURATION.time(stage="downscale"):
+            working_image, working_scale = downscale_image(image, self.get_working_size(degradation_level))
+        scale *= working_scale
+
+        if self.face_eyes_detector is not None:
+            with STAGE_DURATION.time(stage="face_eyes_detection"):
+                faces, eyes = self.face_eyes_detector.detect_faces_and_eyes(working_image)
+            if degradation_level >= FEWER_FACES:
+                # The two eyes of each face are one after the other
+                indices = get_largest_boxes_indices(faces, self.degraded_max_faces)
+                faces = [faces[index] for index in indices]
+                eyes = [eye for index in indices for eye in eyes[2 * index:2 * index + 2]]
+            FACES_PER_IMAGE.observe(len(faces))
+            EYES_PER_IMAGE.observe(len(eyes))
+            return rescale_detections(faces, 1 / scale), rescale_detections(eyes, 1 / scale)
+
+        with STAGE_DURATION.time(stage="face_detection"):
+            faces = self.detect_faces(working_image)
+        if degradation_level >= FEWER_FACES:
+            faces = [faces[index] for index in get_largest_boxes_indices(faces, self.degraded_max_faces)]
+        FACES_PER_IMAGE.observe(len(faces))
+        if not faces:
+            EYES_PER_IMAGE.observe(0)
+            return [], []
+
+        if degradation_level >= GEOMETRIC_EYES:
+            eyes = self.estimate_eyes(faces)
+        else:
+            with STAGE_DURATION.time(stage="eye_detection"):
+                eyes = self.detect_eyes(working_image, faces)
+        EYES_PER_IMAGE.observe(len(eyes))
+
+        return rescale_detections(faces, 1 / scale), rescale_detections(eyes, 1 / scale)
+
+    def detect_faces_and_eyes_many(self, images: List[np.ndarray]) \
+            -> List[Tuple[List[Tuple[int, int, int, int]], List[Tuple[int, int, int, int]]]]:
+        """ Detects all the faces and eyes in several images like detect_faces_and_eyes, running the face detection of
+        all the images at once so that the face detector can process them in batches.
+
+        Args:
+            images: List of input images as numpy arrays in the BGR color space.
+
+        Returns: A list with a tuple with the list of faces and the list of eyes of each image.
+        """
+        if not images:
+            return []
+
+        with STAGE_DURATION.time(stage="downscale"):
+            working_images = [downscale_image(image, self.max_working_size) for image in images]
+
+        if self.face_eyes_detector is not None:
+            with STAGE_DURATION.time(stage="face_eyes_detection"):
+                detections_per_image = self.face_eyes_detector.detect_faces_and_eyes_many(
+                    [working_image for working_image, _ in working_images])
+
+            detections = []
+            for (_, scale), (faces, eyes) in zip(working_images, detections_per_image):
+                FACES_PER_IMAGE.observe(len(faces))
+                EYES_PER_IMAGE.observe(len(eyes))
+                detections.append((rescale_detections(faces, 1 / scale), rescale_detections(eyes, 1 / scale)))
+            return detections
+
+        with STAGE_DURATION.time(stage="face_detection"):
+            faces_per_image = self.face_detector.detect_many([working_image for working_image, _ in working_images])
+
+        detections = []
+        for (working_image, scale), faces in zip(working_images, faces_per_image):
+            FACES_PER_IMAGE.observe(len(faces))
+            if not faces:
+                EYES_PER_IMAGE.observe(0)
+                detections.append(([], []))
+                continue
+
+            with STAGE_DURATION.time(stage="eye_detection"):
+                eyes = self.detect_eyes(working_image, faces)
+            EYES_PER_IMAGE.observe(len(eyes))
+            detections.append((rescale_detections(faces, 1 / scale), rescale_detections(eyes, 1 / scale)))
+        return detections
+
+    def decode_working_image(self, image_byte_array: bytes, degradation_level: int = 0) \
+            -> Tuple[Union[np.ndarray, None], float]:
+        """ Converts the input image from bytes to a numpy array reduced while decoding, when the image is large enough,
+        so that it is not smaller than max_working_size. For JPEG images this is much faster than a full decode.
+
+        Args:
+            image_byte_array: Input image as a byte array.
+            degradation_level: The index in DEGRADATION_LEVELS of the quality traded for speed, which sets the size
+                               used for detection.
+
+        Returns: A tuple with the image as a numpy array in the BGR color space, or None if the image is corrupt, and
+                 its scale relative to the full resolution image.
+        """
+        image_size = read_image_size(image_byte_array)
+        reduction = get_decode_reduction(image_size, self.get_working_size(degradation_level))
+        image = self.decode_image(image_byte_array, reduction)
+        if image is None or image_size is None or reduction == 1:
+            return image, 1.0
+
+        # Compare the largest sides since the decoded image might have been rotated by its EXIF orientation
+        return image, max(image.shape[:2]) / max(image_size)
+
+    def decode_image(self, image_byte_array: bytes, reduction: int = 1) -> Union[np.ndarray, None]:
+        """ Converts the input image from bytes to a numpy array.
+
+        Args:
+            image_byte_array: Input image as a byte array.
+            reduction: Factor by which the image is reduced while decoding, one of 1, 2, 4 or 8.
+
+        Returns: The image as a numpy array in the BGR color space or None if the image is corrupt.
+        """
+        try:
+            with STAGE_DURATION.time(stage="decode"):
+                image = convert_bytes_to_image(image_byte_array, reduction)
+        except Exception as e:
+            self.logger.info("Error converting image from bytes to numpy array: " + repr(e))
+            return None
+
+        if image is None:
+            self.logger.info("Error converting image from bytes to numpy array: the image could not be decoded.")
+            return None
+
+        INPUT_PIXELS.observe(image.shape[0] * image.shape[1] * reduction * reduction)
+        return image
+
+    def encode_unchanged_image(self, image_byte_array: bytes, image: np.ndarray, image_format: Union[str, None],
+                               degradation_level: int = 0) -> bytes:
+        """ Gets the output for an image without googly eyes. The input bytes are reused whenever they are already in
+        the requested format, so the image is only encoded again when the format changes.
+
+        Args:
+            image_byte_array: Input image as a byte array.
+            image: Input image as a numpy array in the BGR color space.
+            image_format: File extension of the format of the output image. If None the input bytes are returned.
+            degradation_level: The index in DEGRADATION_LEVELS of the quality traded for speed.
+
+        Returns: The image as bytes in the requested format.
+        """
+        if image_format is None or detect_image_format(image_byte_array) == image_format:
+            return image_byte_array
+
+        with STAGE_DURATION.time(stage="encode"):
+            return convert_image_to_bytes(image, image_format,
+                                          self.get_encoding_quality(image_format, degradation_level))
 
     def detect_faces(self, image: np.ndarray) -> List[Tuple[int, int, int, int]]:
         """ Detects all the faces in the input image.
@@ -86,10 +736,13 @@ class Googlifier:
             self.logger.info("Image is not a numpy array.")
             return []
 
+        if self.face_eyes_detector is not None:
+            return self.face_eyes_detector.detect_faces_and_eyes(image)[0]
         return self.face_detector.detect(image)
 
     def detect_eyes(self, image: np.ndarray, faces: List[Tuple[int, int, int, int]]) -> List[Tuple[int, int, int, int]]:
-        """ Detects the eyes in each detected face.
+        """ Detects the eyes in each detected face. When the combined face and eyes detector is configured the faces are
+        ignored and the eyes of all the faces it finds are returned.
 
         Args:
             image: The input image as a numpy array in the RGB colorspace.
@@ -98,4 +751,19 @@ class Googlifier:
         Returns: A list made out of tuples representing the coordinates of an eye in the format (x, y, width, height).
                  If no eyes are detected an empty list is returned.
         """
+        if self.face_eyes_detector is not None:
+            return self.face_eyes_detector.detect_faces_and_eyes(image)[1]
         return self.eyes_detector.detect(image, faces)
+
+    def estimate_eyes(self, faces: List[Tuple[int, int, int, int]]) -> List[Tuple[int, int, int, int]]:
+        """ Estimates the eyes of each face from the proportions of its box, without running the eyes detector.
+
+        Args:
+            faces: List made out of the coordinates of each face in the format: (x, y, width, height).
+
+        Returns: A list made out of tuples representing the coordinates of an eye in the format (x, y, width, height),
+                 with the two eyes of each face one after the other.
+        """
+        eye_keypoints = estimate_eye_keypoints(faces, GEOMETRIC_EYE_X_RATIOS, GEOMETRIC_EYE_Y_RATIO)
+        eyes = eye_keypoints_to_boxes(eye_keypoints, GEOMETRIC_EYE_WIDTH_RATIO, GEOMETRIC_EYE_HEIGHT_RATIO)
+        return [tuple(int(value) for value in eye) for eye in eyes]
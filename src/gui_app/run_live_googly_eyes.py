@@ -2,8 +2,8 @@
 This is an app to run the googlifier class locally and in realtime using the webcam.
 """
 
+import time
 import cv2 as cv
-import numpy as np
 
 from googlifier import Googlifier
 from constants import *
@@ -15,6 +15,9 @@ if cap.isOpened is False:
     exit(0)
 
 googly = Googlifier(CONFIG_FILE_PATH)
+eye_tracker = googly.create_eye_tracker()
+fps = 0.0
+last_frame_time = time.perf_counter()
 
 while True:
     ret, frame = cap.read()
@@ -22,19 +25,17 @@ while True:
         print('No captured frame.')
         break
 
-    # Preprocess frame
-    _, image_png = cv.imencode(".png", frame)
-    image_byte_array = image_png.tobytes()
+    # Add googly eyes, the frame is passed directly without encoding it
+    frame = googly.googlify_frame(frame, eye_tracker)
 
-    # Add googly eyes
-    _, frame = googly.detect_eyes_and_googlify(image_byte_array)
-
-    # Postprocess frame
-    image_numpy_array = np.frombuffer(frame, np.uint8)
-    frame = cv.imdecode(image_numpy_array, cv.IMREAD_COLOR)
+    # Show a smoothed estimate of the frames per second
+    now = time.perf_counter()
+    fps = 0.9 * fps + 0.1 / max(now - last_frame_time, 1e-6)
+    last_frame_time = now
+    cv.putText(frame, "%.1f FPS" % fps, (10, 30), cv.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
 
     # Display result
     cv.imshow('Googly eyes', frame)
 
-    if cv.waitKey(10) == 27:
+    if cv.waitKey(1) == 27:
         break
@@ -1,10 +1,68 @@
-from typing import List, Tuple
+from typing import List, Tuple, Union, NamedTuple
+import functools
 import cv2 as cv
 import numpy as np
-import random
+import struct
 
+# OpenCV flags used to set the quality of the encoding of each image format
+ENCODE_QUALITY_FLAGS = {".jpg": cv.IMWRITE_JPEG_QUALITY, ".webp": cv.IMWRITE_WEBP_QUALITY,
+                        ".png": cv.IMWRITE_PNG_COMPRESSION}
 
-def draw_googly_eyes_on_image(eyes: List[Tuple[int, int, int, int]], image: np.ndarray) -> np.ndarray:
+# OpenCV flags used to decode an image reduced by each factor
+DECODE_REDUCTION_FLAGS = {1: cv.IMREAD_COLOR, 2: cv.IMREAD_REDUCED_COLOR_2, 4: cv.IMREAD_REDUCED_COLOR_4,
+                          8: cv.IMREAD_REDUCED_COLOR_8}
+
+# JPEG markers that are not followed by the length of a segment and the ones of the start of frame segments
+JPEG_MARKERS_WITHOUT_LENGTH = [0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7, 0xD8]
+JPEG_START_OF_FRAME_MARKERS = [0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF]
+
+# The googly eye sprites are rasterized for radii with at most this number of significant bits, so radii up to 63 pixels
+# are exact and larger ones are rounded by less than 1/64 of the radius
+SPRITE_RADIUS_BITS = 6
+
+# Width of the black outline of the googly eyes in pixels
+EYE_OUTLINE_WIDTH = 2
+
+
+class GooglyEye(NamedTuple):
+    """ The parameters of a googly eye drawn on top of an eye. """
+    eye_center: Tuple[int, int]
+    eye_radius: int
+    pupil_center: Tuple[int, int]
+    pupil_radius: int
+
+
+def generate_googly_eyes(eyes: List[Tuple[int, int, int, int]], rng: Union[np.random.Generator, None] = None) \
+        -> List[GooglyEye]:
+    """ Generates the googly eyes for the detected eyes. The googly eyes have a fixed size in regard to the size of the
+    detected bounding box and the pupil has a random position and size within the eye.
+
+    Args:
+        eyes: A list made out of tuples representing the coordinates of an eye in the format (x, y, width, height).
+        rng: The random generator of the pupils. A seeded generator gives the same googly eyes on every call, if None
+             a new unseeded generator is used.
+
+    Returns: A list with the googly eye corresponding to each eye.
+    """
+    if not eyes:
+        return []
+    if rng is None:
+        rng = np.random.default_rng()
+
+    boxes = np.array(eyes, dtype=np.int64).reshape(-1, 4)
+    eye_centers = boxes[:, 0:2] + boxes[:, 2:4] // 2
+    radii = np.round((boxes[:, 2] + boxes[:, 3]) * 0.75).astype(np.int64)
+    half_pupil_sizes = (radii * rng.uniform(0.45, 1, len(boxes))).astype(np.int64) // 2
+    pupil_centers = eye_centers + rng.integers(-half_pupil_sizes[:, None], half_pupil_sizes[:, None], endpoint=True,
+                                               size=(len(boxes), 2))
+
+    return [GooglyEye((int(eye_x), int(eye_y)), int(radius), (int(pupil_x), int(pupil_y)), int(half_pupil_size))
+            for (eye_x, eye_y), radius, (pupil_x, pupil_y), half_pupil_size
+            in zip(eye_centers, radii, pupil_centers, half_pupil_sizes)]
+
+
+def draw_googly_eyes_on_image(eyes: List[Tuple[int, int, int, int]], image: np.ndarray,
+                              rng: Union[np.random.Generator, None] = None) -> np.ndarray:
     """ Draws the googly eyes on top of the detected eyes in the image. The googly eyes are drawn with a fixed size
     in regard to the size of the detected bounding box and the pupil is drawn with a random position and size within
     the eye.
@@ -12,44 +70,285 @@ def draw_googly_eyes_on_image(eyes: List[Tuple[int, int, int, int]], image: np.n
     Args:
         eyes: A list made out of tuples representing the coordinates of an eye in the format (x, y, width, height).
         image: The input image as a numpy array in the RGB colorspace.
+        rng: The random generator of the pupils. If None a new unseeded generator is used.
 
     Returns: An image with googly eyes drawn on top of the detected eyes as a numpy array in the BGR colorspace.
              If eyes is an empty list the input image is returned without changes.
     """
-    for eye_coordinates in eyes:
-        x, y, w, h = eye_coordinates
-        eye_center = (x + w // 2, y + h // 2)
-        radius = int(round((w + h) * 0.75))
-        image = cv.circle(image, eye_center, radius, (255, 255, 255), cv.FILLED)
-        image = cv.circle(image, eye_center, radius, (0, 0, 0), 2)
-        pupil_size = int(radius * random.uniform(0.45, 1))
-        half_pupil_size = int(pupil_size / 2)
-        pupil_center = (
-            eye_center[0] + random.randint(-half_pupil_size, half_pupil_size),
-            eye_center[1] + random.randint(-half_pupil_size, half_pupil_size))
-        image = cv.circle(image, pupil_center, half_pupil_size, (0, 0, 0), cv.FILLED)
+    return render_googly_eyes(generate_googly_eyes(eyes, rng), image)
+
+
+def render_googly_eyes(googly_eyes: List[GooglyEye], image: np.ndarray) -> np.ndarray:
+    """ Draws the given googly eyes on the image. The eyes and pupils are anti-aliased sprites, rasterized once for each
+    radius and blended in place into the image.
+
+    Args:
+        googly_eyes: A list with the parameters of each googly eye.
+        image: The input image as a numpy array in the BGR colorspace.
+
+    Returns: The image with the googly eyes drawn on top as a numpy array in the BGR colorspace.
+    """
+    channels = image.shape[2] if image.ndim == 3 else 1
+    for googly_eye in googly_eyes:
+        blend_sprite(image, googly_eye.eye_center, *get_eye_sprite(quantize_radius(googly_eye.eye_radius), channels))
+        blend_sprite(image, googly_eye.pupil_center,
+                     *get_pupil_sprite(quantize_radius(googly_eye.pupil_radius), channels))
 
     return image
 
 
-def convert_image_to_bytes(image_cv: np.ndarray) -> bytes:
+def get_googly_eyes_bounds(googly_eyes: List[GooglyEye]) -> List[Tuple[int, int, int, int]]:
+    """ Gets the regions of the image changed by render_googly_eyes.
+
+    Args:
+        googly_eyes: A list with the parameters of each googly eye.
+
+    Returns: A list with the coordinates of the sprites of each eye and pupil in the format (x, y, width, height).
+    """
+    bounds = []
+    for googly_eye in googly_eyes:
+        for (x, y), half_size in [(googly_eye.eye_center, quantize_radius(googly_eye.eye_radius) + EYE_OUTLINE_WIDTH),
+                                  (googly_eye.pupil_center, quantize_radius(googly_eye.pupil_radius) + 1)]:
+            bounds.append((x - half_size, y - half_size, 2 * half_size + 1, 2 * half_size + 1))
+    return bounds
+
+
+def quantize_radius(radius: int) -> int:
+    """ Rounds a radius to the radii of the sprites, keeping its SPRITE_RADIUS_BITS most significant bits, so a bounded
+    number of sprites is rasterized.
+
+    Args:
+        radius: The radius in pixels.
+
+    Returns: The rounded radius.
+    """
+    radius = max(int(radius), 0)
+    shift = max(radius.bit_length() - SPRITE_RADIUS_BITS, 0)
+    return ((radius + ((1 << shift) >> 1)) >> shift) << shift
+
+
+@functools.lru_cache(maxsize=512)
+def get_eye_sprite(radius: int, channels: int = 3) -> Tuple[np.ndarray, np.ndarray]:
+    """ Rasterizes the sprite of a googly eye, a white disk with a black outline, with anti-aliased edges.
+
+    Args:
+        radius: The radius of the eye in pixels.
+        channels: The number of channels of the images where the sprite is drawn.
+
+    Returns: A tuple with the color multiplied by the opacity and the transparency of each pixel, from 0 to 255, as
+             square uint8 arrays centered on the eye. The arrays are shared and read only.
+    """
+    distances = get_sprite_distances(radius + EYE_OUTLINE_WIDTH)
+    # The outline is centered on the radius, the white fill ends where it starts
+    opacity = np.clip(radius + EYE_OUTLINE_WIDTH / 2 + 0.5 - distances, 0, 1)
+    white = np.clip(radius - EYE_OUTLINE_WIDTH / 2 + 0.5 - distances, 0, 1)
+    return _to_sprite_array(white, channels), _to_sprite_array(1 - opacity, channels)
+
+
+@functools.lru_cache(maxsize=512)
+def get_pupil_sprite(radius: int, channels: int = 3) -> Tuple[None, np.ndarray]:
+    """ Rasterizes the sprite of a pupil, a black disk, with anti-aliased edges.
+
+    Args:
+        radius: The radius of the pupil in pixels.
+        channels: The number of channels of the images where the sprite is drawn.
+
+    Returns: A tuple with None, since the pupil is black, and the transparency of each pixel, from 0 to 255, as a square
+             uint8 array centered on the pupil. The array is shared and read only.
+    """
+    distances = get_sprite_distances(radius + 1)
+    opacity = np.clip(radius + 0.5 - distances, 0, 1)
+    return None, _to_sprite_array(1 - opacity, channels)
+
+
+def get_sprite_distances(half_size: int) -> np.ndarray:
+    """ Gets the distance of each pixel of a square sprite to its center pixel.
+
+    Args:
+        half_size: Number of pixels on each side of the center pixel.
+
+    Returns: Square float32 array with side 2 * half_size + 1.
+    """
+    coordinates = np.arange(-half_size, half_size + 1, dtype=np.float32)
+    return np.hypot(coordinates[None, :], coordinates[:, None])
+
+
+def blend_sprite(image: np.ndarray, center: Tuple[int, int], premultiplied_color: Union[np.ndarray, None],
+                 transparency: np.ndarray):
+    """ Alpha-blends a sprite into the image in place, as image * transparency + premultiplied_color. The parts of the
+    sprite outside the image are skipped.
+
+    Args:
+        image: The image as a numpy array of type uint8.
+        center: The (x, y) coordinates of the image where the center of the sprite is placed.
+        premultiplied_color: The color of the sprite multiplied by its opacity, with the channels of the image. If None
+                             the sprite is black.
+        transparency: One minus the opacity of the sprite scaled to 255, with the channels of the image.
+    """
+    half_size = transparency.shape[0] // 2
+    x_start, y_start = center[0] - half_size, center[1] - half_size
+    image_x_start, image_y_start = max(x_start, 0), max(y_start, 0)
+    image_x_end = min(x_start + transparency.shape[1], image.shape[1])
+    image_y_end = min(y_start + transparency.shape[0], image.shape[0])
+    if image_x_end <= image_x_start or image_y_end <= image_y_start:
+        return
+
+    sprite_rows = slice(image_y_start - y_start, image_y_end - y_start)
+    sprite_columns = slice(image_x_start - x_start, image_x_end - x_start)
+    region = image[image_y_start:image_y_end, image_x_start:image_x_end]
+
+    # OpenCV writes the result into the view of the region, so the image is changed in place
+    if premultiplied_color is None:
+        cv.multiply(region, transparency[sprite_rows, sprite_columns], dst=region, scale=1 / 255)
+        return
+    blended = cv.multiply(region, transparency[sprite_rows, sprite_columns], scale=1 / 255)
+    cv.add(blended, premultiplied_color[sprite_rows, sprite_columns], dst=region)
+
+
+def convert_image_to_bytes(image_cv: np.ndarray, image_format: str = ".png", quality: Union[int, None] = None) -> bytes:
     """ Converts an image to bytes.
 
     Args:
         image_cv: The input image to be converted.
+        image_format: The file extension of the format used to encode the image, one of ".png", ".jpg" or ".webp".
+        quality: The quality of the encoding from 0 to 100 for ".jpg" and ".webp" or the compression level from 0 to 9
+                 for ".png". If None the OpenCV default is used.
 
     Returns: The image as bytes type.
     """
-    return cv.imencode(".png", image_cv)[1].tobytes()
+    params = []
+    if quality is not None:
+        params = [ENCODE_QUALITY_FLAGS[image_format], int(quality)]
+    return cv.imencode(image_format, image_cv, params)[1].tobytes()
+
+
+def detect_image_format(image_byte_array: bytes) -> Union[str, None]:
+    """ Detects the format of an encoded image from its first bytes.
+
+    Args:
+        image_byte_array: The bytes image, or any bytes-like object such as a memory-mapped file.
 
+    Returns: The file extension of the image format, one of ".png", ".jpg" or ".webp". None if the format is not
+             supported.
+    """
+    if image_byte_array[:3] == b"\xff\xd8\xff":
+        return ".jpg"
+    if image_byte_array[:8] == b"\x89PNG\r\n\x1a\n":
+        return ".png"
+    if image_byte_array[:4] == b"RIFF" and image_byte_array[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+
+def read_image_size(image_byte_array: bytes) -> Union[Tuple[int, int], None]:
+    """ Reads the size of an encoded image from its header, without decoding it.
+
+    Args:
+        image_byte_array: The bytes image.
 
-def convert_bytes_to_image(image_byte_array: bytes) -> np.ndarray:
+    Returns: A tuple with the (width, height) of the image as stored in the file, that is, before applying any EXIF
+             orientation. None if the format is not supported or the header could not be read.
+    """
+    image_format = detect_image_format(image_byte_array)
+    try:
+        if image_format == ".png":
+            width, height = struct.unpack(">II", image_byte_array[16:24])
+            return width, height
+
+        if image_format == ".jpg":
+            # Walk through the JPEG segments until the start of frame segment, which has the image size
+            position = 2
+            while position + 9 <= len(image_byte_array):
+                if image_byte_array[position] != 0xFF:
+                    return None
+                marker = image_byte_array[position + 1]
+                if marker == 0xFF:
+                    position += 1
+                    continue
+                if marker in JPEG_MARKERS_WITHOUT_LENGTH:
+                    position += 2
+                    continue
+                if marker in JPEG_START_OF_FRAME_MARKERS:
+                    height, width = struct.unpack(">HH", image_byte_array[position + 5:position + 9])
+                    return width, height
+                segment_length = struct.unpack(">H", image_byte_array[position + 2:position + 4])[0]
+                position += 2 + segment_length
+            return None
+
+        if image_format == ".webp":
+            chunk = image_byte_array[12:16]
+            if chunk == b"VP8 ":
+                width, height = struct.unpack("<HH", image_byte_array[26:30])
+                return width & 0x3FFF, height & 0x3FFF
+            if chunk == b"VP8L":
+                bits = struct.unpack("<I", image_byte_array[21:25])[0]
+                return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+            if chunk == b"VP8X":
+                width = int.from_bytes(image_byte_array[24:27], "little") + 1
+                height = int.from_bytes(image_byte_array[27:30], "little") + 1
+                return width, height
+    except struct.error:
+        return None
+
+    return None
+
+
+def get_decode_reduction(image_size: Union[Tuple[int, int], None], max_size: int) -> int:
+    """ Gets the largest reduction factor that can be used to decode an image while keeping its largest side at least
+    as large as max_size.
+
+    Args:
+        image_size: Tuple with the (width, height) of the image. If None no reduction is used.
+        max_size: The minimum size of the largest side of the decoded image.
+
+    Returns: The reduction factor, one of 1, 2, 4 or 8.
+    """
+    if image_size is None:
+        return 1
+
+    for reduction in [8, 4, 2]:
+        if max(image_size) // reduction >= max_size:
+            return reduction
+    return 1
+
+
+def downscale_image(image: np.ndarray, max_size: int) -> Tuple[np.ndarray, float]:
+    """ Downscales an image so that its largest side is not larger than max_size. Images that are already small
+    enough are returned without changes.
+
+    Args:
+        image: The input image as a numpy array.
+        max_size: The maximum size of the largest side of the image.
+
+    Returns: A tuple with the downscaled image and the scale factor that was applied to it.
+    """
+    height, width = image.shape[:2]
+    scale = max_size / max(height, width)
+    if scale >= 1:
+        return image, 1.0
+
+    size = (max(int(round(width * scale)), 1), max(int(round(height * scale)), 1))
+    return cv.resize(image, size, interpolation=cv.INTER_AREA), scale
+
+
+def convert_bytes_to_image(image_byte_array: bytes, reduction: int = 1) -> np.ndarray:
     """ Converts an image as type bytes into a numpy array with BGR colorspace.
 
     Args:
         image_byte_array: The bytes image to be converted.
+        reduction: Factor by which the image is reduced while decoding, one of 1, 2, 4 or 8. For JPEG images the
+                   reduction is done by the decoder itself, which is much faster than decoding the full image.
 
     Returns: Converted image in numpy array format.
     """
     image_numpy_array = np.frombuffer(image_byte_array, np.uint8)
-    return cv.imdecode(image_numpy_array, cv.IMREAD_COLOR)
+    return cv.imdecode(image_numpy_array, DECODE_REDUCTION_FLAGS[reduction])
+
+
+# Auxiliary functions
+def _to_sprite_array(values: np.ndarray, channels: int) -> np.ndarray:
+    array = np.round(values * 255).astype(np.uint8)
+    if channels > 1:
+        array = np.repeat(array[:, :, None], channels, axis=2)
+    array.flags.writeable = False
+    return array
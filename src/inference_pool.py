@@ -0,0 +1,114 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, TypeVar, Union
+
+T = TypeVar("T")
+
+
+class PoolSaturatedError(Exception):
+    """ Raised when the inference pool cannot admit more work. """
+
+
+class InferencePool:
+    """ Class that runs blocking inference work outside the event loop. Each thread of the pool owns its own worker
+    object (e.g. a Googlifier) since the OpenCV models cannot be safely shared between threads. The number of
+    requests admitted (running plus waiting) is bounded so that saturation is reported instead of queued forever.
+    """
+
+    def __init__(self, worker_factory: Callable[[], Any], max_workers: int, max_queue_size: int,
+                 preloaded_workers: Union[List[Any], None] = None):
+        """
+        Args:
+            worker_factory: Callable that creates the per-thread worker object passed to the submitted functions.
+            max_workers: Number of threads running inference concurrently.
+            max_queue_size: Number of requests allowed to wait for a free thread before rejecting new ones.
+            preloaded_workers: Worker objects already created, which are handed to the first threads of the pool
+                               instead of creating new ones.
+        """
+        self.worker_factory = worker_factory
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self.in_flight = 0
+        self._preloaded_workers = list(preloaded_workers or [])
+        self._preloaded_workers_lock = threading.Lock()
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+
+    def _get_worker(self) -> Any:
+        """ Gets the worker object of the current thread, creating it on the first call.
+
+        Returns: The worker object owned by the current thread.
+        """
+        worker = getattr(self._local, "worker", None)
+        if worker is None:
+            with self._preloaded_workers_lock:
+                worker = self._preloaded_workers.pop() if self._preloaded_workers else None
+            if worker is None:
+                worker = self.worker_factory()
+            self._local.worker = worker
+        return worker
+
+    def _call(self, function: Callable[[Any], T]) -> T:
+        return function(self._get_worker())
+
+    def submit(self, function: Callable[[Any], T]) -> "asyncio.Future[T]":
+        """ Starts running a function in one of the threads of the pool. Unlike run, the admission to the pool is
+        decided before returning, which allows to report the saturation before starting a streamed response.
+
+        Args:
+            function: Callable that receives the worker object of the thread it runs in.
+
+        Returns: A future with the value returned by the function.
+
+        Raises:
+            PoolSaturatedError: If the number of requests in flight already reached the pool capacity.
+        """
+        # The counter is only touched from the event loop, so it does not need a lock.
+        if self.in_flight >= self.max_workers + self.max_queue_size:
+            raise PoolSaturatedError("Inference pool is saturated.")
+
+        self.in_flight += 1
+        future = asyncio.get_running_loop().run_in_executor(self._executor, self._call, function)
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future: asyncio.Future):
+        self.in_flight -= 1
+
+    async def run(self, function: Callable[[Any], T]) -> T:
+        """ Runs a function in one of the threads of the pool without blocking the event loop.
+
+        Args:
+            function: Callable that receives the worker object of the thread it runs in.
+
+        Returns: The value returned by the function.
+
+        Raises:
+            PoolSaturatedError: If the number of requests in flight already reached the pool capacity.
+        """
+        return await self.submit(function)
+
+    def run_on_all_workers(self, function: Callable[[Any], T]) -> List[T]:
+        """ Runs a function once in each thread of the pool, creating the worker objects that do not exist yet. It
+        blocks until all of them are done, so it must not be called from the event loop. The calls are not admitted
+        like the requests, it is meant for work done before serving such as the warm-up of the models.
+
+        Args:
+            function: Callable that receives the worker object of the thread it runs in.
+
+        Returns: The value returned by the function in each thread.
+        """
+        # Every call waits until all the threads of the pool took one, so no thread runs two of them
+        barrier = threading.Barrier(self.max_workers)
+
+        def call_once() -> T:
+            barrier.wait()
+            return self._call(function)
+
+        futures = [self._executor.submit(call_once) for _ in range(self.max_workers)]
+        return [future.result() for future in futures]
+
+    def shutdown(self):
+        """ Stops the threads of the pool after the pending work is done. """
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,537 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import ipaddress
+import threading
+import urllib.parse
+import urllib.request
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Iterable, List, Tuple, Union
+
+import setup_logger
+from detectors.base_detector import load_class, get_field
+from metrics import JOBS, JOB_QUEUE_WAIT
+
+# Status of a job through its life
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Error of the images of a job that timed out in every one of its attempts
+TIMED_OUT_ERROR = "Processing timed out."
+
+# Seconds between the deletions of the expired jobs by each processor thread
+CLEANUP_INTERVAL = 60
+
+
+class NoRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """ Redirect handler that refuses the redirects, so a webhook can not send the status of a job to another host. """
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+# Opener of the webhooks, a redirect is reported as an HTTPError instead of being followed
+WEBHOOK_OPENER = urllib.request.build_opener(NoRedirectHandler)
+
+
+def is_webhook_allowed(url: str, allowed_hosts: Iterable[str]) -> bool:
+    """ Checks whether a webhook is an http or https url of one of the allowed hosts.
+
+    Args:
+        url: The url of the webhook.
+        allowed_hosts: The host names the webhooks can be sent to. If empty no webhook is allowed.
+
+    Returns: Whether the webhook is allowed.
+    """
+    try:
+        parsed_url = urllib.parse.urlsplit(url)
+    except ValueError:
+        return False
+    if parsed_url.scheme.lower() not in ["http", "https"] or not parsed_url.hostname:
+        return False
+    return parsed_url.hostname.lower() in {host.lower() for host in allowed_hosts}
+
+
+def is_public_host(host: str, port: int) -> bool:
+    """ Checks whether all the addresses a host resolves to are public, so a webhook can not reach the loopback,
+    private, link-local or cloud metadata addresses of the machine running the processor.
+
+    Args:
+        host: The host name or address.
+        port: The port of the url.
+
+    Returns: Whether the host resolves and all its addresses are public.
+    """
+    try:
+        addresses = {address[4][0] for address in socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)}
+    except (OSError, UnicodeError):
+        return False
+    for address in addresses:
+        ip_address = ipaddress.ip_address(address.split("%")[0])
+        if isinstance(ip_address, ipaddress.IPv6Address) and ip_address.ipv4_mapped is not None:
+            ip_address = ip_address.ipv4_mapped
+        if not ip_address.is_global or ip_address.is_multicast:
+            return False
+    return bool(addresses)
+
+
+class JobBackend(ABC):
+    """ Interface of the queue of jobs, which also keeps their results until they expire. Each job is a list of input
+    images with some parameters, and each of its images gets either an output image or an error. """
+
+    @abstractmethod
+    def __init__(self, config: Dict):
+        self.config = config
+
+    @abstractmethod
+    def add(self, job_id: str, images: List[bytes], parameters: Dict[str, Any]):
+        """ Adds a job at the end of the queue. """
+
+    @abstractmethod
+    def count_pending(self) -> int:
+        """ Gets the number of jobs queued or running. """
+
+    @abstractmethod
+    def claim(self, job_timeout: float, max_attempts: int) \
+            -> Union[Tuple[str, List[bytes], Dict[str, Any], float, int], None]:
+        """ Takes the oldest queued job and marks it as running. Jobs that have been running for more than job_timeout
+        seconds are considered abandoned by a processor that died and are claimed again, unless they were already
+        claimed max_attempts times, in which case they fail.
+
+        Returns: A tuple with the id, the input images, the parameters, the creation time and the number of the attempt
+                 of the job or None if there are no queued jobs.
+        """
+
+    @abstractmethod
+    def finish(self, job_id: str, attempt: int, outputs: List[Union[bytes, None]],
+               errors: List[Union[str, None]]) -> bool:
+        """ Stores the results of a job and releases its input images. The job fails if none of its images succeeded.
+        The results are only stored if the job is still running the attempt that computed them, so a job claimed again
+        after a timeout is only finished once.
+
+        Returns: Whether the results were stored.
+        """
+
+    @abstractmethod
+    def get(self, job_id: str) -> Union[Dict[str, Any], None]:
+        """ Gets the status of a job.
+
+        Returns: A dictionary with the "id", "status", "created", "started", "finished", "parameters" and number of
+                 "images" of the job and, once it is finished, the "errors" of its images, or None if it does not
+                 exist.
+        """
+
+    @abstractmethod
+    def get_output(self, job_id: str, index: int) -> Union[bytes, None]:
+        """ Gets the output image of an image of a finished job, or None if it does not exist or failed. """
+
+    @abstractmethod
+    def delete_expired(self, max_age: float) -> int:
+        """ Deletes the jobs finished more than max_age seconds ago.
+
+        Returns: The number of deleted jobs.
+        """
+
+
+class MemoryJobBackend(JobBackend):
+    """ Class that keeps the jobs in the memory of the process. The jobs are only visible to the process that submitted
+    them, so it only works when the API runs in a single process that also processes the jobs. """
+
+    def __init__(self, config: Dict):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, job_id: str, images: List[bytes], parameters: Dict[str, Any]):
+        with self._lock:
+            self._jobs[job_id] = {"id": job_id, "status": QUEUED, "created": time.time(), "started": None,
+                                  "finished": None, "parameters": parameters, "images": len(images),
+                                  "inputs": images, "outputs": None, "errors": None, "attempts": 0}
+
+    def count_pending(self) -> int:
+        with self._lock:
+            return sum(job["status"] in [QUEUED, RUNNING] for job in self._jobs.values())
+
+    def claim(self, job_timeout: float, max_attempts: int) \
+            -> Union[Tuple[str, List[bytes], Dict[str, Any], float, int], None]:
+        now = time.time()
+        with self._lock:
+            # Dictionaries keep the insertion order, so the first claimable job is the oldest one
+            for job in self._jobs.values():
+                abandoned = job["status"] == RUNNING and job["started"] < now - job_timeout
+                if abandoned and job["attempts"] >= max_attempts:
+                    job.update(status=FAILED, finished=now, inputs=None, outputs=[None] * job["images"],
+                               errors=[TIMED_OUT_ERROR] * job["images"])
+                elif job["status"] == QUEUED or abandoned:
+                    job["status"] = RUNNING
+                    job["started"] = now
+                    job["attempts"] += 1
+                    return job["id"], job["inputs"], job["parameters"], job["created"], job["attempts"]
+        return None
+
+    def finish(self, job_id: str, attempt: int, outputs: List[Union[bytes, None]],
+               errors: List[Union[str, None]]) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] != RUNNING or job["attempts"] != attempt:
+                return False
+            job.update(status=DONE if any(error is None for error in errors) else FAILED, finished=time.time(),
+                       inputs=None, outputs=outputs, errors=errors)
+            return True
+
+    def get(self, job_id: str) -> Union[Dict[str, Any], None]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            status = {key: job[key] for key in ["id", "status", "created", "started", "finished", "parameters",
+                                                "images"]}
+            if job["errors"] is not None:
+                status["errors"] = list(job["errors"])
+            return status
+
+    def get_output(self, job_id: str, index: int) -> Union[bytes, None]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["outputs"] is None or not 0 <= index < len(job["outputs"]):
+                return None
+            return job["outputs"][index]
+
+    def delete_expired(self, max_age: float) -> int:
+        oldest = time.time() - max_age
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job["finished"] is not None and job["finished"] < oldest]
+            for job_id in expired:
+                del self._jobs[job_id]
+        return len(expired)
+
+
+class SqliteJobBackend(JobBackend):
+    """ Class that keeps the jobs in a sqlite file, as a local stand-in for a message broker, so that the jobs submitted
+    by any API worker can be processed by the processors of any process on the same machine. """
+
+    def __init__(self, config: Dict):
+        self.path = get_field(config, "path")
+        self._lock = threading.Lock()
+        self._connection = None
+        self._connection_pid = None
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """ Gets the connection to the sqlite file of the current process. A connection can not be used after forking,
+        so the worker processes open their own connection when the backend was created before forking them.
+
+        Returns: The connection.
+        """
+        with self._lock:
+            if self._connection_pid != os.getpid():
+                self._connection = sqlite3.connect(self.path, timeout=5, check_same_thread=False,
+                                                   isolation_level=None)
+                self._connection.execute("PRAGMA journal_mode=WAL")
+                self._connection.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, status TEXT, "
+                                         "created REAL, started REAL, finished REAL, parameters TEXT, images INTEGER, "
+                                         "attempts INTEGER)")
+                self._connection.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)")
+                self._connection.execute("CREATE TABLE IF NOT EXISTS job_images (job_id TEXT, image_index INTEGER, "
+                                         "input BLOB, output BLOB, error TEXT, PRIMARY KEY (job_id, image_index))")
+                self._connection_pid = os.getpid()
+            return self._connection
+
+    def add(self, job_id: str, images: List[bytes], parameters: Dict[str, Any]):
+        connection = self._get_connection()
+        with self._lock:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.executemany("INSERT INTO job_images VALUES (?, ?, ?, NULL, NULL)",
+                                       [(job_id, index, image) for index, image in enumerate(images)])
+                connection.execute("INSERT INTO jobs VALUES (?, ?, ?, NULL, NULL, ?, ?, 0)",
+                                   (job_id, QUEUED, time.time(), json.dumps(parameters), len(images)))
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+    def count_pending(self) -> int:
+        connection = self._get_connection()
+        with self._lock:
+            return connection.execute("SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)",
+                                      (QUEUED, RUNNING)).fetchone()[0]
+
+    def claim(self, job_timeout: float, max_attempts: int) \
+            -> Union[Tuple[str, List[bytes], Dict[str, Any], float, int], None]:
+        connection = self._get_connection()
+        now = time.time()
+        with self._lock:
+            # The immediate transaction takes the write lock, so two processors never claim the same job
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                timed_out = [job_id for job_id, in connection.execute(
+                    "SELECT id FROM jobs WHERE status = ? AND started < ? AND attempts >= ?",
+                    (RUNNING, now - job_timeout, max_attempts))]
+                connection.executemany("UPDATE job_images SET input = NULL, error = ? WHERE job_id = ?",
+                                       [(TIMED_OUT_ERROR, job_id) for job_id in timed_out])
+                connection.executemany("UPDATE jobs SET status = ?, finished = ? WHERE id = ?",
+                                       [(FAILED, now, job_id) for job_id in timed_out])
+
+                row = connection.execute("SELECT id, parameters, created, attempts FROM jobs WHERE status = ? OR "
+                                         "(status = ? AND started < ?) ORDER BY created LIMIT 1",
+                                         (QUEUED, RUNNING, now - job_timeout)).fetchone()
+                if row is not None:
+                    connection.execute("UPDATE jobs SET status = ?, started = ?, attempts = ? WHERE id = ?",
+                                       (RUNNING, now, row[3] + 1, row[0]))
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            if row is None:
+                return None
+            images = [image for image, in connection.execute(
+                "SELECT input FROM job_images WHERE job_id = ? ORDER BY image_index", (row[0],))]
+        return row[0], images, json.loads(row[1]), row[2], row[3] + 1
+
+    def finish(self, job_id: str, attempt: int, outputs: List[Union[bytes, None]],
+               errors: List[Union[str, None]]) -> bool:
+        connection = self._get_connection()
+        status = DONE if any(error is None for error in errors) else FAILED
+        with self._lock:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                # The job is only finished by the attempt it is running, the results of a previous one are dropped
+                finished = connection.execute("UPDATE jobs SET status = ?, finished = ? WHERE id = ? AND status = ? "
+                                              "AND attempts = ?",
+                                              (status, time.time(), job_id, RUNNING, attempt)).rowcount == 1
+                if finished:
+                    connection.executemany("UPDATE job_images SET input = NULL, output = ?, error = ? "
+                                           "WHERE job_id = ? AND image_index = ?",
+                                           [(output, error, job_id, index)
+                                            for index, (output, error) in enumerate(zip(outputs, errors))])
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        return finished
+
+    def get(self, job_id: str) -> Union[Dict[str, Any], None]:
+        connection = self._get_connection()
+        with self._lock:
+            row = connection.execute("SELECT id, status, created, started, finished, parameters, images FROM jobs "
+                                     "WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            status = dict(zip(["id", "status", "created", "started", "finished", "parameters", "images"], row))
+            status["parameters"] = json.loads(status["parameters"])
+            if status["status"] in [DONE, FAILED]:
+                status["errors"] = [error for error, in connection.execute(
+                    "SELECT error FROM job_images WHERE job_id = ? ORDER BY image_index", (job_id,))]
+        return status
+
+    def get_output(self, job_id: str, index: int) -> Union[bytes, None]:
+        connection = self._get_connection()
+        with self._lock:
+            row = connection.execute("SELECT output FROM job_images WHERE job_id = ? AND image_index = ?",
+                                     (job_id, index)).fetchone()
+        return None if row is None else row[0]
+
+    def delete_expired(self, max_age: float) -> int:
+        connection = self._get_connection()
+        with self._lock:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                expired = [job_id for job_id, in connection.execute(
+                    "SELECT id FROM jobs WHERE finished < ?", (time.time() - max_age,))]
+                connection.executemany("DELETE FROM job_images WHERE job_id = ?", [(job_id,) for job_id in expired])
+                connection.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in expired])
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        return len(expired)
+
+
+def create_job_id() -> str:
+    """ Creates the id of a new job.
+
+    Returns: A random id.
+    """
+    return uuid.uuid4().hex
+
+
+def get_job_backend(config: Dict) -> JobBackend:
+    """ Creates the job backend of a jobs configuration.
+
+    Args:
+        config: Dictionary with the "jobs" section of the config file.
+
+    Returns: The job backend.
+    """
+    return load_class(get_field(config, "backend_class"))(get_field(config, "backend_parameters", default={}))
+
+
+def googlify_job(googlifier: Any, images: List[bytes], parameters: Dict[str, Any]) \
+        -> Tuple[List[Union[bytes, None]], List[Union[str, None]]]:
+    """ Draws the googly eyes on the images of a job.
+
+    Args:
+        googlifier: The Googlifier of the current thread.
+        images: The input images of the job.
+        parameters: The parameters of the job, with the file extension of the output "format" or None for PNG.
+
+    Returns: A tuple with the list of output images and the list of errors, None for the images that succeeded.
+    """
+    outputs: List[Union[bytes, None]] = [None] * len(images)
+    errors: List[Union[str, None]] = ["Corrupt input file."] * len(images)
+    for index, success, output in googlifier.detect_eyes_and_googlify_many(images, parameters.get("format")):
+        if success:
+            outputs[index], errors[index] = output, None
+    return outputs, errors
+
+
+class JobProcessor:
+    """ Class that processes the jobs of a job backend with a pool of threads, each with its own worker object (e.g. a
+    Googlifier) since the OpenCV models cannot be safely shared between threads. The threads poll the backend, so the
+    processors can run in the API workers or in separate processes scaled independently of them. """
+
+    def __init__(self, backend: JobBackend, worker_factory: Callable[[], Any],
+                 process_job: Callable[[Any, List[bytes], Dict[str, Any]],
+                                       Tuple[List[Union[bytes, None]], List[Union[str, None]]]],
+                 processors: int, poll_interval: float, job_timeout: float, max_attempts: int, result_ttl: float,
+                 webhook_timeout: float, webhook_hosts: Iterable[str] = ()):
+        """
+        Args:
+            backend: The backend with the queue of jobs.
+            worker_factory: Callable that creates the per-thread worker object passed to process_job.
+            process_job: Callable that receives a worker object, the input images and the parameters of a job and
+                         returns the list of output images and the list of errors, None for the images that succeeded.
+            processors: Number of threads processing jobs.
+            poll_interval: Seconds waited before polling the backend again when there are no queued jobs.
+            job_timeout: Seconds after which a running job is considered abandoned and is processed again.
+            max_attempts: Number of times a job is processed before it fails when it keeps being abandoned.
+            result_ttl: Seconds the results of a job are kept after it finishes.
+            webhook_timeout: Seconds waited for the webhook of a job to answer.
+            webhook_hosts: The host names the webhooks can be sent to. If empty the webhooks are never called.
+        """
+        self.backend = backend
+        self.worker_factory = worker_factory
+        self.process_job = process_job
+        self.processors = processors
+        self.poll_interval = poll_interval
+        self.job_timeout = job_timeout
+        self.max_attempts = max_attempts
+        self.result_ttl = result_ttl
+        self.webhook_timeout = webhook_timeout
+        self.webhook_hosts = list(webhook_hosts)
+        self.logger = logging.getLogger(setup_logger.LOGGER_NAME)
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        """ Starts the threads that process the jobs. """
+        self._stop.clear()
+        for index in range(self.processors):
+            thread = threading.Thread(target=self._run, name="job-processor-" + str(index), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """ Stops the threads after the jobs being processed are done. """
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _run(self):
+        worker = None
+        last_cleanup = 0.0
+        while not self._stop.is_set():
+            try:
+                job = self.backend.claim(self.job_timeout, self.max_attempts)
+                if job is None:
+                    if time.monotonic() - last_cleanup > CLEANUP_INTERVAL:
+                        self.backend.delete_expired(self.result_ttl)
+                        last_cleanup = time.monotonic()
+                    self._stop.wait(self.poll_interval)
+                    continue
+
+                if worker is None:
+                    worker = self.worker_factory()
+                self.run_job(worker, *job)
+            except Exception as e:
+                self.logger.info("Error processing the job queue: " + repr(e))
+                self._stop.wait(self.poll_interval)
+
+    def run_job(self, worker: Any, job_id: str, images: List[bytes], parameters: Dict[str, Any], created: float,
+                attempt: int):
+        """ Processes a claimed job, stores its results and calls its webhook. If the job was claimed again by another
+        processor in the meantime its results are dropped and the webhook is left to that processor.
+
+        Args:
+            worker: The worker object of the current thread.
+            job_id: The id of the job.
+            images: The input images of the job.
+            parameters: The parameters of the job.
+            created: The time the job was submitted.
+            attempt: The number of the attempt of the job, given by the claim.
+        """
+        JOB_QUEUE_WAIT.observe(max(time.time() - created, 0.0))
+        try:
+            outputs, errors = self.process_job(worker, images, parameters)
+        except Exception as e:
+            self.logger.info("Error processing the job " + job_id + ": " + repr(e))
+            outputs, errors = [None] * len(images), ["Processing failed."] * len(images)
+
+        if not self.backend.finish(job_id, attempt, outputs, errors):
+            self.logger.info("The job " + job_id + " was claimed again after a timeout, its results are dropped.")
+            return
+        status = self.backend.get(job_id)
+        JOBS.inc(status=status["status"] if status is not None else FAILED)
+
+        webhook = parameters.get("webhook")
+        if webhook and status is not None:
+            self.call_webhook(webhook, status)
+
+    def call_webhook(self, url: str, status: Dict[str, Any]):
+        """ Sends the status of a finished job as JSON to its webhook. The webhook is only called when its host is one
+        of webhook_hosts and resolves to public addresses, and redirects are not followed. Failures are only logged,
+        the client can still poll the status of the job.
+
+        Args:
+            url: The url of the webhook.
+            status: The status of the job.
+        """
+        try:
+            parsed_url = urllib.parse.urlsplit(url)
+            port = parsed_url.port or (443 if parsed_url.scheme.lower() == "https" else 80)
+            if not is_webhook_allowed(url, self.webhook_hosts) or not is_public_host(parsed_url.hostname, port):
+                self.logger.info("Refused to call the webhook of the job " + status["id"] + ": " + url)
+                return
+
+            request = urllib.request.Request(url, data=json.dumps(status).encode(), method="POST",
+                                             headers={"Content-Type": "application/json"})
+            with WEBHOOK_OPENER.open(request, timeout=self.webhook_timeout):
+                pass
+        except Exception as e:
+            self.logger.info("Error calling the webhook of the job " + status["id"] + ": " + repr(e))
+
+
+def get_job_processor(config: Dict, worker_factory: Callable[[], Any], processors: int) -> JobProcessor:
+    """ Creates a processor of the jobs of a jobs configuration that draws the googly eyes with googlify_job.
+
+    Args:
+        config: Dictionary with the "jobs" section of the config file.
+        worker_factory: Callable that creates the Googlifier of each thread.
+        processors: Number of threads processing jobs.
+
+    Returns: The job processor, which has to be started.
+    """
+    return JobProcessor(get_job_backend(config), worker_factory, googlify_job, processors,
+                        poll_interval=get_field(config, "poll_interval"),
+                        job_timeout=get_field(config, "job_timeout"),
+                        max_attempts=get_field(config, "max_attempts"),
+                        result_ttl=get_field(config, "result_ttl"),
+                        webhook_timeout=get_field(config, "webhook_timeout"),
+                        webhook_hosts=get_field(config, "webhook_hosts", default=[]))
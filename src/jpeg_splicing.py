@@ -0,0 +1,491 @@
+"""
+Re-encoding of only the parts of a JPEG image that changed. The entropy-coded data of a baseline JPEG image with restart
+markers is split in restart intervals of a fixed number of MCUs (the minimum coded units, blocks of 8x8 to 16x16 pixels)
+that are decoded independently from each other. After drawing the googly eyes only the intervals that overlap them are
+encoded again, with the quantization and Huffman tables of the input, and the rest of the compressed data is copied
+unchanged. That is much faster than encoding the whole image, keeps the size and the metadata of the input and avoids
+the generation loss of a full re-encode everywhere but around the eyes.
+"""
+
+import struct
+from typing import Dict, List, NamedTuple, Tuple, Union
+
+import cv2 as cv
+import numpy as np
+
+# Index in the block, in row-major order, of each of the 64 coefficients in the zigzag order in which they are stored
+ZIGZAG_ORDER = np.array([0, 1, 8, 16, 9, 2, 3, 10, 17, 24, 32, 25, 18, 11, 4, 5, 12, 19, 26, 33, 40, 48, 41, 34, 27,
+                         20, 13, 6, 7, 14, 21, 28, 35, 42, 49, 56, 57, 50, 43, 36, 29, 22, 15, 23, 30, 37, 44, 51, 58,
+                         59, 52, 45, 38, 31, 39, 46, 53, 60, 61, 54, 47, 55, 62, 63])
+
+# Orthonormal 8x8 DCT matrix, DCT_MATRIX @ block @ DCT_MATRIX.T is the forward DCT of the JPEG standard. As a 64x64
+# matrix applied to the flattened blocks, with its rows in zigzag order, the DCT of many blocks is a single product
+DCT_MATRIX = np.array([[np.sqrt((1 if u == 0 else 2) / 8) * np.cos((2 * x + 1) * u * np.pi / 16) for x in range(8)]
+                       for u in range(8)])
+ZIGZAG_DCT_MATRIX = np.kron(DCT_MATRIX, DCT_MATRIX)[ZIGZAG_ORDER]
+
+# Start of frame markers of the baseline and extended sequential Huffman-coded images, the only ones that are spliced
+JPEG_SEQUENTIAL_HUFFMAN_MARKERS = [0xC0, 0xC1]
+
+# Marker of the end of the image, the only one other than the restart markers expected after the scan
+JPEG_END_OF_IMAGE_MARKER = 0xD9
+
+# The MCUs are encoded about 40 times slower with numpy than by OpenCV, so above this fraction of the MCUs of the image
+# to encode again it is faster to encode the whole image
+MAX_SPLICED_FRACTION = 0.025
+
+
+class JpegComponent(NamedTuple):
+    """ A color component of a JPEG image and the tables of its scan. """
+    horizontal_sampling: int
+    vertical_sampling: int
+    quantization_table: int
+    dc_table: int
+    ac_table: int
+
+
+class JpegLayout(NamedTuple):
+    """ The header of a JPEG image needed to encode parts of its entropy-coded data. """
+    width: int
+    height: int
+    components: List[JpegComponent]
+    quantization_tables: Dict[int, np.ndarray]
+    huffman_tables: Dict[Tuple[int, int], Tuple[np.ndarray, np.ndarray]]
+    restart_interval: int
+    scan_start: int
+
+
+def encode_jpeg_regions(image_byte_array: bytes, image: np.ndarray, regions: List[Tuple[int, int, int, int]]) \
+        -> Union[bytes, None]:
+    """ Encodes a changed version of a JPEG image by encoding again only the restart intervals that overlap the changed
+    regions and copying the rest of the input.
+
+    Args:
+        image_byte_array: The input JPEG image as a byte array.
+        image: The decoded input image as a numpy array in the BGR color space, with the changes.
+        regions: The regions of the image that changed in the format (x, y, width, height).
+
+    Returns: The output JPEG image as bytes. None if the input can not be spliced, because it is not a baseline JPEG
+             with restart markers, it is rotated by its EXIF orientation or too much of it changed, in which case the
+             image has to be encoded as a whole.
+    """
+    try:
+        layout = read_jpeg_layout(image_byte_array)
+    except (struct.error, IndexError, KeyError, ValueError):
+        return None
+    if layout is None or image.shape[:2] != (layout.height, layout.width):
+        return None
+
+    segments = split_restart_intervals(image_byte_array, layout)
+    if segments is None:
+        return None
+
+    mcu_width, mcu_height, mcus_per_row = get_mcu_size(layout)
+    changed_intervals = set()
+    for x, y, width, height in regions:
+        x_start, y_start = max(x, 0), max(y, 0)
+        x_end, y_end = min(x + width, layout.width), min(y + height, layout.height)
+        if x_end <= x_start or y_end <= y_start:
+            continue
+        columns = np.arange(x_start // mcu_width, (x_end - 1) // mcu_width + 1)
+        rows = np.arange(y_start // mcu_height, (y_end - 1) // mcu_height + 1)
+        changed_intervals.update((rows[:, None] * mcus_per_row + columns).ravel() // layout.restart_interval)
+
+    if not changed_intervals:
+        return bytes(image_byte_array)
+    if len(changed_intervals) > MAX_SPLICED_FRACTION * len(segments):
+        return None
+
+    changed_intervals = sorted(changed_intervals)
+    entropy_data = encode_restart_intervals(image, layout, changed_intervals)
+    if entropy_data is None:
+        return None
+
+    # The data between the changed intervals, with their restart markers, is copied at once
+    parts = []
+    copied_until = 0
+    for index, interval_data in zip(changed_intervals, entropy_data):
+        parts += [image_byte_array[copied_until:segments[index][0]], interval_data]
+        copied_until = segments[index][1]
+    parts.append(image_byte_array[copied_until:])
+    return b"".join(parts)
+
+
+def read_jpeg_layout(image_byte_array: bytes) -> Union[JpegLayout, None]:
+    """ Reads the tables and the frame of a JPEG image from its header.
+
+    Args:
+        image_byte_array: The JPEG image as a byte array.
+
+    Returns: The layout of the image. None if it is not a single scan, sequential, Huffman-coded JPEG image with 8-bit
+             samples, in grayscale or YCbCr, with restart markers and without an EXIF orientation.
+    """
+    quantization_tables: Dict[int, np.ndarray] = {}
+    huffman_tables: Dict[Tuple[int, int], Tuple[np.ndarray, np.ndarray]] = {}
+    frame = None
+    restart_interval = 0
+    position = 2
+    while position + 4 <= len(image_byte_array):
+        if image_byte_array[position] != 0xFF:
+            return None
+        marker = image_byte_array[position + 1]
+        if marker == 0xFF:
+            position += 1
+            continue
+        segment_length = struct.unpack(">H", image_byte_array[position + 2:position + 4])[0]
+        segment = bytes(image_byte_array[position + 4:position + 2 + segment_length])
+        position += 2 + segment_length
+
+        if marker == 0xDB:
+            offset = 0
+            while offset < len(segment):
+                precision, table_id = segment[offset] >> 4, segment[offset] & 0x0F
+                value_type = ">u2" if precision else "u1"
+                values = np.frombuffer(segment, value_type, 64, offset + 1)
+                quantization_tables[table_id] = values.astype(np.float32)
+                offset += 1 + 64 * (2 if precision else 1)
+        elif marker == 0xC4:
+            offset = 0
+            while offset < len(segment):
+                table_class, table_id = segment[offset] >> 4, segment[offset] & 0x0F
+                counts = segment[offset + 1:offset + 17]
+                symbols = segment[offset + 17:offset + 17 + sum(counts)]
+                huffman_tables[(table_class, table_id)] = build_huffman_codes(counts, symbols)
+                offset += 17 + sum(counts)
+        elif marker == 0xDD:
+            restart_interval = struct.unpack(">H", segment[:2])[0]
+        elif marker == 0xE1:
+            if read_exif_orientation(segment) != 1:
+                return None
+        elif marker == 0xEE:
+            # The Adobe segment tells whether three components are YCbCr or RGB
+            if segment[:5] == b"Adobe" and len(segment) > 11 and segment[11] == 0:
+                return None
+        elif 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            if marker not in JPEG_SEQUENTIAL_HUFFMAN_MARKERS or segment[0] != 8:
+                return None
+            height, width, number_of_components = struct.unpack(">HHB", segment[1:6])
+            frame = (width, height, {segment[6 + 3 * i]: (segment[7 + 3 * i] >> 4, segment[7 + 3 * i] & 0x0F,
+                                                          segment[8 + 3 * i])
+                                     for i in range(number_of_components)})
+        elif marker == 0xDA:
+            if frame is None or restart_interval == 0:
+                return None
+            width, height, frame_components = frame
+            number_of_components = segment[0]
+            spectral_selection = segment[1 + 2 * number_of_components:4 + 2 * number_of_components]
+            if tuple(spectral_selection) != (0, 63, 0) or \
+                    number_of_components != len(frame_components) or number_of_components not in (1, 3):
+                return None
+            components = []
+            for i in range(number_of_components):
+                horizontal_sampling, vertical_sampling, quantization_table = frame_components[segment[1 + 2 * i]]
+                components.append(JpegComponent(horizontal_sampling, vertical_sampling, quantization_table,
+                                                segment[2 + 2 * i] >> 4, segment[2 + 2 * i] & 0x0F))
+            if number_of_components == 1:
+                # A single component is not interleaved, its MCUs are single blocks whatever its sampling factors
+                components = [components[0]._replace(horizontal_sampling=1, vertical_sampling=1)]
+            max_horizontal = max(component.horizontal_sampling for component in components)
+            max_vertical = max(component.vertical_sampling for component in components)
+            if any(max_horizontal % component.horizontal_sampling or max_vertical % component.vertical_sampling
+                   for component in components):
+                return None
+            for component in components:
+                if component.quantization_table not in quantization_tables or \
+                        (0, component.dc_table) not in huffman_tables or (1, component.ac_table) not in huffman_tables:
+                    return None
+            return JpegLayout(width, height, components, quantization_tables, huffman_tables, restart_interval,
+                              position)
+    return None
+
+
+def read_exif_orientation(segment: bytes) -> int:
+    """ Reads the orientation tag of an EXIF segment.
+
+    Args:
+        segment: The content of an APP1 segment.
+
+    Returns: The EXIF orientation, 1 if the image is not rotated or the segment has no orientation.
+    """
+    if segment[:6] != b"Exif\x00\x00":
+        return 1
+    tiff = segment[6:]
+    byte_order = "<" if tiff[:2] == b"II" else ">"
+    directory = struct.unpack(byte_order + "I", tiff[4:8])[0]
+    number_of_entries = struct.unpack(byte_order + "H", tiff[directory:directory + 2])[0]
+    for entry in range(directory + 2, directory + 2 + 12 * number_of_entries, 12):
+        if struct.unpack(byte_order + "H", tiff[entry:entry + 2])[0] == 0x0112:
+            return struct.unpack(byte_order + "H", tiff[entry + 8:entry + 10])[0]
+    return 1
+
+
+def build_huffman_codes(counts: bytes, symbols: bytes) -> Tuple[np.ndarray, np.ndarray]:
+    """ Builds the canonical Huffman codes of a table of a DHT segment.
+
+    Args:
+        counts: The number of codes of each length from 1 to 16 bits.
+        symbols: The symbols sorted by the length of their codes.
+
+    Returns: A tuple with the code and the length of the code of each of the 256 symbols, 0 for the symbols without one.
+    """
+    codes = np.zeros(256, dtype=np.int64)
+    lengths = np.zeros(256, dtype=np.int64)
+    code = 0
+    index = 0
+    for length, count in enumerate(counts, start=1):
+        for symbol in symbols[index:index + count]:
+            codes[symbol] = code
+            lengths[symbol] = length
+            code += 1
+        index += count
+        code <<= 1
+    return codes, lengths
+
+
+def get_mcu_size(layout: JpegLayout) -> Tuple[int, int, int]:
+    """ Gets the size of the MCUs of a JPEG image.
+
+    Args:
+        layout: The layout of the image.
+
+    Returns: A tuple with the width and height of the MCUs in pixels and the number of MCUs in each row.
+    """
+    mcu_width = 8 * max(component.horizontal_sampling for component in layout.components)
+    mcu_height = 8 * max(component.vertical_sampling for component in layout.components)
+    return mcu_width, mcu_height, -(-layout.width // mcu_width)
+
+
+def split_restart_intervals(image_byte_array: bytes, layout: JpegLayout) -> Union[List[Tuple[int, int]], None]:
+    """ Finds the entropy-coded data of each restart interval of a JPEG image.
+
+    Args:
+        image_byte_array: The JPEG image as a byte array.
+        layout: The layout of the image.
+
+    Returns: A list with the start and end of the data of each interval. None if the scan has other markers or not one
+             interval for each group of restart_interval MCUs.
+    """
+    data = np.frombuffer(image_byte_array, np.uint8, offset=layout.scan_start)
+    marker_positions = np.flatnonzero(data[:-1] == 0xFF)
+    markers = data[marker_positions + 1]
+    is_marker = (markers != 0) & (markers != 0xFF)
+    marker_positions, markers = marker_positions[is_marker] + layout.scan_start, markers[is_marker]
+
+    # The scan must only have restart markers until the end of the image
+    end_markers = np.flatnonzero((markers < 0xD0) | (markers > 0xD7))
+    if len(end_markers) == 0 or markers[end_markers[0]] != JPEG_END_OF_IMAGE_MARKER:
+        return None
+    restart_positions = marker_positions[:end_markers[0]]
+    starts = np.concatenate([[layout.scan_start], restart_positions + 2])
+    ends = np.concatenate([restart_positions, [marker_positions[end_markers[0]]]])
+    segments = list(zip(starts.tolist(), ends.tolist()))
+
+    mcu_width, mcu_height, mcus_per_row = get_mcu_size(layout)
+    number_of_mcus = mcus_per_row * -(-layout.height // mcu_height)
+    if len(segments) != -(-number_of_mcus // layout.restart_interval):
+        return None
+    return segments
+
+
+def encode_restart_intervals(image: np.ndarray, layout: JpegLayout, intervals: List[int]) \
+        -> Union[List[bytes], None]:
+    """ Encodes the entropy-coded data of some restart intervals of a JPEG image.
+
+    Args:
+        image: The image as a numpy array in the BGR color space.
+        layout: The layout of the image.
+        intervals: The sorted indices of the restart intervals.
+
+    Returns: The entropy-coded data of each interval, with its bytes stuffed. None if the Huffman tables of the image do
+             not have a code for one of its symbols.
+    """
+    mcu_width, mcu_height, mcus_per_row = get_mcu_size(layout)
+    number_of_mcus = mcus_per_row * -(-layout.height // mcu_height)
+    interval_starts = np.array(intervals) * layout.restart_interval
+    interval_sizes = np.minimum(interval_starts + layout.restart_interval, number_of_mcus) - interval_starts
+    mcus = np.repeat(interval_starts - np.cumsum(interval_sizes) + interval_sizes, interval_sizes) + \
+        np.arange(interval_sizes.sum())
+
+    # The coefficients are computed for the rectangles of MCUs that contain the intervals, one for each group of
+    # consecutive rows that need the same columns
+    rows = mcus // mcus_per_row
+    row_starts = np.flatnonzero(np.diff(rows, prepend=-1))
+    row_columns = np.stack([np.minimum.reduceat(mcus % mcus_per_row, row_starts),
+                            np.maximum.reduceat(mcus % mcus_per_row, row_starts)], axis=1)
+    coefficients = []
+    group_start = 0
+    for index in range(1, len(row_starts) + 1):
+        if index < len(row_starts) and rows[row_starts[index]] == rows[row_starts[index - 1]] + 1 and \
+                np.array_equal(row_columns[index], row_columns[group_start]):
+            continue
+        first_row, last_row = rows[row_starts[group_start]], rows[row_starts[index - 1]]
+        first_column, last_column = row_columns[group_start]
+        group_mcus = mcus[row_starts[group_start]:row_starts[index] if index < len(row_starts) else len(mcus)]
+        group_coefficients = get_quantized_coefficients(image, layout, first_row, last_row, first_column, last_column)
+        number_of_columns = last_column - first_column + 1
+        coefficients.append(group_coefficients[(group_mcus // mcus_per_row - first_row) * number_of_columns +
+                                               group_mcus % mcus_per_row - first_column])
+        group_start = index
+    return encode_huffman(np.concatenate(coefficients), layout, interval_sizes)
+
+
+def get_quantized_coefficients(image: np.ndarray, layout: JpegLayout, first_row: int, last_row: int,
+                               first_column: int, last_column: int) -> np.ndarray:
+    """ Computes the quantized DCT coefficients of the blocks of a rectangle of MCUs of a JPEG image.
+
+    Args:
+        image: The image as a numpy array in the BGR color space.
+        layout: The layout of the image.
+        first_row: The index of the first row of MCUs.
+        last_row: The index of the last row of MCUs.
+        first_column: The index of the first column of MCUs.
+        last_column: The index of the last column of MCUs.
+
+    Returns: Array with shape (MCUs, blocks per MCU, 64) with the coefficients of each block in zigzag order, with the
+             MCUs in row-major order. The blocks of each MCU are sorted by component and then in row-major order, as
+             they are stored.
+    """
+    mcu_width, mcu_height, _ = get_mcu_size(layout)
+    number_of_rows = last_row - first_row + 1
+    number_of_columns = last_column - first_column + 1
+    band = image[first_row * mcu_height:(last_row + 1) * mcu_height,
+                 first_column * mcu_width:(last_column + 1) * mcu_width]
+    # The MCUs on the right and bottom sides are completed by repeating the last column and row of the image
+    band = cv.copyMakeBorder(band, 0, number_of_rows * mcu_height - band.shape[0], 0,
+                             number_of_columns * mcu_width - band.shape[1], cv.BORDER_REPLICATE)
+
+    if len(layout.components) == 1:
+        planes = [band if band.ndim == 2 else cv.cvtColor(band, cv.COLOR_BGR2GRAY)]
+    else:
+        # JPEG stores the YCbCr components in that order, OpenCV returns YCrCb with the same JFIF conversion
+        luma, red_chroma, blue_chroma = cv.split(cv.cvtColor(band, cv.COLOR_BGR2YCrCb))
+        planes = [luma, blue_chroma, red_chroma]
+
+    max_horizontal = mcu_width // 8
+    max_vertical = mcu_height // 8
+    component_blocks = []
+    for plane, component in zip(planes, layout.components):
+        horizontal, vertical = component.horizontal_sampling, component.vertical_sampling
+        if (horizontal, vertical) != (max_horizontal, max_vertical):
+            plane = cv.resize(plane, (plane.shape[1] * horizontal // max_horizontal,
+                                      plane.shape[0] * vertical // max_vertical), interpolation=cv.INTER_AREA)
+        blocks = plane.reshape(number_of_rows, vertical, 8, number_of_columns, horizontal, 8)
+        blocks = blocks.transpose(0, 3, 1, 4, 2, 5).reshape(-1, 64).astype(np.float32) - 128
+        # The quantization is folded into the DCT matrix
+        quantized_dct_matrix = (ZIGZAG_DCT_MATRIX /
+                                layout.quantization_tables[component.quantization_table][:, None]).astype(np.float32)
+        coefficients = np.rint(blocks @ quantized_dct_matrix.T)
+        component_blocks.append(coefficients.reshape(number_of_rows * number_of_columns, vertical * horizontal, 64))
+    return np.concatenate(component_blocks, axis=1).astype(np.int64)
+
+
+def encode_huffman(coefficients: np.ndarray, layout: JpegLayout, interval_sizes: np.ndarray) \
+        -> Union[List[bytes], None]:
+    """ Encodes the quantized coefficients of the MCUs of some restart intervals with the Huffman tables of a JPEG
+    image. The symbols of all the blocks are built and packed into bits at once with numpy instead of block by block.
+
+    Args:
+        coefficients: Array with shape (MCUs, blocks per MCU, 64) with the coefficients of each block in zigzag order.
+        layout: The layout of the image.
+        interval_sizes: The number of consecutive MCUs of each interval.
+
+    Returns: The entropy-coded data of each interval, with its bytes stuffed. None if the Huffman tables do not have a
+             code for one of the symbols.
+    """
+    block_components = np.concatenate([np.full(component.horizontal_sampling * component.vertical_sampling, index)
+                                       for index, component in enumerate(layout.components)])
+    components = np.tile(block_components, len(coefficients))
+    block_intervals = np.repeat(np.arange(len(interval_sizes)), interval_sizes * len(block_components))
+    blocks = coefficients.reshape(-1, 64)
+
+    # The DC coefficients are coded as the difference with the previous block of the same component, starting from 0
+    # at each restart marker
+    dc_differences = np.empty(len(blocks), dtype=np.int64)
+    for index in range(len(layout.components)):
+        mask = components == index
+        differences = np.diff(blocks[mask, 0], prepend=0)
+        intervals = block_intervals[mask]
+        first_blocks = np.flatnonzero(np.diff(intervals, prepend=-1))
+        differences[first_blocks] = blocks[mask, 0][first_blocks]
+        dc_differences[mask] = differences
+
+    # The nonzero AC coefficients are coded with the number of zeros before them, runs longer than 15 zeros are split
+    # by ZRL symbols, and the zeros at the end of the block by an EOB symbol
+    ac_blocks, ac_positions = np.nonzero(blocks[:, 1:])
+    ac_positions += 1
+    ac_values = blocks[ac_blocks, ac_positions]
+    previous_positions = np.zeros_like(ac_positions)
+    previous_positions[1:] = np.where(ac_blocks[1:] == ac_blocks[:-1], ac_positions[:-1], 0)
+    runs = ac_positions - previous_positions - 1
+    zrl_events = np.repeat(np.arange(len(runs)), runs // 16)
+    last_positions = np.zeros(len(blocks), dtype=np.int64)
+    np.maximum.at(last_positions, ac_blocks, ac_positions)
+    eob_blocks = np.flatnonzero(last_positions < 63)
+
+    dc_sizes = get_bit_lengths(dc_differences)
+    ac_sizes = get_bit_lengths(ac_values)
+    no_extra_bits = np.zeros(len(zrl_events) + len(eob_blocks), dtype=np.int64)
+    block_indices = np.concatenate([np.arange(len(blocks)), ac_blocks, ac_blocks[zrl_events], eob_blocks])
+    order_keys = np.concatenate([np.zeros(len(blocks), dtype=np.int64), 2 * ac_positions,
+                                 2 * ac_positions[zrl_events] - 1, np.full(len(eob_blocks), 128)])
+    symbols = np.concatenate([dc_sizes, ((runs % 16) << 4) | ac_sizes, np.full(len(zrl_events), 0xF0),
+                              np.zeros(len(eob_blocks), dtype=np.int64)])
+    extra_bits = np.concatenate([get_magnitude_bits(dc_differences, dc_sizes), get_magnitude_bits(ac_values, ac_sizes),
+                                 no_extra_bits])
+    extra_sizes = np.concatenate([dc_sizes, ac_sizes, no_extra_bits])
+
+    # Tables 2 * component for the DC symbols and 2 * component + 1 for the AC symbols
+    tables = 2 * components[block_indices] + (order_keys > 0)
+    huffman_tables = [layout.huffman_tables[(table_class, table_id)] for component in layout.components
+                      for table_class, table_id in [(0, component.dc_table), (1, component.ac_table)]]
+    codes = np.stack([table_codes for table_codes, _ in huffman_tables])
+    code_lengths = np.stack([table_lengths for _, table_lengths in huffman_tables])
+    lengths = code_lengths[tables, symbols]
+    if np.any(lengths == 0):
+        return None
+    values = (codes[tables, symbols] << extra_sizes) | extra_bits
+    lengths += extra_sizes
+
+    # Each interval ends with ones up to the end of its last byte
+    interval_bits = np.bincount(block_intervals[block_indices], weights=lengths, minlength=len(interval_sizes))
+    padding_sizes = -interval_bits.astype(np.int64) % 8
+    last_blocks = np.cumsum(interval_sizes * len(block_components)) - 1
+    block_indices = np.concatenate([block_indices, last_blocks])
+    order_keys = np.concatenate([order_keys, np.full(len(last_blocks), 256)])
+    values = np.concatenate([values, (1 << padding_sizes) - 1])
+    lengths = np.concatenate([lengths, padding_sizes])
+
+    # Write the bits of each value from the most significant one
+    order = np.lexsort((order_keys, block_indices))
+    values, lengths = values[order], lengths[order]
+    ends = np.cumsum(lengths)
+    events = np.repeat(np.arange(len(values)), lengths)
+    bits = ((values[events] >> (ends[events] - 1 - np.arange(int(ends[-1])))) & 1).astype(np.uint8)
+    data = np.packbits(bits).tobytes()
+    interval_ends = np.cumsum((interval_bits.astype(np.int64) + padding_sizes) // 8)
+    return [data[start:end].replace(b"\xff", b"\xff\x00")
+            for start, end in zip(np.concatenate([[0], interval_ends[:-1]]).tolist(), interval_ends.tolist())]
+
+
+def get_bit_lengths(values: np.ndarray) -> np.ndarray:
+    """ Gets the number of bits of the magnitude of each value, the category of its Huffman symbol.
+
+    Args:
+        values: Array of integers.
+
+    Returns: Array with the number of bits of the absolute value of each integer, 0 for 0.
+    """
+    return np.frexp(np.abs(values).astype(np.float64))[1].astype(np.int64)
+
+
+def get_magnitude_bits(values: np.ndarray, sizes: np.ndarray) -> np.ndarray:
+    """ Gets the bits that follow the Huffman code of each value, the value itself if it is positive and its one's
+    complement if it is negative.
+
+    Args:
+        values: Array of integers.
+        sizes: The number of bits of the magnitude of each value.
+
+    Returns: Array with the bits of each value.
+    """
+    return np.where(values < 0, values + (1 << sizes) - 1, values)
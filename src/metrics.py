@@ -0,0 +1,315 @@
+"""
+Metrics of the service in the Prometheus text format.
+
+Each process keeps its metrics in memory. When the environment variable METRICS_MULTIPROC_DIR is set, each process also
+writes a snapshot of its metrics to a file in that directory every METRICS_FLUSH_INTERVAL seconds, so that the metrics
+of all the gunicorn workers can be aggregated by whichever worker answers the request to the "/metrics" endpoint. The
+directory should be emptied before starting the service.
+"""
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+METRICS_MULTIPROC_DIR = os.environ.get("METRICS_MULTIPROC_DIR")
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", "1"))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 4, 6, 8, 12, 16, 24, 32, 64)
+BYTES_BUCKETS = tuple(float(2 ** power) for power in range(14, 28, 2))
+PIXELS_BUCKETS = (0.1e6, 0.3e6, 1e6, 2e6, 4e6, 8e6, 12e6, 24e6, 48e6)
+MEMORY_BUCKETS = tuple(float(2 ** power) for power in range(20, 31))
+WAIT_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+
+class Metric:
+    """ Base class of the metrics. The values are kept per combination of label values. """
+
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: "MetricsRegistry" = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.registry = registry or REGISTRY
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        self.registry.register(self)
+
+    def _label_values(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError("Metric '" + self.name + "' expects the labels " + str(self.labelnames) + ".")
+        self.registry.start_flushing()
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self) -> Dict[str, object]:
+        """ Gets the values of the metric in a format that can be saved as json.
+
+        Returns: A dictionary with the label values as a json list and the corresponding value.
+        """
+        with self._lock:
+            return {json.dumps(label_values): _copy(value) for label_values, value in self._values.items()}
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+
+class Counter(Metric):
+    """ Metric with a value that only goes up. """
+
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels: str):
+        label_values = self._label_values(labels)
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+
+class Gauge(Metric):
+    """ Metric with a value that goes up and down. The values of the processes that are no longer running are not
+    aggregated. """
+
+    type = "gauge"
+
+    def inc(self, amount: float = 1, **labels: str):
+        label_values = self._label_values(labels)
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str):
+        label_values = self._label_values(labels)
+        with self._lock:
+            self._values[label_values] = value
+
+    @contextmanager
+    def track_inprogress(self, **labels: str) -> Iterator[None]:
+        """ Increments the gauge while the code inside the context is running. """
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(Metric):
+    """ Metric that counts the observed values in buckets. The value of each combination of labels is a list with the
+    count of each bucket, not cumulative, followed by the sum and the count of the observations. """
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS, registry: "MetricsRegistry" = None):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: str):
+        label_values = self._label_values(labels)
+        bucket = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            counts = self._values.setdefault(label_values, [0] * (len(self.buckets) + 3))
+            counts[bucket] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """ Observes the time in seconds taken by the code inside the context. """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+
+class MetricsRegistry:
+    """ Class that keeps all the metrics of the process and aggregates the metrics of all the processes. """
+
+    def __init__(self, multiproc_dir: str = None, flush_interval: float = 1.0):
+        self.multiproc_dir = multiproc_dir
+        self.flush_interval = flush_interval
+        self.metrics: Dict[str, Metric] = {}
+        self._flush_thread = None
+        self._flush_lock = threading.Lock()
+
+    def register(self, metric: Metric):
+        if metric.name in self.metrics:
+            raise ValueError("Metric '" + metric.name + "' is already registered.")
+        self.metrics[metric.name] = metric
+
+    def start_flushing(self):
+        """ Starts the thread that writes the snapshots of the process, if there is a multiprocess directory. """
+        if self.multiproc_dir is None or self._flush_thread is not None:
+            return
+
+        with self._flush_lock:
+            if self._flush_thread is None:
+                os.makedirs(self.multiproc_dir, exist_ok=True)
+                self._flush_thread = threading.Thread(target=self._flush_periodically, name="metrics", daemon=True)
+                self._flush_thread.start()
+                atexit.register(self.write_snapshot)
+
+    def reset_after_fork(self):
+        """ Drops the metrics inherited from the parent process, so they are not counted twice. """
+        self._flush_thread = None
+        self._flush_lock = threading.Lock()
+        for metric in self.metrics.values():
+            metric._lock = threading.Lock()
+            metric.reset()
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.write_snapshot()
+
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def write_snapshot(self):
+        """ Writes the snapshot of the metrics of the process to its file in the multiprocess directory. """
+        path = os.path.join(self.multiproc_dir, str(os.getpid()) + ".json")
+        with open(path + ".tmp", "w") as file_object:
+            json.dump(self.snapshot(), file_object)
+        os.replace(path + ".tmp", path)
+
+    def collect(self) -> Dict[str, Dict[str, object]]:
+        """ Aggregates the metrics of this process with the snapshots of the other processes. Counters and histograms
+        are summed over all the processes and gauges only over the processes still running.
+
+        Returns: A dictionary with the aggregated values of each metric in the same format as the snapshot.
+        """
+        snapshots = [self.snapshot()]
+        if self.multiproc_dir is not None:
+            for path in glob.glob(os.path.join(self.multiproc_dir, "*.json")):
+                pid = int(os.path.basename(path)[:-len(".json")])
+                if pid == os.getpid():
+                    continue
+                try:
+                    with open(path, "r") as file_object:
+                        snapshot = json.load(file_object)
+                except (OSError, ValueError):
+                    continue
+                if not _is_running(pid):
+                    snapshot = {name: values for name, values in snapshot.items()
+                                if name in self.metrics and self.metrics[name].type != "gauge"}
+                snapshots.append(snapshot)
+
+        aggregated: Dict[str, Dict[str, object]] = {name: {} for name in self.metrics}
+        for snapshot in snapshots:
+            for name, values in snapshot.items():
+                if name not in aggregated:
+                    continue
+                for label_values, value in values.items():
+                    aggregated[name][label_values] = _add(aggregated[name].get(label_values), value)
+        return aggregated
+
+    def generate_latest(self) -> str:
+        """ Generates the aggregated metrics in the Prometheus text format.
+
+        Returns: The metrics as a string.
+        """
+        lines: List[str] = []
+        for name, values in self.collect().items():
+            metric = self.metrics[name]
+            lines.append("# HELP " + name + " " + metric.documentation)
+            lines.append("# TYPE " + name + " " + metric.type)
+            for label_values, value in sorted(values.items()):
+                labels = list(zip(metric.labelnames, json.loads(label_values)))
+                if isinstance(metric, Histogram):
+                    cumulative_count = 0
+                    for bound, count in zip(list(metric.buckets) + [float("inf")], value[:-2]):
+                        cumulative_count += count
+                        lines.append(_format_sample(name + "_bucket", labels + [("le", _format_bound(bound))],
+                                                    cumulative_count))
+                    lines.append(_format_sample(name + "_sum", labels, value[-2]))
+                    lines.append(_format_sample(name + "_count", labels, value[-1]))
+                else:
+                    lines.append(_format_sample(name, labels, value))
+        return "\n".join(lines) + "\n"
+
+
+# Auxiliary functions
+def _copy(value: object) -> object:
+    return list(value) if isinstance(value, list) else value
+
+
+def _add(total: object, value: object) -> object:
+    if total is None:
+        return _copy(value)
+    if isinstance(total, list):
+        return [a + b for a, b in zip(total, value)]
+    return total + value
+
+
+def _is_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+def _format_sample(name: str, labels: List[Tuple[str, str]], value: object) -> str:
+    label_text = ",".join(key + '="' + str(label).replace("\\", "\\\\").replace('"', '\\"') + '"'
+                          for key, label in labels)
+    return name + ("{" + label_text + "}" if label_text else "") + " " + repr(float(value))
+
+
+REGISTRY = MetricsRegistry(METRICS_MULTIPROC_DIR, METRICS_FLUSH_INTERVAL)
+os.register_at_fork(after_in_child=REGISTRY.reset_after_fork)
+
+# Metrics of the googlifier
+STAGE_DURATION = Histogram("googlifier_stage_duration_seconds", "Time spent in each stage of the googlifier.",
+                           labelnames=("stage",))
+IMAGES = Counter("googlifier_images_total", "Images processed by the googlifier by result.", labelnames=("result",))
+FACES_PER_IMAGE = Histogram("googlifier_faces_per_image", "Faces detected per image.", buckets=COUNT_BUCKETS)
+EYES_PER_IMAGE = Histogram("googlifier_eyes_per_image", "Eyes detected per image.", buckets=COUNT_BUCKETS)
+INPUT_BYTES = Histogram("googlifier_input_bytes", "Size in bytes of the input images.", buckets=BYTES_BUCKETS)
+INPUT_PIXELS = Histogram("googlifier_input_pixels", "Number of pixels of the decoded input images.",
+                         buckets=PIXELS_BUCKETS)
+IN_FLIGHT = Gauge("googlifier_in_flight", "Images being processed by the googlifier.")
+IMAGE_MEMORY = Histogram("googlifier_image_memory_bytes",
+                         "Peak memory held by the buffers of each image while it is googlified.",
+                         buckets=MEMORY_BUCKETS)
+PEAK_RESIDENT_MEMORY = Gauge("googlifier_peak_resident_memory_bytes", "Largest resident memory reached by the process.")
+VIDEO_FRAMES = Counter("googlifier_video_frames_total", "Video frames processed by the googlifier.")
+JPEG_REGION_ENCODING = Counter("googlifier_jpeg_region_encoding_total",
+                               "JPEG outputs of JPEG inputs by whether only the regions of the eyes were encoded.",
+                               labelnames=("result",))
+DEGRADED_IMAGES = Counter("googlifier_degradation_level_total",
+                          "Images processed with a latency budget by the degradation level used.", labelnames=("level",))
+CACHE_REQUESTS = Counter("googlifier_cache_requests_total", "Result cache lookups by result.", labelnames=("result",))
+CACHE_EVICTIONS = Counter("googlifier_cache_evictions_total", "Entries evicted from the local result cache.")
+CACHE_DROPPED_WRITES = Counter("googlifier_cache_dropped_writes_total",
+                               "Entries not written to the shared result cache because its write queue was full.")
+
+JOBS = Counter("googlifier_jobs_total", "Jobs submitted and finished by status.", labelnames=("status",))
+JOB_QUEUE_WAIT = Histogram("googlifier_job_queue_wait_seconds", "Time the jobs waited in the queue before processing.",
+                           buckets=WAIT_BUCKETS)
+
+MODEL_LOAD_DURATION = Histogram("googlifier_model_load_duration_seconds", "Time spent loading each model file.",
+                                labelnames=("model",))
+MODEL_MEMORY = Gauge("googlifier_model_memory_bytes", "Resident memory taken by loading each model file.",
+                     labelnames=("model",))
+WARMUP_DURATION = Histogram("googlifier_warmup_duration_seconds",
+                            "Time spent running the models on synthetic images before serving.")
+
+# Metrics of the api
+POOL_IN_FLIGHT = Gauge("inference_pool_in_flight", "Requests running or waiting in the inference pool.")
+POOL_REJECTED = Counter("inference_pool_rejected_total", "Requests rejected because the inference pool was full.")
+REQUESTS_TOO_LARGE = Counter("api_requests_too_large_total", "Requests rejected because they exceeded a size limit.",
+                             labelnames=("limit",))
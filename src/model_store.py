@@ -0,0 +1,203 @@
+import os
+import time
+import hashlib
+import logging
+from typing import Any, Callable, List, NamedTuple, TypeVar
+
+import cv2 as cv
+
+import setup_logger
+
+T = TypeVar("T")
+
+# Keys of the nodes of an OpenCV FileStorage that hold a matrix
+MATRIX_NODE_KEYS = {"rows", "cols", "dt", "data"}
+
+
+class ModelLoad(NamedTuple):
+    """ The cost of loading a model file, reported at startup. """
+    name: str
+    path: str
+    seconds: float
+    memory_bytes: int
+
+
+def get_rss_bytes() -> int:
+    """ Gets the resident memory of the process.
+
+    Returns: The resident memory in bytes or 0 if it is not available in the platform.
+    """
+    try:
+        with open("/proc/self/statm", "r") as file_object:
+            return int(file_object.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def get_peak_rss_bytes() -> int:
+    """ Gets the largest resident memory reached by the process since it started.
+
+    Returns: The peak resident memory in bytes or 0 if it is not available in the platform.
+    """
+    try:
+        import resource
+    except ImportError:
+        return 0
+    # Linux reports it in kilobytes
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def load_model(name: str, path: str, loader: Callable[[str], T], model_loads: List[ModelLoad]) -> T:
+    """ Loads a model file measuring the time and the memory it takes. The measures are logged and appended to a list,
+    so the detectors can report them.
+
+    Args:
+        name: The name of the model used in the reports.
+        path: The path of the model file.
+        loader: Callable that receives the path and returns the loaded model.
+        model_loads: List where the measures of the load are appended.
+
+    Returns: The loaded model.
+    """
+    rss_before = get_rss_bytes()
+    start = time.perf_counter()
+    model = loader(path)
+    model_load = ModelLoad(name, path, time.perf_counter() - start, max(get_rss_bytes() - rss_before, 0))
+    model_loads.append(model_load)
+
+    logging.getLogger(setup_logger.LOGGER_NAME).info(
+        "Loaded model '%s' from %s in %.2f seconds using %.1f MB.", name, path, model_load.seconds,
+        model_load.memory_bytes / 2 ** 20)
+    return model
+
+
+def load_file_storage_model(name: str, path: str, loader: Callable[[str], T], model_loads: List[ModelLoad],
+                            cache_dir: str = "") -> T:
+    """ Loads a model stored in the OpenCV FileStorage format from its binary copy, like load_model. If the binary copy
+    can not be created the original file is loaded instead.
+
+    Args:
+        name: The name of the model used in the reports.
+        path: The path of the model file in the YAML or XML FileStorage format.
+        loader: Callable that receives the path and returns the loaded model.
+        model_loads: List where the measures of the load are appended.
+        cache_dir: The directory where the binary copies are kept. If empty the original file is always loaded.
+
+    Returns: The loaded model.
+    """
+    if cache_dir:
+        try:
+            path = get_binary_model_path(path, cache_dir)
+        except (OSError, cv.error) as e:
+            logging.getLogger(setup_logger.LOGGER_NAME).warning(
+                "Could not create the binary copy of the model '%s', loading the original file: %r", name, e)
+    return load_model(name, path, loader, model_loads)
+
+
+def get_binary_model_path(model_path: str, cache_dir: str) -> str:
+    """ Gets the path of the binary copy of an OpenCV FileStorage model file, converting it on the first call. The
+    matrices of the binary copy are stored in base64 instead of text, which is much faster to parse.
+
+    Args:
+        model_path: The path of the model file in the YAML or XML FileStorage format.
+        cache_dir: The directory where the binary copies are kept.
+
+    Returns: The path of the binary copy.
+    """
+    return get_converted_model_path(model_path, cache_dir, "base64", convert_to_binary_storage)
+
+
+def get_quantized_model_path(model_path: str, cache_dir: str) -> str:
+    """ Gets the path of the int8 quantized copy of an ONNX model, quantizing it on the first call. The weights are
+    quantized ahead of time and the activations dynamically while running, so no calibration images are needed.
+
+    Args:
+        model_path: The path of the ONNX model.
+        cache_dir: The directory where the quantized copies are kept.
+
+    Returns: The path of the quantized copy.
+    """
+    return get_converted_model_path(model_path, cache_dir, "int8", quantize_onnx_model)
+
+
+def get_converted_model_path(model_path: str, cache_dir: str, suffix: str,
+                             convert: Callable[[str, str], Any]) -> str:
+    """ Gets the path of a converted copy of a model file, converting it on the first call. The copy is named after
+    the size and modification time of the original file, so it is converted again when the original changes.
+
+    Args:
+        model_path: The path of the model file.
+        cache_dir: The directory where the converted copies are kept.
+        suffix: Suffix added to the name of the copies to tell the conversions apart.
+        convert: Callable that receives the path of the model file and the path where the copy is written.
+
+    Returns: The path of the converted copy.
+    """
+    stat = os.stat(model_path)
+    version = hashlib.blake2b((os.path.abspath(model_path) + str(stat.st_size) + str(stat.st_mtime_ns)).encode(),
+                              digest_size=8).hexdigest()
+    name, extension = os.path.splitext(os.path.basename(model_path))
+    converted_path = os.path.join(cache_dir, name + "." + version + "." + suffix + extension)
+    if os.path.exists(converted_path):
+        return converted_path
+
+    # Convert to a temporary file first, so concurrent workers never read a half written copy
+    os.makedirs(cache_dir, exist_ok=True)
+    temporary_path = os.path.join(cache_dir, name + "." + version + "." + str(os.getpid()) + ".tmp" + extension)
+    convert(model_path, temporary_path)
+    os.replace(temporary_path, converted_path)
+    return converted_path
+
+
+def quantize_onnx_model(source_path: str, target_path: str):
+    """ Quantizes the weights of an ONNX model to int8. It requires the "onnx" and "onnxruntime" packages.
+
+    Args:
+        source_path: The path of the ONNX model.
+        target_path: The path of the quantized model.
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(source_path, target_path, weight_type=QuantType.QUInt8)
+
+
+def convert_to_binary_storage(source_path: str, target_path: str):
+    """ Copies an OpenCV FileStorage file writing its matrices in base64.
+
+    Args:
+        source_path: The path of the file to copy.
+        target_path: The path of the copy.
+    """
+    source = cv.FileStorage(source_path, cv.FILE_STORAGE_READ)
+    if not source.isOpened():
+        raise OSError("Could not open the model file " + source_path + ".")
+    target = cv.FileStorage(target_path, cv.FILE_STORAGE_WRITE | cv.FILE_STORAGE_BASE64)
+    try:
+        root = source.root()
+        for key in root.keys():
+            _copy_node(root.getNode(key), target, key)
+    finally:
+        target.release()
+        source.release()
+
+
+# Auxiliary functions
+def _copy_node(node: Any, target: cv.FileStorage, name: str):
+    if node.isMap() and MATRIX_NODE_KEYS.issubset(node.keys()):
+        target.write(name, node.mat())
+    elif node.isMap():
+        target.startWriteStruct(name, cv.FileNode_MAP)
+        for key in node.keys():
+            _copy_node(node.getNode(key), target, key)
+        target.endWriteStruct()
+    elif node.isSeq():
+        target.startWriteStruct(name, cv.FileNode_SEQ)
+        for i in range(node.size()):
+            _copy_node(node.at(i), target, "")
+        target.endWriteStruct()
+    elif node.isInt():
+        target.write(name, int(node.real()))
+    elif node.isReal():
+        target.write(name, node.real())
+    elif node.isString():
+        target.write(name, node.string())
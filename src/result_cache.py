@@ -0,0 +1,352 @@
+import os
+import queue
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Tuple, Union
+
+import setup_logger
+from detectors.base_detector import load_class, get_field
+from metrics import CACHE_REQUESTS, CACHE_EVICTIONS, CACHE_DROPPED_WRITES
+
+# Entries waiting to be written to the shared backend, further entries are dropped until the writer catches up
+BACKEND_WRITE_QUEUE_SIZE = 64
+
+# Seconds after which a read of an entry of the sqlite backend updates its access time for the eviction order
+ACCESS_UPDATE_INTERVAL = 60
+
+
+class CacheBackend(ABC):
+    """ Interface of a cache shared between processes. """
+
+    evictions: int
+
+    @abstractmethod
+    def __init__(self, config: Dict):
+        self.config = config
+
+    @abstractmethod
+    def get(self, key: str) -> Union[bytes, None]: ...
+
+    @abstractmethod
+    def set(self, key: str, value: bytes): ...
+
+
+class SqliteCacheBackend(CacheBackend):
+    """ Class that implements a cache shared between processes using a sqlite file as a local stand-in for a shared
+    cache server. The least recently used entries are evicted when the file holds more than max_bytes. The total size of
+    the entries is kept in its own table, so adding an entry does not scan the cache, and the access time of an entry is
+    only updated every access_update_interval seconds, so most reads do not take the write lock of the file. """
+
+    def __init__(self, config: Dict):
+        self.path = get_field(config, "path")
+        self.max_bytes = get_field(config, "max_bytes")
+        self.access_update_interval = get_field(config, "access_update_interval", default=ACCESS_UPDATE_INTERVAL)
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._connection = None
+        self._connection_pid = None
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """ Gets the connection to the sqlite file of the current process. A connection can not be used after forking,
+        so the worker processes open their own connection when the backend was created before forking them.
+
+        Returns: The connection.
+        """
+        with self._lock:
+            if self._connection_pid != os.getpid():
+                self._connection = sqlite3.connect(self.path, timeout=5, check_same_thread=False,
+                                                   isolation_level=None)
+                self._connection.execute("PRAGMA journal_mode=WAL")
+                self._connection.execute("CREATE TABLE IF NOT EXISTS cache "
+                                         "(key TEXT PRIMARY KEY, value BLOB, size INTEGER, accessed REAL)")
+                self._connection.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+                self._connection.execute("CREATE TABLE IF NOT EXISTS cache_size "
+                                         "(id INTEGER PRIMARY KEY CHECK (id = 0), size INTEGER)")
+                self._connection.execute("INSERT OR IGNORE INTO cache_size "
+                                         "VALUES (0, (SELECT COALESCE(SUM(size), 0) FROM cache))")
+                self._connection_pid = os.getpid()
+            return self._connection
+
+    def get(self, key: str) -> Union[bytes, None]:
+        connection = self._get_connection()
+        with self._lock:
+            row = connection.execute("SELECT value, accessed FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if now - row[1] >= self.access_update_interval:
+                connection.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def set(self, key: str, value: bytes):
+        connection = self._get_connection()
+        with self._lock:
+            # The entry, the total size and the evictions are updated in one transaction, so the total stays exact
+            # with several processes writing to the file
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = connection.execute("SELECT size FROM cache WHERE key = ?", (key,)).fetchone()
+                connection.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+                                   (key, value, len(value), time.time()))
+                connection.execute("UPDATE cache_size SET size = size + ?",
+                                   (len(value) - (row[0] if row is not None else 0),))
+                total_size = connection.execute("SELECT size FROM cache_size").fetchone()[0]
+                if total_size > self.max_bytes:
+                    # Walk the entries from the least recently used one, through the index, until enough bytes are
+                    # freed and delete them all at once
+                    evicted_entries = evicted_bytes = 0
+                    for size, in connection.execute("SELECT size FROM cache ORDER BY accessed"):
+                        if total_size - evicted_bytes <= self.max_bytes:
+                            break
+                        evicted_entries += 1
+                        evicted_bytes += size
+                    connection.execute("DELETE FROM cache WHERE key IN "
+                                       "(SELECT key FROM cache ORDER BY accessed LIMIT ?)", (evicted_entries,))
+                    connection.execute("UPDATE cache_size SET size = size - ?", (evicted_bytes,))
+                    self.evictions += evicted_entries
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+
+class ResultCache:
+    """ Class that caches the results of the googlifier by the content of the input image. The entries are kept in a
+    local cache with least recently used eviction, limited by its size in bytes, and optionally in a backend shared with
+    other processes. The entries are written to the backend by a background thread, so the requests never wait for
+    the write lock of the backend, and they are dropped when the backend can not keep up. """
+
+    def __init__(self, max_bytes: int, store_rendered: bool, backend: Union[CacheBackend, None] = None):
+        """
+        Args:
+            max_bytes: Maximum size in bytes of the entries kept in the local cache.
+            store_rendered: Whether the rendered images are cached besides the detections.
+            backend: Cache shared with other processes, used when an entry is not in the local cache.
+        """
+        self.max_bytes = max_bytes
+        self.store_rendered = store_rendered
+        self.backend = backend
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._backend_writes: Union[queue.Queue, None] = None
+        self._backend_writer_pid = None
+        self.logger = logging.getLogger(setup_logger.LOGGER_NAME)
+
+    @staticmethod
+    def get_key(image_byte_array: bytes, context: str = "") -> str:
+        """ Gets the key of an input image from a hash of its content and of what else changes its results.
+
+        Args:
+            image_byte_array: Input image as a byte array.
+            context: A string that identifies how the image is processed, such as a hash of the configuration and the
+                     degradation level, so the results of different configurations or levels never share a key.
+
+        Returns: The key of the image.
+        """
+        key_hash = hashlib.blake2b(context.encode(), digest_size=16)
+        key_hash.update(b"\0")
+        key_hash.update(image_byte_array)
+        return key_hash.hexdigest()
+
+    def get(self, key: str) -> Union[bytes, None]:
+        """ Gets an entry from the local cache or, if it is not there, from the shared backend.
+
+        Args:
+            key: The key of the entry.
+
+        Returns: The value of the entry or None if it is not cached.
+        """
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                CACHE_REQUESTS.inc(result="hit")
+                return value
+
+        if self.backend is not None:
+            value = self.backend.get(key)
+            if value is not None:
+                self._set_local(key, value)
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        CACHE_REQUESTS.inc(result="miss" if value is None else "hit")
+        return value
+
+    def set(self, key: str, value: bytes):
+        """ Adds an entry to the local cache and queues it to be written to the shared backend.
+
+        Args:
+            key: The key of the entry.
+            value: The value of the entry.
+        """
+        self._set_local(key, value)
+        if self.backend is None:
+            return
+
+        with self._lock:
+            # The threads are not copied when the process is forked, so each process starts its own writer
+            if self._backend_writer_pid != os.getpid():
+                self._backend_writes = queue.Queue(maxsize=BACKEND_WRITE_QUEUE_SIZE)
+                threading.Thread(target=self._write_backend, args=(self._backend_writes,), name="cache-writer",
+                                 daemon=True).start()
+                self._backend_writer_pid = os.getpid()
+        try:
+            self._backend_writes.put_nowait((key, value))
+        except queue.Full:
+            CACHE_DROPPED_WRITES.inc()
+
+    def flush(self):
+        """ Waits until the queued entries are written to the shared backend. """
+        if self._backend_writer_pid == os.getpid():
+            self._backend_writes.join()
+
+    def _write_backend(self, backend_writes: queue.Queue):
+        while True:
+            key, value = backend_writes.get()
+            try:
+                self.backend.set(key, value)
+            except Exception as e:
+                self.logger.info("Error writing to the result cache backend: " + repr(e))
+            finally:
+                backend_writes.task_done()
+
+    def _set_local(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self.size -= len(self._entries.pop(key))
+            self._entries[key] = value
+            self.size += len(value)
+
+            # Evict the least recently used entries until the cache fits in its size
+            while self.size > self.max_bytes:
+                _, evicted_value = self._entries.popitem(last=False)
+                self.size -= len(evicted_value)
+                self.evictions += 1
+                CACHE_EVICTIONS.inc()
+
+    def get_detections(self, key: str) -> Union[Dict[str, Any], None]:
+        """ Gets the cached detections of an input image.
+
+        Args:
+            key: The key of the input image.
+
+        Returns: A dictionary with the "width" and "height" of the image and its "faces" and "eyes" in the format
+                 (x, y, width, height). None if the detections are not cached.
+        """
+        value = self.get(key + ":detections")
+        if value is None:
+            return None
+
+        detections = json.loads(value)
+        detections["faces"] = [tuple(face) for face in detections["faces"]]
+        detections["eyes"] = [tuple(eye) for eye in detections["eyes"]]
+        return detections
+
+    def set_detections(self, key: str, width: int, height: int, faces: List[Tuple[int, int, int, int]],
+                       eyes: List[Tuple[int, int, int, int]]):
+        """ Caches the detections of an input image.
+
+        Args:
+            key: The key of the input image.
+            width: The width of the input image.
+            height: The height of the input image.
+            faces: List with the faces in the format (x, y, width, height).
+            eyes: List with the eyes in the format (x, y, width, height).
+        """
+        detections = {"width": width, "height": height, "faces": faces, "eyes": eyes}
+        self.set(key + ":detections", json.dumps(detections).encode())
+
+    def get_rendered(self, key: str, image_format: str) -> Union[bytes, None]:
+        """ Gets the cached image with googly eyes of an input image.
+
+        Args:
+            key: The key of the input image.
+            image_format: File extension of the format of the image with googly eyes.
+
+        Returns: The image with googly eyes as bytes or None if it is not cached.
+        """
+        if not self.store_rendered:
+            return None
+        return self.get(key + ":rendered" + image_format)
+
+    def set_rendered(self, key: str, image_format: str, image_byte_array: bytes):
+        """ Caches the image with googly eyes of an input image, if the rendered images are cached.
+
+        Args:
+            key: The key of the input image.
+            image_format: File extension of the format of the image with googly eyes.
+            image_byte_array: The image with googly eyes as bytes.
+        """
+        if self.store_rendered:
+            self.set(key + ":rendered" + image_format, image_byte_array)
+
+    def get_stats(self) -> Dict[str, int]:
+        """ Gets the counters of the cache.
+
+        Returns: A dictionary with the number of "hits", "misses", local "evictions", "backend_evictions" and the "size"
+                 in bytes of the local cache.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "backend_evictions": self.backend.evictions if self.backend is not None else 0,
+                    "size": self.size}
+
+
+# Caches shared by all the Googlifier instances of the process that use the same configuration
+_result_caches: Dict[str, ResultCache] = {}
+_result_caches_lock = threading.Lock()
+
+
+def get_config_hash(config: Dict, sections: Iterable[str]) -> str:
+    """ Gets a hash of some sections of the config file, used in the context of the keys of the result cache.
+
+    Args:
+        config: Dictionary with the config file.
+        sections: The names of the sections that change the results.
+
+    Returns: The hash of the sections.
+    """
+    sections_json = json.dumps({section: config.get(section) for section in sections}, sort_keys=True, default=str)
+    return hashlib.blake2b(sections_json.encode(), digest_size=8).hexdigest()
+
+
+def get_result_cache(config: Dict) -> Union[ResultCache, None]:
+    """ Gets the result cache of the process for a cache configuration, creating it on the first call.
+
+    Args:
+        config: Dictionary with the "cache" section of the config file.
+
+    Returns: The result cache or None if the cache is not enabled.
+    """
+    if not get_field(config, "enabled", default=False):
+        return None
+
+    key = json.dumps(config, sort_keys=True)
+    with _result_caches_lock:
+        if key not in _result_caches:
+            backend = None
+            backend_name = get_field(config, "backend_class", default="")
+            if backend_name:
+                backend = load_class(backend_name)(get_field(config, "backend_parameters"))
+
+            _result_caches[key] = ResultCache(get_field(config, "max_bytes"),
+                                              get_field(config, "store_rendered", default=False), backend)
+        return _result_caches[key]
@@ -1,3 +1,5 @@
 from _typeshed import Incomplete
+from typing import Dict
 
 CONFIG_FILE_PATH: Incomplete
+IMAGE_MEDIA_TYPES: Dict[str, str]
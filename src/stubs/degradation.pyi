@@ -0,0 +1,28 @@
+from _typeshed import Incomplete
+from typing import Dict, List, Union
+
+DEGRADATION_LEVELS: Incomplete
+FULL: int
+REDUCED: int
+FEWER_FACES: int
+GEOMETRIC_EYES: int
+GEOMETRIC_EYE_X_RATIOS: Incomplete
+GEOMETRIC_EYE_Y_RATIO: float
+GEOMETRIC_EYE_WIDTH_RATIO: float
+GEOMETRIC_EYE_HEIGHT_RATIO: float
+OPERATIONS: Incomplete
+GOOGLIFY: str
+ANNOTATE: str
+SMOOTHING: float
+STALE_DECAY: float
+MIN_MEGAPIXELS: float
+
+class DegradationPolicy:
+    smoothing: Incomplete
+    stale_decay: Incomplete
+    seconds_per_megapixel: Incomplete
+    def __init__(self, smoothing: float = ..., stale_decay: float = ...) -> None: ...
+    def select_level(self, remaining_seconds: float, megapixels: float, operation: str = ...) -> int: ...
+    def record(self, level: int, seconds: float, megapixels: float, operation: str = ...) -> None: ...
+
+DEGRADATION_POLICY: DegradationPolicy
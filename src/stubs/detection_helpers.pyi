@@ -1,4 +1,17 @@
-from typing import List, Tuple
+import numpy as np
+from typing import List, Tuple, Union
 
 def make_bbox_larger(coordinates: Tuple[int, int, int, int], percentage: float) -> Tuple[float, float, float, float]: ...
+def make_bboxes_larger(boxes: np.ndarray, percentage: float) -> np.ndarray: ...
 def clip_detections(detections: List[Tuple[int, int, int, int]], image_shape) -> List[Tuple[int, int, int, int]]: ...
+def clip_boxes(boxes: np.ndarray, image_shape) -> np.ndarray: ...
+def rescale_detections(detections: List[Tuple[int, int, int, int]], factor: float) -> List[Tuple[int, int, int, int]]: ...
+def non_max_suppression(boxes: np.ndarray, scores: np.ndarray, iou_thresh: float) -> np.ndarray: ...
+def ssd_detections_to_boxes(detections: np.ndarray, image_shape, confidence_thresh: float, enlarge_percentage: float, nms_thresh: Union[float, None] = ...) -> np.ndarray: ...
+def scores_and_boxes_to_ssd_detections(scores: np.ndarray, boxes: np.ndarray) -> np.ndarray: ...
+def get_rois_bounds(rois: List[Tuple[int, int, int, int]], image_shape, margin_percentage: float) -> Tuple[int, int, int, int]: ...
+def eye_keypoints_to_boxes(eye_keypoints: np.ndarray, width_ratio: float, height_ratio: float) -> np.ndarray: ...
+def estimate_eye_keypoints(faces: List[Tuple[int, int, int, int]], eye_x_ratios: Tuple[float, float], eye_y_ratio: float) -> np.ndarray: ...
+def get_largest_boxes_indices(boxes: List[Tuple[int, int, int, int]], max_boxes: int) -> List[int]: ...
+def get_tiles(image_shape, tile_size: int, overlap: float) -> List[Tuple[int, int, int, int]]: ...
+def tile_ssd_detections_to_image(detections: np.ndarray, tile: Tuple[int, int, int, int], image_shape, border_margin: float) -> np.ndarray: ...
@@ -12,6 +12,19 @@ class BaseDetector(ABC, metaclass=abc.ABCMeta):
     def load(self): ...
     @abstractmethod
     def detect(self, image: np.ndarray, roi: Union[List[Tuple[int, int, int, int]], None] = ...) -> List[Tuple[int, int, int, int]]: ...
+    def detect_many(self, images: List[np.ndarray], rois: Union[List[List[Tuple[int, int, int, int]]], None] = ...) -> List[List[Tuple[int, int, int, int]]]: ...
 
+class BaseFaceEyesDetector(ABC, metaclass=abc.ABCMeta):
+    config: Incomplete
+    @abstractmethod
+    def __init__(self, config: Dict): ...
+    @abstractmethod
+    def load(self): ...
+    @abstractmethod
+    def detect_faces_and_eyes(self, image: np.ndarray) -> Tuple[List[Tuple[int, int, int, int]], List[Tuple[int, int, int, int]]]: ...
+    def detect_faces_and_eyes_many(self, images: List[np.ndarray]) -> List[Tuple[List[Tuple[int, int, int, int]], List[Tuple[int, int, int, int]]]]: ...
+
+def load_class(name: str) -> type: ...
 def get_detector(name: str) -> abc.ABCMeta: ...
-def get_field(config: Dict, field: str, eval_field: bool = ...) -> Any: ...
+def get_field(config: Dict, field: str, eval_field: bool = ..., default: Any = ...) -> Any: ...
+def get_option(options: Dict[str, Any], name: str, field: str) -> Any: ...
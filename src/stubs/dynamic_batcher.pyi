@@ -0,0 +1,10 @@
+from _typeshed import Incomplete
+from typing import Any, Callable, List
+
+class DynamicBatcher:
+    process_batch: Incomplete
+    batch_size: Incomplete
+    max_wait: Incomplete
+    def __init__(self, process_batch: Callable[[List[Any]], List[Any]], batch_size: int, max_wait_ms: float) -> None: ...
+    def submit(self, item: Any) -> Any: ...
+    def submit_many(self, items: List[Any]) -> List[Any]: ...
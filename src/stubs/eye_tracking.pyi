@@ -0,0 +1,29 @@
+import numpy as np
+from _typeshed import Incomplete
+from image_operations import GooglyEye
+from typing import List, Tuple, Union
+
+PUPIL_GRAVITY: Incomplete
+PUPIL_DAMPING: float
+PUPIL_BOUNCE: float
+
+class PupilState:
+    size_ratio: Incomplete
+    offset: Incomplete
+    velocity: Incomplete
+    def __init__(self, size_ratio: float, rng: Union[np.random.Generator, None] = ...) -> None: ...
+    def get_max_offset(self) -> float: ...
+    def update(self, eye_motion: np.ndarray) -> None: ...
+
+class EyeTracker:
+    max_tracking_error: Incomplete
+    rng: Incomplete
+    eyes: Incomplete
+    pupils: Incomplete
+    frames_since_detection: int
+    previous_gray: Incomplete
+    def __init__(self, max_tracking_error: float, rng: Union[np.random.Generator, None] = ...) -> None: ...
+    def track(self, frame: np.ndarray) -> bool: ...
+    def update_detections(self, eyes: List[Tuple[int, int, int, int]], frame: np.ndarray) -> None: ...
+    def move_pupils(self, motions: np.ndarray) -> None: ...
+    def get_googly_eyes(self) -> List[GooglyEye]: ...
@@ -1,12 +1,54 @@
 import numpy as np
 from _typeshed import Incomplete
-from typing import List, Tuple
+from eye_tracking import EyeTracker
+from concurrent.futures import Future
+from typing import Any, Dict, Iterable, Iterator, List, Tuple, Union
 
 class Googlifier:
+    model_load_count: int
+    face_eyes_detector: Incomplete
     face_detector: Incomplete
     eyes_detector: Incomplete
+    max_working_size: Incomplete
+    encoding_quality: Incomplete
+    jpeg_region_encoding: Incomplete
+    degraded_working_size: Incomplete
+    degraded_encoding_quality: Incomplete
+    degraded_max_faces: Incomplete
+    degradation_policy: Incomplete
+    detection_interval: Incomplete
+    max_tracking_error: Incomplete
+    rendering_seed: Incomplete
+    batch_workers: Incomplete
+    batch_chunk_size: Incomplete
+    batch_executor: Incomplete
+    result_cache: Incomplete
+    cache_context: Incomplete
+    warmup_image_sizes: Incomplete
+    warmup_repetitions: Incomplete
     logger: Incomplete
     def __init__(self, config_file_path: str) -> None: ...
-    def detect_eyes_and_googlify(self, image_byte_array: bytes) -> Tuple[bool, bytes]: ...
+    def warm_up(self) -> float: ...
+    def detect_eyes_and_googlify(self, image_byte_array: bytes, image_format: Union[str, None] = ..., degradation_level: int = ...) -> Tuple[bool, bytes]: ...
+    def detect_eyes_and_googlify_many(self, image_byte_arrays: Iterable[bytes], image_format: Union[str, None] = ...) -> Iterator[Tuple[int, bool, bytes]]: ...
+    def get_batch_result(self, future: Future, index: int, image_byte_array: bytes) -> Tuple[int, bool, bytes]: ...
+    def googlify_and_cache(self, image_byte_array: bytes, image: np.ndarray, faces: List[Tuple[int, int, int, int]], eyes: List[Tuple[int, int, int, int]], image_format: Union[str, None], cache_key: Union[str, None], degradation_level: int = ...) -> bytes: ...
+    def googlify_decoded_image(self, image_byte_array: bytes, image: np.ndarray, faces: List[Tuple[int, int, int, int]], eyes: List[Tuple[int, int, int, int]], image_format: Union[str, None], degradation_level: int = ...) -> bytes: ...
+    def detect_eyes_and_annotate(self, image_byte_array: bytes, degradation_level: int = ...) -> Tuple[bool, Dict[str, Any]]: ...
+    def select_degradation_level(self, image_byte_array: bytes, deadline: Union[float, None], operation: str = ...) -> int: ...
+    def get_working_size(self, degradation_level: int = ...) -> int: ...
+    def get_encoding_quality(self, image_format: str, degradation_level: int = ...) -> int: ...
+    def create_rng(self) -> Union[np.random.Generator, None]: ...
+    def create_eye_tracker(self) -> EyeTracker: ...
+    def googlify_frame(self, frame: np.ndarray, eye_tracker: EyeTracker) -> np.ndarray: ...
+    def get_cache_key(self, image_byte_array: bytes, degradation_level: int = ...) -> Union[str, None]: ...
+    def get_cached_detections(self, cache_key: Union[str, None]) -> Union[Dict[str, Any], None]: ...
+    def cache_detections(self, cache_key: Union[str, None], width: int, height: int, faces: List[Tuple[int, int, int, int]], eyes: List[Tuple[int, int, int, int]]) -> None: ...
+    def detect_faces_and_eyes(self, image: np.ndarray, scale: float = ..., degradation_level: int = ...) -> Tuple[List[Tuple[int, int, int, int]], List[Tuple[int, int, int, int]]]: ...
+    def detect_faces_and_eyes_many(self, images: List[np.ndarray]) -> List[Tuple[List[Tuple[int, int, int, int]], List[Tuple[int, int, int, int]]]]: ...
+    def decode_working_image(self, image_byte_array: bytes, degradation_level: int = ...) -> Tuple[Union[np.ndarray, None], float]: ...
+    def decode_image(self, image_byte_array: bytes, reduction: int = ...) -> Union[np.ndarray, None]: ...
+    def encode_unchanged_image(self, image_byte_array: bytes, image: np.ndarray, image_format: Union[str, None], degradation_level: int = ...) -> bytes: ...
     def detect_faces(self, image: np.ndarray) -> List[Tuple[int, int, int, int]]: ...
     def detect_eyes(self, image: np.ndarray, faces: List[Tuple[int, int, int, int]]) -> List[Tuple[int, int, int, int]]: ...
+    def estimate_eyes(self, faces: List[Tuple[int, int, int, int]]) -> List[Tuple[int, int, int, int]]: ...
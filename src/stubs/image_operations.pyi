@@ -1,6 +1,31 @@
 import numpy as np
-from typing import List, Tuple
+from typing import Dict, List, NamedTuple, Tuple, Union
 
-def draw_googly_eyes_on_image(eyes: List[Tuple[int, int, int, int]], image: np.ndarray) -> np.ndarray: ...
-def convert_image_to_bytes(image_cv: np.ndarray) -> bytes: ...
-def convert_bytes_to_image(image_byte_array: bytes) -> np.ndarray: ...
+ENCODE_QUALITY_FLAGS: Dict[str, int]
+DECODE_REDUCTION_FLAGS: Dict[int, int]
+JPEG_MARKERS_WITHOUT_LENGTH: List[int]
+JPEG_START_OF_FRAME_MARKERS: List[int]
+SPRITE_RADIUS_BITS: int
+EYE_OUTLINE_WIDTH: int
+
+class GooglyEye(NamedTuple):
+    eye_center: Tuple[int, int]
+    eye_radius: int
+    pupil_center: Tuple[int, int]
+    pupil_radius: int
+
+def generate_googly_eyes(eyes: List[Tuple[int, int, int, int]], rng: Union[np.random.Generator, None] = ...) -> List[GooglyEye]: ...
+def draw_googly_eyes_on_image(eyes: List[Tuple[int, int, int, int]], image: np.ndarray, rng: Union[np.random.Generator, None] = ...) -> np.ndarray: ...
+def render_googly_eyes(googly_eyes: List[GooglyEye], image: np.ndarray) -> np.ndarray: ...
+def get_googly_eyes_bounds(googly_eyes: List[GooglyEye]) -> List[Tuple[int, int, int, int]]: ...
+def quantize_radius(radius: int) -> int: ...
+def get_eye_sprite(radius: int, channels: int = ...) -> Tuple[np.ndarray, np.ndarray]: ...
+def get_pupil_sprite(radius: int, channels: int = ...) -> Tuple[None, np.ndarray]: ...
+def get_sprite_distances(half_size: int) -> np.ndarray: ...
+def blend_sprite(image: np.ndarray, center: Tuple[int, int], premultiplied_color: Union[np.ndarray, None], transparency: np.ndarray) -> None: ...
+def convert_image_to_bytes(image_cv: np.ndarray, image_format: str = ..., quality: Union[int, None] = ...) -> bytes: ...
+def detect_image_format(image_byte_array: bytes) -> Union[str, None]: ...
+def read_image_size(image_byte_array: bytes) -> Union[Tuple[int, int], None]: ...
+def get_decode_reduction(image_size: Union[Tuple[int, int], None], max_size: int) -> int: ...
+def downscale_image(image: np.ndarray, max_size: int) -> Tuple[np.ndarray, float]: ...
+def convert_bytes_to_image(image_byte_array: bytes, reduction: int = ...) -> np.ndarray: ...
@@ -0,0 +1,18 @@
+import asyncio
+from _typeshed import Incomplete
+from typing import Any, Callable, List, TypeVar, Union
+
+T = TypeVar('T')
+
+class PoolSaturatedError(Exception): ...
+
+class InferencePool:
+    worker_factory: Incomplete
+    max_workers: Incomplete
+    max_queue_size: Incomplete
+    in_flight: int
+    def __init__(self, worker_factory: Callable[[], Any], max_workers: int, max_queue_size: int, preloaded_workers: Union[List[Any], None] = ...) -> None: ...
+    def submit(self, function: Callable[[Any], T]) -> asyncio.Future[T]: ...
+    async def run(self, function: Callable[[Any], T]) -> T: ...
+    def run_on_all_workers(self, function: Callable[[Any], T]) -> List[T]: ...
+    def shutdown(self) -> None: ...
@@ -0,0 +1,84 @@
+import abc
+import urllib.request
+from _typeshed import Incomplete
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Iterable, List, Tuple, Union
+
+QUEUED: str
+RUNNING: str
+DONE: str
+FAILED: str
+TIMED_OUT_ERROR: str
+CLEANUP_INTERVAL: int
+
+class NoRedirectHandler(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl) -> None: ...
+
+WEBHOOK_OPENER: Incomplete
+
+def is_webhook_allowed(url: str, allowed_hosts: Iterable[str]) -> bool: ...
+def is_public_host(host: str, port: int) -> bool: ...
+
+class JobBackend(ABC, metaclass=abc.ABCMeta):
+    config: Incomplete
+    @abstractmethod
+    def __init__(self, config: Dict): ...
+    @abstractmethod
+    def add(self, job_id: str, images: List[bytes], parameters: Dict[str, Any]): ...
+    @abstractmethod
+    def count_pending(self) -> int: ...
+    @abstractmethod
+    def claim(self, job_timeout: float, max_attempts: int) -> Union[Tuple[str, List[bytes], Dict[str, Any], float, int], None]: ...
+    @abstractmethod
+    def finish(self, job_id: str, attempt: int, outputs: List[Union[bytes, None]], errors: List[Union[str, None]]) -> bool: ...
+    @abstractmethod
+    def get(self, job_id: str) -> Union[Dict[str, Any], None]: ...
+    @abstractmethod
+    def get_output(self, job_id: str, index: int) -> Union[bytes, None]: ...
+    @abstractmethod
+    def delete_expired(self, max_age: float) -> int: ...
+
+class MemoryJobBackend(JobBackend):
+    def __init__(self, config: Dict) -> None: ...
+    def add(self, job_id: str, images: List[bytes], parameters: Dict[str, Any]): ...
+    def count_pending(self) -> int: ...
+    def claim(self, job_timeout: float, max_attempts: int) -> Union[Tuple[str, List[bytes], Dict[str, Any], float, int], None]: ...
+    def finish(self, job_id: str, attempt: int, outputs: List[Union[bytes, None]], errors: List[Union[str, None]]) -> bool: ...
+    def get(self, job_id: str) -> Union[Dict[str, Any], None]: ...
+    def get_output(self, job_id: str, index: int) -> Union[bytes, None]: ...
+    def delete_expired(self, max_age: float) -> int: ...
+
+class SqliteJobBackend(JobBackend):
+    path: Incomplete
+    def __init__(self, config: Dict) -> None: ...
+    def add(self, job_id: str, images: List[bytes], parameters: Dict[str, Any]): ...
+    def count_pending(self) -> int: ...
+    def claim(self, job_timeout: float, max_attempts: int) -> Union[Tuple[str, List[bytes], Dict[str, Any], float, int], None]: ...
+    def finish(self, job_id: str, attempt: int, outputs: List[Union[bytes, None]], errors: List[Union[str, None]]) -> bool: ...
+    def get(self, job_id: str) -> Union[Dict[str, Any], None]: ...
+    def get_output(self, job_id: str, index: int) -> Union[bytes, None]: ...
+    def delete_expired(self, max_age: float) -> int: ...
+
+def create_job_id() -> str: ...
+def get_job_backend(config: Dict) -> JobBackend: ...
+def googlify_job(googlifier: Any, images: List[bytes], parameters: Dict[str, Any]) -> Tuple[List[Union[bytes, None]], List[Union[str, None]]]: ...
+
+class JobProcessor:
+    backend: Incomplete
+    worker_factory: Incomplete
+    process_job: Incomplete
+    processors: Incomplete
+    poll_interval: Incomplete
+    job_timeout: Incomplete
+    max_attempts: Incomplete
+    result_ttl: Incomplete
+    webhook_timeout: Incomplete
+    webhook_hosts: Incomplete
+    logger: Incomplete
+    def __init__(self, backend: JobBackend, worker_factory: Callable[[], Any], process_job: Callable[[Any, List[bytes], Dict[str, Any]], Tuple[List[Union[bytes, None]], List[Union[str, None]]]], processors: int, poll_interval: float, job_timeout: float, max_attempts: int, result_ttl: float, webhook_timeout: float, webhook_hosts: Iterable[str] = ...) -> None: ...
+    def start(self) -> None: ...
+    def stop(self) -> None: ...
+    def run_job(self, worker: Any, job_id: str, images: List[bytes], parameters: Dict[str, Any], created: float, attempt: int) -> None: ...
+    def call_webhook(self, url: str, status: Dict[str, Any]) -> None: ...
+
+def get_job_processor(config: Dict, worker_factory: Callable[[], Any], processors: int) -> JobProcessor: ...
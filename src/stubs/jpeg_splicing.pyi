@@ -0,0 +1,37 @@
+import numpy as np
+from typing import Dict, List, NamedTuple, Tuple, Union
+
+ZIGZAG_ORDER: np.ndarray
+DCT_MATRIX: np.ndarray
+ZIGZAG_DCT_MATRIX: np.ndarray
+JPEG_SEQUENTIAL_HUFFMAN_MARKERS: List[int]
+JPEG_END_OF_IMAGE_MARKER: int
+MAX_SPLICED_FRACTION: float
+
+class JpegComponent(NamedTuple):
+    horizontal_sampling: int
+    vertical_sampling: int
+    quantization_table: int
+    dc_table: int
+    ac_table: int
+
+class JpegLayout(NamedTuple):
+    width: int
+    height: int
+    components: List[JpegComponent]
+    quantization_tables: Dict[int, np.ndarray]
+    huffman_tables: Dict[Tuple[int, int], Tuple[np.ndarray, np.ndarray]]
+    restart_interval: int
+    scan_start: int
+
+def encode_jpeg_regions(image_byte_array: bytes, image: np.ndarray, regions: List[Tuple[int, int, int, int]]) -> Union[bytes, None]: ...
+def read_jpeg_layout(image_byte_array: bytes) -> Union[JpegLayout, None]: ...
+def read_exif_orientation(segment: bytes) -> int: ...
+def build_huffman_codes(counts: bytes, symbols: bytes) -> Tuple[np.ndarray, np.ndarray]: ...
+def get_mcu_size(layout: JpegLayout) -> Tuple[int, int, int]: ...
+def split_restart_intervals(image_byte_array: bytes, layout: JpegLayout) -> Union[List[Tuple[int, int]], None]: ...
+def encode_restart_intervals(image: np.ndarray, layout: JpegLayout, intervals: List[int]) -> Union[List[bytes], None]: ...
+def get_quantized_coefficients(image: np.ndarray, layout: JpegLayout, first_row: int, last_row: int, first_column: int, last_column: int) -> np.ndarray: ...
+def encode_huffman(coefficients: np.ndarray, layout: JpegLayout, interval_sizes: np.ndarray) -> Union[List[bytes], None]: ...
+def get_bit_lengths(values: np.ndarray) -> np.ndarray: ...
+def get_magnitude_bits(values: np.ndarray, sizes: np.ndarray) -> np.ndarray: ...
@@ -0,0 +1,74 @@
+from _typeshed import Incomplete
+from typing import ContextManager, Dict, Sequence, Tuple, Union
+
+METRICS_MULTIPROC_DIR: Union[str, None]
+METRICS_FLUSH_INTERVAL: float
+LATENCY_BUCKETS: Tuple[float, ...]
+COUNT_BUCKETS: Tuple[float, ...]
+BYTES_BUCKETS: Tuple[float, ...]
+PIXELS_BUCKETS: Tuple[float, ...]
+MEMORY_BUCKETS: Tuple[float, ...]
+WAIT_BUCKETS: Tuple[float, ...]
+
+class Metric:
+    type: str
+    name: Incomplete
+    documentation: Incomplete
+    labelnames: Incomplete
+    registry: Incomplete
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ..., registry: MetricsRegistry = ...) -> None: ...
+    def snapshot(self) -> Dict[str, object]: ...
+    def reset(self) -> None: ...
+
+class Counter(Metric):
+    def inc(self, amount: float = ..., **labels: str) -> None: ...
+
+class Gauge(Metric):
+    def inc(self, amount: float = ..., **labels: str) -> None: ...
+    def dec(self, amount: float = ..., **labels: str) -> None: ...
+    def set(self, value: float, **labels: str) -> None: ...
+    def track_inprogress(self, **labels: str) -> ContextManager[None]: ...
+
+class Histogram(Metric):
+    buckets: Incomplete
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ..., buckets: Sequence[float] = ..., registry: MetricsRegistry = ...) -> None: ...
+    def observe(self, value: float, **labels: str) -> None: ...
+    def time(self, **labels: str) -> ContextManager[None]: ...
+
+class MetricsRegistry:
+    multiproc_dir: Incomplete
+    flush_interval: Incomplete
+    metrics: Dict[str, Metric]
+    def __init__(self, multiproc_dir: str = ..., flush_interval: float = ...) -> None: ...
+    def register(self, metric: Metric) -> None: ...
+    def start_flushing(self) -> None: ...
+    def reset_after_fork(self) -> None: ...
+    def snapshot(self) -> Dict[str, Dict[str, object]]: ...
+    def write_snapshot(self) -> None: ...
+    def collect(self) -> Dict[str, Dict[str, object]]: ...
+    def generate_latest(self) -> str: ...
+
+REGISTRY: MetricsRegistry
+STAGE_DURATION: Histogram
+IMAGES: Counter
+FACES_PER_IMAGE: Histogram
+EYES_PER_IMAGE: Histogram
+INPUT_BYTES: Histogram
+INPUT_PIXELS: Histogram
+IN_FLIGHT: Gauge
+IMAGE_MEMORY: Histogram
+PEAK_RESIDENT_MEMORY: Gauge
+VIDEO_FRAMES: Counter
+JPEG_REGION_ENCODING: Counter
+DEGRADED_IMAGES: Counter
+CACHE_REQUESTS: Counter
+CACHE_EVICTIONS: Counter
+CACHE_DROPPED_WRITES: Counter
+JOBS: Counter
+JOB_QUEUE_WAIT: Histogram
+MODEL_LOAD_DURATION: Histogram
+MODEL_MEMORY: Gauge
+WARMUP_DURATION: Histogram
+POOL_IN_FLIGHT: Gauge
+POOL_REJECTED: Counter
+REQUESTS_TOO_LARGE: Counter
@@ -0,0 +1,23 @@
+import cv2 as cv
+from _typeshed import Incomplete
+from typing import Any, Callable, List, NamedTuple, TypeVar
+
+T = TypeVar('T')
+
+MATRIX_NODE_KEYS: Incomplete
+
+class ModelLoad(NamedTuple):
+    name: str
+    path: str
+    seconds: float
+    memory_bytes: int
+
+def get_rss_bytes() -> int: ...
+def get_peak_rss_bytes() -> int: ...
+def load_model(name: str, path: str, loader: Callable[[str], T], model_loads: List[ModelLoad]) -> T: ...
+def load_file_storage_model(name: str, path: str, loader: Callable[[str], T], model_loads: List[ModelLoad], cache_dir: str = ...) -> T: ...
+def get_binary_model_path(model_path: str, cache_dir: str) -> str: ...
+def get_quantized_model_path(model_path: str, cache_dir: str) -> str: ...
+def get_converted_model_path(model_path: str, cache_dir: str, suffix: str, convert: Callable[[str, str], Any]) -> str: ...
+def quantize_onnx_model(source_path: str, target_path: str) -> None: ...
+def convert_to_binary_storage(source_path: str, target_path: str) -> None: ...
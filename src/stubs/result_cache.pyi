@@ -0,0 +1,50 @@
+import abc
+from _typeshed import Incomplete
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, List, Tuple, Union
+
+BACKEND_WRITE_QUEUE_SIZE: int
+ACCESS_UPDATE_INTERVAL: int
+
+class CacheBackend(ABC, metaclass=abc.ABCMeta):
+    evictions: int
+    config: Incomplete
+    @abstractmethod
+    def __init__(self, config: Dict): ...
+    @abstractmethod
+    def get(self, key: str) -> Union[bytes, None]: ...
+    @abstractmethod
+    def set(self, key: str, value: bytes): ...
+
+class SqliteCacheBackend(CacheBackend):
+    path: Incomplete
+    max_bytes: Incomplete
+    access_update_interval: Incomplete
+    evictions: int
+    def __init__(self, config: Dict) -> None: ...
+    def get(self, key: str) -> Union[bytes, None]: ...
+    def set(self, key: str, value: bytes): ...
+
+class ResultCache:
+    max_bytes: Incomplete
+    store_rendered: Incomplete
+    backend: Incomplete
+    size: int
+    hits: int
+    misses: int
+    evictions: int
+    logger: Incomplete
+    def __init__(self, max_bytes: int, store_rendered: bool, backend: Union[CacheBackend, None] = ...) -> None: ...
+    @staticmethod
+    def get_key(image_byte_array: bytes, context: str = ...) -> str: ...
+    def get(self, key: str) -> Union[bytes, None]: ...
+    def set(self, key: str, value: bytes): ...
+    def flush(self) -> None: ...
+    def get_detections(self, key: str) -> Union[Dict[str, Any], None]: ...
+    def set_detections(self, key: str, width: int, height: int, faces: List[Tuple[int, int, int, int]], eyes: List[Tuple[int, int, int, int]]): ...
+    def get_rendered(self, key: str, image_format: str) -> Union[bytes, None]: ...
+    def set_rendered(self, key: str, image_format: str, image_byte_array: bytes): ...
+    def get_stats(self) -> Dict[str, int]: ...
+
+def get_config_hash(config: Dict, sections: Iterable[str]) -> str: ...
+def get_result_cache(config: Dict) -> Union[ResultCache, None]: ...
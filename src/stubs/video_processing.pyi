@@ -0,0 +1,25 @@
+import cv2 as cv
+import numpy as np
+import queue
+import threading
+from typing import Any, BinaryIO, Callable, Iterable, Iterator, TypeVar, Union
+
+T = TypeVar('T')
+
+MULTIPART_BOUNDARY: str
+END_OF_STREAM: object
+
+def put_until_stopped(items: queue.Queue, item: Any, stop: threading.Event) -> bool: ...
+def get_until_stopped(items: queue.Queue, stop: threading.Event) -> Any: ...
+class QueueFile:
+    chunks: queue.Queue
+    stop: threading.Event
+    ended: bool
+    def __init__(self, chunks: queue.Queue, stop: threading.Event) -> None: ...
+    def read(self, size: int = ...) -> bytes: ...
+
+def open_video(video_path: str) -> Union[cv.VideoCapture, None]: ...
+def read_video_frames(capture: cv.VideoCapture) -> Iterator[np.ndarray]: ...
+def read_multipart_frames(file_object: BinaryIO, boundary: str, chunk_size: int = ...) -> Iterator[np.ndarray]: ...
+def encode_multipart_part(image_byte_array: bytes, media_type: str, headers: Union[dict, None] = ...) -> bytes: ...
+def googlify_video_frames(googlifier: Any, frames: Iterable[np.ndarray], encode: Union[Callable[[np.ndarray], T], None], encode_workers: int, queue_size: int) -> Iterator[T]: ...
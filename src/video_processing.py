@@ -0,0 +1,258 @@
+import queue
+import threading
+import time
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, BinaryIO, Callable, Iterable, Iterator, Union, TypeVar
+
+import cv2 as cv
+import numpy as np
+
+import setup_logger
+from metrics import VIDEO_FRAMES
+from image_operations import convert_bytes_to_image
+
+T = TypeVar("T")
+
+# Boundary of the parts of the multipart streams returned by the service
+MULTIPART_BOUNDARY = "frame"
+
+# Marks the end of the items of a queue
+END_OF_STREAM = object()
+
+
+def put_until_stopped(items: queue.Queue, item: Any, stop: threading.Event) -> bool:
+    """ Puts an item in a bounded queue, waiting while it is full unless the stream is stopped.
+
+    Args:
+        items: The queue.
+        item: The item to put in the queue.
+        stop: Event set when the consumer of the queue is gone.
+
+    Returns: Whether the item was put in the queue.
+    """
+    while not stop.is_set():
+        try:
+            items.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def get_until_stopped(items: queue.Queue, stop: threading.Event) -> Any:
+    """ Gets an item from a queue, waiting while it is empty unless the stream is stopped.
+
+    Args:
+        items: The queue.
+        stop: Event set when the producer of the queue is gone.
+
+    Returns: The item or END_OF_STREAM if the stream was stopped.
+    """
+    while not stop.is_set():
+        try:
+            return items.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return END_OF_STREAM
+
+
+class QueueFile:
+    """ Read-only binary file whose content arrives in chunks through a queue, such as the body of a request read by
+    the event loop, so a multipart stream can be parsed while it is still being received. """
+
+    def __init__(self, chunks: queue.Queue, stop: threading.Event):
+        """
+        Args:
+            chunks: The queue with the chunks of the content, then END_OF_STREAM. An exception put in the queue is
+                    raised by read.
+            stop: Event set when the producer of the queue is gone.
+        """
+        self.chunks = chunks
+        self.stop = stop
+        self.ended = False
+
+    def read(self, size: int = -1) -> bytes:
+        """ Reads the next chunk of the content, waiting until it arrives. The chunks are returned as they were put in
+        the queue, so size is only a hint.
+
+        Args:
+            size: The number of bytes requested.
+
+        Returns: The chunk or an empty bytes object at the end of the content.
+        """
+        if self.ended:
+            return b""
+        chunk = get_until_stopped(self.chunks, self.stop)
+        if isinstance(chunk, Exception):
+            self.ended = True
+            raise chunk
+        if chunk is END_OF_STREAM:
+            self.ended = True
+            return b""
+        return chunk
+
+
+def open_video(video_path: str) -> Union[cv.VideoCapture, None]:
+    """ Opens a video file or stream for reading.
+
+    Args:
+        video_path: The path of the video file or the url of the stream.
+
+    Returns: The opened video capture or None if the video can not be read.
+    """
+    capture = cv.VideoCapture(video_path)
+    if not capture.isOpened():
+        capture.release()
+        return None
+    return capture
+
+
+def read_video_frames(capture: cv.VideoCapture) -> Iterator[np.ndarray]:
+    """ Reads the frames of a video one by one, so the video is never fully loaded in memory.
+
+    Args:
+        capture: An opened video capture of a video file, a stream or a camera.
+
+    Returns: An iterator with each frame as a numpy array in the BGR color space.
+    """
+    try:
+        while True:
+            success, frame = capture.read()
+            if not success or frame is None:
+                return
+            yield frame
+    finally:
+        capture.release()
+
+
+def read_multipart_frames(file_object: BinaryIO, boundary: str, chunk_size: int = 65536) -> Iterator[np.ndarray]:
+    """ Reads the frames of a multipart stream of images, such as an MJPEG stream, one by one. Parts that are not a
+    valid image are skipped.
+
+    Args:
+        file_object: The binary file with the multipart stream.
+        boundary: The boundary between the parts of the stream, as given in the Content-Type header.
+        chunk_size: Number of bytes read from the file at once.
+
+    Returns: An iterator with each frame as a numpy array in the BGR color space.
+    """
+    delimiter = b"--" + boundary.encode()
+    buffer = bytearray()
+    end_of_file = False
+    while not end_of_file:
+        chunk = file_object.read(chunk_size)
+        end_of_file = not chunk
+        buffer += chunk
+
+        # Each complete part lies between two delimiters, at the end of the file the last part may not be closed
+        while True:
+            start = buffer.find(delimiter)
+            if start < 0:
+                break
+            end = buffer.find(delimiter, start + len(delimiter))
+            if end < 0 and not end_of_file:
+                break
+
+            part = bytes(buffer[start + len(delimiter):end if end >= 0 else len(buffer)])
+            del buffer[:end if end >= 0 else len(buffer)]
+
+            headers_end = part.find(b"\r\n\r\n")
+            if headers_end < 0:
+                continue
+            body = part[headers_end + 4:]
+            if body.endswith(b"\r\n"):
+                body = body[:-2]
+            try:
+                frame = convert_bytes_to_image(body) if body else None
+            except cv.error:
+                frame = None
+            if frame is not None:
+                yield frame
+
+
+def encode_multipart_part(image_byte_array: bytes, media_type: str, headers: Union[dict, None] = None) -> bytes:
+    """ Encodes an image as a part of a multipart stream with the MULTIPART_BOUNDARY boundary.
+
+    Args:
+        image_byte_array: The image as bytes.
+        media_type: The media type of the image.
+        headers: Extra headers of the part.
+
+    Returns: The part as bytes, including its delimiter.
+    """
+    lines = ["--" + MULTIPART_BOUNDARY, "Content-Type: " + media_type,
+             "Content-Length: " + str(len(image_byte_array))]
+    lines += [name + ": " + str(value) for name, value in (headers or {}).items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode() + image_byte_array + b"\r\n"
+
+
+def googlify_video_frames(googlifier: Any, frames: Iterable[np.ndarray],
+                          encode: Union[Callable[[np.ndarray], T], None], encode_workers: int, queue_size: int) -> Iterator[T]:
+    """ Draws the googly eyes on the frames of a video as a pipeline. The frames are decoded in a producer thread, the
+    googly eyes are drawn in the calling thread, since the eye tracking depends on the previous frame, and the frames
+    are encoded in a pool of threads, so each stage runs on a different core. The queues between the stages are bounded
+    so only a few frames are in memory at any time.
+
+    Args:
+        googlifier: The Googlifier instance used to draw the googly eyes.
+        frames: Iterable with the frames as numpy arrays in the BGR color space, usually decoded lazily.
+        encode: Callable that encodes a frame with googly eyes. If None the frames are returned without encoding.
+        encode_workers: Number of threads encoding frames.
+        queue_size: Maximum number of frames waiting between two stages.
+
+    Returns: An iterator with the encoded frames in the same order as the input frames.
+    """
+    logger = logging.getLogger(setup_logger.LOGGER_NAME)
+    decoded_frames: queue.Queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def decode_frames():
+        try:
+            for frame in frames:
+                if not put_until_stopped(decoded_frames, frame, stop):
+                    return
+        except Exception as e:
+            put_until_stopped(decoded_frames, e, stop)
+        finally:
+            put_until_stopped(decoded_frames, END_OF_STREAM, stop)
+
+    threading.Thread(target=decode_frames, name="video-decoder", daemon=True).start()
+
+    eye_tracker = googlifier.create_eye_tracker()
+    pending = deque()
+    frame_count = 0
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=max(encode_workers, 1), thread_name_prefix="video-encoder") as executor:
+            while True:
+                # Frames already encoded are not held back waiting for the next one, which in a live stream may
+                # take a while to arrive
+                if pending and decoded_frames.empty():
+                    yield pending.popleft().result()
+                    continue
+                frame = decoded_frames.get()
+                if frame is END_OF_STREAM:
+                    break
+                if isinstance(frame, Exception):
+                    raise frame
+
+                frame = googlifier.googlify_frame(frame, eye_tracker)
+                frame_count += 1
+                VIDEO_FRAMES.inc()
+                if encode is None:
+                    yield frame
+                    continue
+
+                pending.append(executor.submit(encode, frame))
+                if len(pending) >= queue_size:
+                    yield pending.popleft().result()
+
+            while pending:
+                yield pending.popleft().result()
+    finally:
+        stop.set()
+        elapsed = time.perf_counter() - start
+        logger.info("Googlified %d video frames at %.1f frames per second.", frame_count,
+                    frame_count / elapsed if elapsed > 0 else 0.0)
@@ -0,0 +1,261 @@
+"""
+Offline benchmark suite of the googlify pipeline and API. It needs neither a running server nor locust:
+
+- The stages of the Googlifier are timed one by one on images of several sizes built by tiling the test image, so the
+  number of faces grows with the number of tiles.
+- The API is loaded in process through its ASGI interface with several concurrent clients, measuring the throughput
+  and the latency of the "googlify/raw" endpoint.
+
+The result cache is disabled so every image goes through the whole pipeline. The results are saved as JSON and, when a
+baseline file from a previous run is given, compared with it: the run fails if a latency grows or a throughput drops
+by more than the tolerance.
+
+Run from the root of the repository with:
+PYTHONPATH=src python -m tests.performance_tests.benchmark_suite --output results.json [--baseline baseline.json]
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import tempfile
+import argparse
+import platform
+from typing import Any, Callable, Dict, List
+
+import cv2 as cv
+import numpy as np
+import yaml
+
+from src.constants import CONFIG_FILE_PATH
+from src.image_operations import downscale_image, draw_googly_eyes_on_image, convert_image_to_bytes
+
+TEST_IMAGE_PATH = "tests/test_data/people_test_image.jpg"
+# Largest side of the benchmarked images and number of copies of the test image per side
+IMAGE_SIZES = [640, 1280, 2560]
+TILES_PER_SIDE = [1, 2, 4]
+API_CONCURRENCY = [1, 4, 16]
+API_REQUESTS = 64
+
+
+def get_config_without_cache(config_file_path: str) -> str:
+    """ Writes a copy of a config file with the result cache disabled.
+
+    Args:
+        config_file_path: The path of the config file.
+
+    Returns: The path of the copy.
+    """
+    with open(config_file_path, "r") as file_object:
+        config = yaml.load(file_object, Loader=yaml.SafeLoader)
+    config["cache"] = {"enabled": False}
+    file_descriptor, path = tempfile.mkstemp(suffix=".yaml")
+    with os.fdopen(file_descriptor, "w") as file_object:
+        yaml.safe_dump(config, file_object)
+    return path
+
+
+def create_tiled_image(image: np.ndarray, tiles_per_side: int, size: int) -> np.ndarray:
+    """ Creates a test image with several copies of an image in a grid, resized so its largest side is size.
+
+    Args:
+        image: The image to tile.
+        tiles_per_side: Number of copies of the image in each row and column.
+        size: The largest side of the test image.
+
+    Returns: The test image.
+    """
+    tiled_image = np.tile(image, (tiles_per_side, tiles_per_side, 1))
+    scale = size / max(tiled_image.shape[:2])
+    interpolation = cv.INTER_AREA if scale < 1 else cv.INTER_LINEAR
+    return cv.resize(tiled_image, None, fx=scale, fy=scale, interpolation=interpolation)
+
+
+def measure(function: Callable[[], Any], repetitions: int) -> Dict[str, float]:
+    """ Times a function after a warm up call.
+
+    Args:
+        function: The function to time.
+        repetitions: Number of timed calls.
+
+    Returns: A dictionary with the median and the 95th percentile of the time in milliseconds.
+    """
+    function()
+    times = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1e3)
+    return {"median_ms": float(np.median(times)), "p95_ms": float(np.percentile(times, 95))}
+
+
+def benchmark_stages(googlifier: Any, repetitions: int) -> Dict[str, Dict[str, Any]]:
+    """ Times each stage of the googlifier on images of several sizes and numbers of faces.
+
+    Args:
+        googlifier: The Googlifier instance.
+        repetitions: Number of timed calls of each stage.
+
+    Returns: A dictionary with the results of each stage and image, named "stage/<stage>/<size>px/<tiles>x<tiles>".
+    """
+    test_image = cv.imread(TEST_IMAGE_PATH)
+    results = {}
+    for size in IMAGE_SIZES:
+        for tiles_per_side in TILES_PER_SIDE:
+            image = create_tiled_image(test_image, tiles_per_side, size)
+            image_byte_array = convert_image_to_bytes(image, ".jpg", 90)
+            working_image, _ = downscale_image(image, googlifier.max_working_size)
+            faces, eyes = googlifier.detect_faces_and_eyes(image)
+            working_faces = googlifier.detect_faces(working_image)
+
+            stages = {
+                "decode": lambda: googlifier.decode_working_image(image_byte_array),
+                "downscale": lambda: downscale_image(image, googlifier.max_working_size),
+                "face_detection": lambda: googlifier.detect_faces(working_image),
+                "eye_detection": lambda: googlifier.detect_eyes(working_image, working_faces) if working_faces else [],
+                "drawing": lambda: draw_googly_eyes_on_image(eyes, image.copy()),
+                "encode": lambda: convert_image_to_bytes(image, ".jpg", 90),
+                "total": lambda: googlifier.detect_eyes_and_googlify(image_byte_array),
+            }
+            name = str(size) + "px/" + str(tiles_per_side) + "x" + str(tiles_per_side)
+            for stage, function in stages.items():
+                result = {"faces": len(faces), **measure(function, repetitions)}
+                results["stage/" + stage + "/" + name] = result
+                print(f"{'stage/' + stage + '/' + name:>40} {len(faces):>4} faces {result['median_ms']:>10.2f} ms")
+    return results
+
+
+async def load_api(app: Any, image_byte_array: bytes, concurrency: int, number_of_requests: int) -> Dict[str, Any]:
+    """ Sends requests to the "googlify/raw" endpoint of the API in process, keeping a number of requests in flight.
+
+    Args:
+        app: The ASGI application.
+        image_byte_array: The image sent in every request.
+        concurrency: Number of requests in flight at any time.
+        number_of_requests: Total number of requests.
+
+    Returns: A dictionary with the throughput, the latency percentiles and the number of rejected requests.
+    """
+    import httpx
+
+    latencies: List[float] = []
+    rejected = 0
+    remaining = iter(range(number_of_requests))
+
+    async with httpx.AsyncClient(app=app, base_url="http://benchmark", timeout=None) as client:
+        async def send_requests():
+            nonlocal rejected
+            for _ in remaining:
+                start = time.perf_counter()
+                response = await client.post("/googlify/raw", content=image_byte_array,
+                                             headers={"Content-Type": "image/jpeg"})
+                if response.status_code == 200:
+                    latencies.append((time.perf_counter() - start) * 1e3)
+                else:
+                    rejected += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*[send_requests() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+
+    return {"requests_per_second": len(latencies) / elapsed,
+            "p50_ms": float(np.percentile(latencies, 50)) if latencies else 0.0,
+            "p95_ms": float(np.percentile(latencies, 95)) if latencies else 0.0,
+            "rejected": rejected}
+
+
+def benchmark_api(number_of_requests: int) -> Dict[str, Dict[str, Any]]:
+    """ Loads the API in process with several levels of concurrency.
+
+    Args:
+        number_of_requests: Number of requests sent at each level of concurrency.
+
+    Returns: A dictionary with the results of each level of concurrency, named "api/<concurrency>".
+    """
+    from src.api.api import app, inference_pool
+
+    with open(TEST_IMAGE_PATH, "rb") as file_object:
+        image_byte_array = file_object.read()
+
+    results = {}
+    try:
+        for concurrency in API_CONCURRENCY:
+            # Warm up the threads of the inference pool
+            asyncio.run(load_api(app, image_byte_array, concurrency, concurrency))
+            result = asyncio.run(load_api(app, image_byte_array, concurrency, number_of_requests))
+            results["api/" + str(concurrency)] = result
+            print(f"{'api/' + str(concurrency):>40} {result['requests_per_second']:>10.1f} req/s "
+                  f"{result['p95_ms']:>10.1f} ms p95")
+    finally:
+        inference_pool.shutdown()
+    return results
+
+
+def compare_with_baseline(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+                          tolerance: float) -> List[str]:
+    """ Compares the results with a baseline. Latencies, the fields ending in "_ms", must not grow and throughputs, the
+    fields ending in "_per_second", must not drop by more than the tolerance. Benchmarks missing in either are ignored.
+
+    Args:
+        results: The results of the current run.
+        baseline: The results of the baseline run.
+        tolerance: The allowed relative change, e.g. 0.2 for 20%.
+
+    Returns: A list with a description of each regression.
+    """
+    regressions = []
+    for name, result in results.items():
+        for field, value in result.items():
+            baseline_value = baseline.get(name, {}).get(field)
+            if not baseline_value:
+                continue
+            change = value / baseline_value - 1
+            slower = field.endswith("_ms") and change > tolerance
+            lower_throughput = field.endswith("_per_second") and -change > tolerance
+            if slower or lower_throughput:
+                regressions.append(f"{name} {field}: {baseline_value:.2f} -> {value:.2f} ({change:+.0%})")
+    return regressions
+
+
+def main(arguments: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks the googlify pipeline and API.")
+    parser.add_argument("--output", default="benchmark_results.json", help="Path of the JSON file with the results.")
+    parser.add_argument("--baseline", help="Path of the JSON results of a previous run to compare with.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression, 0.2 by default.")
+    parser.add_argument("--repetitions", type=int, default=10, help="Number of timed runs of each stage.")
+    parser.add_argument("--requests", type=int, default=API_REQUESTS, help="Number of requests per API load level.")
+    parser.add_argument("--skip-api", action="store_true", help="Only benchmark the stages of the googlifier.")
+    args = parser.parse_args(arguments)
+
+    # The environment variable is read when the API is imported, so it must be set before
+    config_file_path = get_config_without_cache(CONFIG_FILE_PATH)
+    os.environ["CONFIG_FILE_PATH"] = config_file_path
+    try:
+        from googlifier import Googlifier
+
+        results = benchmark_stages(Googlifier(config_file_path), args.repetitions)
+        if not args.skip_api:
+            results.update(benchmark_api(args.requests))
+    finally:
+        os.remove(config_file_path)
+
+    with open(args.output, "w") as file_object:
+        json.dump({"machine": {"platform": platform.platform(), "processor": platform.processor(),
+                               "cpu_count": os.cpu_count(), "opencv": cv.__version__},
+                   "results": results}, file_object, indent=2)
+    print("Results saved to " + args.output)
+
+    if args.baseline:
+        with open(args.baseline, "r") as file_object:
+            baseline = json.load(file_object)
+        regressions = compare_with_baseline(results, baseline["results"], args.tolerance)
+        for regression in regressions:
+            print("Regression: " + regression)
+        if regressions:
+            return 1
+        print("No regressions against " + args.baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
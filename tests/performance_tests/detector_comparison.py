@@ -0,0 +1,110 @@
+"""
+Comparison of the two stage detection (face detector followed by the eyes detector) with the combined face and eyes
+detector of the "detector" section of the config file, on the images of tests/test_data. For each image it reports the
+median latency of each path, and how well the detections of the combined detector match the ones of the two stage path,
+which are taken as the reference since there are no labelled eyes: the faces found by both and the median distance
+between the matched eyes relative to the distance between the eyes of the face.
+
+The "detector" section is commented in src/config.yaml, uncomment it or pass another config file as argument.
+
+Run from the root of the repository with: PYTHONPATH=src python -m tests.performance_tests.detector_comparison [config]
+"""
+import glob
+import os
+import sys
+import time
+from typing import Callable, List, Tuple
+
+import cv2 as cv
+import numpy as np
+import yaml
+
+from src.detectors.base_detector import get_detector, get_field
+from src.image_operations import downscale_image
+
+CONFIG_PATH = "src/config.yaml"
+IMAGES_PATTERN = "tests/test_data/*.jpg"
+MAX_WORKING_SIZE = 1280
+REPETITIONS = 20
+# Faces of both paths overlapping more than this intersection over union are the same face
+FACE_MATCH_IOU = 0.3
+
+
+def create_detector(config: dict, section: str):
+    """ Creates the detector configured in a section of the config file. """
+    detector_config = get_field(config, section)
+    return get_detector(get_field(detector_config, "model_class"))(get_field(detector_config, "parameters"))
+
+
+def measure(function: Callable[[], Tuple[list, list]]) -> Tuple[float, Tuple[list, list]]:
+    """ Runs a detection REPETITIONS times after a warm up run.
+
+    Returns: The median time in seconds and the detections.
+    """
+    detections = function()
+    times = []
+    for _ in range(REPETITIONS):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times)), detections
+
+
+def get_iou(box_a: Tuple[int, int, int, int], box_b: Tuple[int, int, int, int]) -> float:
+    """ Gets the intersection over union of two boxes in the format (x, y, width, height). """
+    x_start, y_start = max(box_a[0], box_b[0]), max(box_a[1], box_b[1])
+    x_end = min(box_a[0] + box_a[2], box_b[0] + box_b[2])
+    y_end = min(box_a[1] + box_a[3], box_b[1] + box_b[3])
+    intersection = max(x_end - x_start, 0) * max(y_end - y_start, 0)
+    union = box_a[2] * box_a[3] + box_b[2] * box_b[3] - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def compare_detections(reference: Tuple[list, list], detections: Tuple[list, list]) -> Tuple[int, float]:
+    """ Compares the detections of the combined detector with the ones of the two stage path. The two eyes of each face
+    are one after the other in the list of eyes of both paths.
+
+    Returns: The number of reference faces found by the combined detector and the median distance between their eyes,
+             relative to the distance between the reference eyes, or nan if no face was matched.
+    """
+    reference_faces, reference_eyes = reference
+    faces, eyes = detections
+    matched_faces = 0
+    errors: List[float] = []
+    for face_index, reference_face in enumerate(reference_faces):
+        ious = [get_iou(reference_face, face) for face in faces]
+        if not ious or max(ious) <= FACE_MATCH_IOU:
+            continue
+        matched_faces += 1
+        match_index = int(np.argmax(ious))
+        if len(reference_eyes) < 2 * (face_index + 1) or len(eyes) < 2 * (match_index + 1):
+            continue
+
+        reference_centers = np.array([(x + w / 2, y + h / 2) for x, y, w, h in
+                                      reference_eyes[2 * face_index:2 * face_index + 2]])
+        centers = np.array([(x + w / 2, y + h / 2) for x, y, w, h in eyes[2 * match_index:2 * match_index + 2]])
+        eye_distance = max(float(np.linalg.norm(reference_centers[1] - reference_centers[0])), 1.0)
+        errors += list(np.linalg.norm(centers - reference_centers, axis=1) / eye_distance)
+    return matched_faces, float(np.median(errors)) if errors else float("nan")
+
+
+if __name__ == "__main__":
+    with open(sys.argv[1] if len(sys.argv) > 1 else CONFIG_PATH, "r") as file_object:
+        config = yaml.load(file_object, Loader=yaml.SafeLoader)
+    face_detector = create_detector(config, "face_detector")
+    eyes_detector = create_detector(config, "eyes_detector")
+    face_eyes_detector = create_detector(config, "detector")
+
+    def detect_two_stages(image: np.ndarray) -> Tuple[list, list]:
+        faces = face_detector.detect(image)
+        return faces, eyes_detector.detect(image, faces) if faces else []
+
+    print(f"{'image':>28} {'two stages (ms)':>16} {'combined (ms)':>14} {'speedup':>8} {'faces':>7} "
+          f"{'eye error':>10}")
+    for image_path in sorted(glob.glob(IMAGES_PATTERN)):
+        image, _ = downscale_image(cv.imread(image_path), MAX_WORKING_SIZE)
+        two_stages_time, reference = measure(lambda: detect_two_stages(image))
+        combined_time, detections = measure(lambda: face_eyes_detector.detect_faces_and_eyes(image))
+        matched_faces, eye_error = compare_detections(reference, detections)
+        print(f"{os.path.basename(image_path):>28} {two_stages_time * 1e3:>16.1f} {combined_time * 1e3:>14.1f} "
+              f"{two_stages_time / combined_time:>7.1f}x {matched_faces:>3}/{len(reference[0]):<3} {eye_error:>10.2f}")
@@ -2,6 +2,12 @@ from locust import task, between, FastHttpUser
 import base64
 import os
 
+# The test image is read and encoded once, so the tasks only measure the requests
+filename = os.getcwd() + "/tests/test_data/people_test_image.jpg"
+with open(filename, "rb") as image_file:
+    image_contents = image_file.read()
+image_base64 = base64.b64encode(image_contents).decode('utf-8')
+
 
 class PerformanceTests(FastHttpUser):
     wait_time = between(1, 3)
@@ -10,9 +16,20 @@ class PerformanceTests(FastHttpUser):
     def test_tf_predict(self):
         """ Makes a request to the API endpoint "googlify" using a test image"""
 
-        filename = os.getcwd() + "/tests/test_data/people_test_image.jpg"
-        with open(filename, "rb") as image_file:
-            image_base64 = base64.b64encode(image_file.read())
-        input_dict = {"base64_str": image_base64.decode('utf-8')}
+        input_dict = {"base64_str": image_base64}
 
         _ = self.client.post("/googlify/", json=input_dict)
+
+    @task(1)
+    def test_googlify_raw(self):
+        """ Makes a request to the API endpoint "googlify/raw" using a test image"""
+
+        _ = self.client.post("/googlify/raw", data=image_contents, headers={"Content-Type": "image/jpeg"})
+
+    @task(1)
+    def test_googlify_batch(self):
+        """ Makes a request to the API endpoint "googlify/batch" using a batch of test images"""
+
+        input_dict = {"images": [{"base64_str": image_base64}] * 8}
+
+        _ = self.client.post("/googlify/batch", json=input_dict)
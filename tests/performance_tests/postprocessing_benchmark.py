@@ -0,0 +1,143 @@
+"""
+Micro-benchmark of the post-processing of the face detector output. It compares the original per-detection python loop
+with the vectorized version used by FaceDetectorCV2 on a synthetic SSD output with 200 candidates.
+
+Run from the root of the repository with: python -m tests.performance_tests.postprocessing_benchmark
+"""
+import timeit
+from typing import List, Tuple
+
+import numpy as np
+
+from src.detection_helpers import ssd_detections_to_boxes
+
+CONFIDENCE_THRESH = 0.4
+ENLARGE_PERCENTAGE = 0.15
+IMAGE_SHAPE = (3024, 4032, 3)
+NUMBER_OF_CANDIDATES = 200
+REPETITIONS = 2000
+
+
+# Copies of the helpers as they were before being vectorized
+def legacy_make_bbox_larger(coordinates: Tuple[int, int, int, int], percentage: float) -> Tuple[float, float, float, float]:
+    """ Makes a bounding box larger. It receives as input a bounding box in the format (xmin, ymin, xmax, ymax)
+    and makes it larger by a percentage factor given by the input.
+
+    Args:
+        coordinates: Tuple representing bounding box coordinates in the format (xmin, ymin, xmax, ymax).
+        percentage: The percentage by which to enlarge the bounding box.
+
+    Returns: The new bounding box coordinates in the format (xmin, ymin, xmax, ymax).
+    """
+
+    xmin, ymin, xmax, ymax = [float(i) for i in coordinates]
+    width = xmax - xmin
+    height = ymax - ymin
+    xmin -= percentage * float(width)
+    xmax += percentage * float(width)
+    ymin -= percentage * float(height)
+    ymax += percentage * float(height)
+
+    return xmin, ymin, xmax, ymax
+
+
+def legacy_clip_detections(detections: List[Tuple[int, int, int, int]], image_shape) -> List[Tuple[int, int, int, int]]:
+    """ Clips the detections to the boundaries of the image. In the case that a detection is completely out of the image
+    it removes it completely from the list.
+
+    Args:
+        detections: List made out of tuples representing the coordinates of a detection in the format:
+                    (x, y, width, height).
+        image_shape: Tuple with the shape of the image in the format (h, w, c).
+
+    Returns: The list of detections clipped to the boundary of the image in the same format as the input.
+    """
+
+    clipped_detections: List[Tuple] = []
+    for i in range(len(detections)):
+        x, y, w, h = detections[i]
+        x_end = x + w
+        y_end = y + h
+        img_height, img_width, _ = image_shape
+
+        # The detection is completely outside or the image
+        if x > img_width or y > img_height or x_end < 0 or y_end < 0:
+            continue
+
+        # If one of the sides of the detection is outside the image it clips it to its boundaries.
+        clipped_detection = list(detections[i])
+        if x < 0:
+            clipped_detection[0] = 0
+            # When clipping x the width of the detection should account for the change
+            # The width should be reduced by the distance between x and 0 in order for the x_end to be in the same
+            # place as before. Works similarly for the height.
+            clipped_detection[2] += int(x)
+            w = clipped_detection[2]
+        if y < 0:
+            clipped_detection[1] = 0
+            # When clipping y the height of the detection should account for the change
+            clipped_detection[3] += int(y)
+            h = clipped_detection[3]
+
+        if x + w > img_width:
+            clipped_detection[2] = int(img_width - x)
+        if y + h > img_height:
+            clipped_detection[3] = int(img_height - y)
+
+        clipped_detections.append(tuple(clipped_detection))
+
+    return clipped_detections
+
+
+def make_ssd_output(number_of_faces: int) -> np.ndarray:
+    """ Creates a synthetic SSD output where number_of_faces candidates are above the confidence threshold.
+
+    Args:
+        number_of_faces: Number of candidates with a high confidence.
+
+    Returns: Array with shape (NUMBER_OF_CANDIDATES, 7) in the format of the SSD detector output.
+    """
+    rng = np.random.default_rng(0)
+    detections = np.zeros((NUMBER_OF_CANDIDATES, 7), dtype=np.float32)
+    detections[:, 1] = 1
+    detections[:, 2] = rng.uniform(0, CONFIDENCE_THRESH, NUMBER_OF_CANDIDATES)
+    detections[:number_of_faces, 2] = rng.uniform(CONFIDENCE_THRESH, 1, number_of_faces)
+    corners = rng.uniform(-0.1, 1.1, (NUMBER_OF_CANDIDATES, 2))
+    sizes = rng.uniform(0.01, 0.2, (NUMBER_OF_CANDIDATES, 2))
+    detections[:, 3:5] = corners
+    detections[:, 5:7] = corners + sizes
+    return detections
+
+
+def loop_postprocessing(detections: np.ndarray):
+    """ The post-processing as it was done before, one detection at a time. """
+    h, w = IMAGE_SHAPE[:2]
+    faces = []
+    for i in range(0, detections.shape[0]):
+        confidence = detections[i, 2]
+        if confidence > CONFIDENCE_THRESH:
+            box = detections[i, 3:7] * np.array([w, h, w, h])
+            (startX, startY, endX, endY) = legacy_make_bbox_larger(box, ENLARGE_PERCENTAGE)
+            faces.append((int(startX), int(startY), int(endX - startX), int(endY - startY)))
+    if faces:
+        faces = legacy_clip_detections(faces, IMAGE_SHAPE)
+    return faces
+
+
+def vectorized_postprocessing(detections: np.ndarray):
+    """ The vectorized post-processing used by FaceDetectorCV2. """
+    faces = ssd_detections_to_boxes(detections, IMAGE_SHAPE, CONFIDENCE_THRESH, ENLARGE_PERCENTAGE)
+    return [tuple(face) for face in faces.tolist()]
+
+
+if __name__ == "__main__":
+    print(f"{'faces':>6} {'loop (us)':>10} {'vectorized (us)':>16} {'speedup':>8}")
+    for number_of_faces in [1, 10, 50]:
+        detections = make_ssd_output(number_of_faces)
+        assert loop_postprocessing(detections) == vectorized_postprocessing(detections)
+
+        loop_time = timeit.timeit(lambda: loop_postprocessing(detections), number=REPETITIONS) / REPETITIONS
+        vectorized_time = timeit.timeit(lambda: vectorized_postprocessing(detections),
+                                        number=REPETITIONS) / REPETITIONS
+        print(f"{number_of_faces:>6} {loop_time * 1e6:>10.1f} {vectorized_time * 1e6:>16.1f} "
+              f"{loop_time / vectorized_time:>7.1f}x")
@@ -0,0 +1,53 @@
+"""
+Micro-benchmark of the drawing of the googly eyes. It compares the original renderer, which draws three circles per eye
+with cv.circle, with the sprites blended in place by render_googly_eyes, on a Full HD image with crowds of eyes.
+
+Run from the root of the repository with: PYTHONPATH=src python -m tests.performance_tests.rendering_benchmark
+"""
+import timeit
+from typing import List
+
+import cv2 as cv
+import numpy as np
+
+from src.image_operations import GooglyEye, generate_googly_eyes, render_googly_eyes
+
+IMAGE_SHAPE = (1080, 1920, 3)
+REPETITIONS = 200
+
+
+def legacy_render_googly_eyes(googly_eyes: List[GooglyEye], image: np.ndarray) -> np.ndarray:
+    """ The renderer as it was before the sprites. """
+    for googly_eye in googly_eyes:
+        image = cv.circle(image, googly_eye.eye_center, googly_eye.eye_radius, (255, 255, 255), cv.FILLED)
+        image = cv.circle(image, googly_eye.eye_center, googly_eye.eye_radius, (0, 0, 0), 2)
+        image = cv.circle(image, googly_eye.pupil_center, googly_eye.pupil_radius, (0, 0, 0), cv.FILLED)
+
+    return image
+
+
+def make_googly_eyes(number_of_eyes: int) -> List[GooglyEye]:
+    """ Creates googly eyes of several sizes spread over the image. """
+    rng = np.random.default_rng(0)
+    sizes = rng.integers(6, 40, number_of_eyes)
+    eyes = [(int(x), int(y), int(size), int(size) // 2) for x, y, size in
+            zip(rng.integers(0, IMAGE_SHAPE[1], number_of_eyes), rng.integers(0, IMAGE_SHAPE[0], number_of_eyes), sizes)]
+    return generate_googly_eyes(eyes, rng)
+
+
+if __name__ == "__main__":
+    image = np.full(IMAGE_SHAPE, 128, dtype=np.uint8)
+    copy_time = timeit.timeit(lambda: image.copy(), number=REPETITIONS) / REPETITIONS
+
+    print(f"{'eyes':>6} {'circles (us)':>13} {'sprites (us)':>13} {'speedup':>8}")
+    for number_of_eyes in [2, 20, 100]:
+        googly_eyes = make_googly_eyes(number_of_eyes)
+        # Warm up the cache of sprites
+        render_googly_eyes(googly_eyes, image.copy())
+
+        legacy_time = timeit.timeit(lambda: legacy_render_googly_eyes(googly_eyes, image.copy()),
+                                    number=REPETITIONS) / REPETITIONS - copy_time
+        sprites_time = timeit.timeit(lambda: render_googly_eyes(googly_eyes, image.copy()),
+                                     number=REPETITIONS) / REPETITIONS - copy_time
+        print(f"{number_of_eyes:>6} {legacy_time * 1e6:>13.1f} {sprites_time * 1e6:>13.1f} "
+              f"{legacy_time / sprites_time:>7.1f}x")
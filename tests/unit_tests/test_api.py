@@ -1,8 +1,11 @@
-from typing import Any
+from typing import Any, List
 
 from fastapi.testclient import TestClient
-from src.api.api import app
+from src.api.api import app, inference_pool, select_image_format
+import json
+import asyncio
 import base64
+import cv2
 import os
 
 
@@ -43,3 +46,337 @@ def test_googlify_endpoint():
     # Test invalid input (content type is not an image)
     response = client.post("/googlify/", json={"base64_str": "string"})
     assert response.status_code == 400
+
+
+def test_googlify_endpoint_saturated():
+    """ Tests that the API endpoint "googlify" rejects requests when the inference pool is saturated """
+    in_flight = inference_pool.in_flight
+    inference_pool.in_flight = inference_pool.max_workers + inference_pool.max_queue_size
+    try:
+        filename = os.getcwd() + "/tests/test_data/people_test_image.jpg"
+        response = call_api_image_base64(filename)
+    finally:
+        inference_pool.in_flight = in_flight
+
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
+
+
+def test_googlify_raw_endpoint():
+    """ Tests the API endpoint "googlify/raw" with different scenarios """
+    filename = os.getcwd() + "/tests/test_data/people_test_image.jpg"
+    with open(filename, "rb") as image_file:
+        contents = image_file.read()
+
+    # By default the output has the format of the input
+    response = client.post("/googlify/raw", content=contents)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/jpeg"
+
+    # The Accept header selects the output format
+    response = client.post("/googlify/raw", content=contents, headers={"Accept": "image/webp"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/webp"
+
+    # Test with an output format that is not supported
+    response = client.post("/googlify/raw", content=contents, headers={"Accept": "image/gif"})
+    assert response.status_code == 406
+
+    # Test invalid input (content is not an image)
+    response = client.post("/googlify/raw", content=b"string")
+    assert response.status_code == 400
+
+
+def test_googlify_annotations_endpoint():
+    """ Tests the API endpoint "googlify/annotations" with different scenarios """
+    filename = os.getcwd() + "/tests/test_data/people_test_image.jpg"
+    with open(filename, "rb") as image_file:
+        response = client.post("/googlify/annotations", content=image_file.read())
+
+    assert response.status_code == 200
+    annotations = response.json()
+    assert annotations["width"] == 768 and annotations["height"] == 512
+    assert len(annotations["faces"]) > 0
+    assert len(annotations["eyes"]) > 0
+
+    # Test invalid input (content is not an image)
+    response = client.post("/googlify/annotations", content=b"string")
+    assert response.status_code == 400
+
+
+def test_metrics_endpoint():
+    """ Tests the API endpoint "metrics" """
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert "# TYPE googlifier_stage_duration_seconds histogram" in response.text
+
+
+def test_health_endpoints(monkeypatch):
+    """ Tests the API endpoints "healthz" and "readyz" """
+    import threading
+    import src.api.api as api
+
+    monkeypatch.setattr(api, "warmup_done", threading.Event())
+    assert client.get("/healthz").json() == {"status": "ok"}
+
+    # The worker is alive but not ready until the models are warmed up
+    response = client.get("/readyz")
+    assert response.status_code == 503
+    assert response.json() == {"status": "warming_up"}
+
+    api.warm_up_inference_pool()
+    response = client.get("/readyz")
+    assert response.status_code == 200
+    assert response.json()["status"] == "ready"
+    assert response.json()["warmup_seconds"] > 0
+    assert "googlifier_warmup_duration_seconds_count" in client.get("/metrics").text
+
+
+def test_warm_up_loads_no_models():
+    """ Tests that the threads of the inference pool use the Googlifiers preloaded with the module, so the warm-up of a
+    worker does not load models of its own """
+    import src.api.api as api
+
+    model_load_count = api.Googlifier.model_load_count
+    api.warm_up_inference_pool()
+    assert api.Googlifier.model_load_count == model_load_count
+
+    googlifiers = api.inference_pool.run_on_all_workers(lambda googlifier: googlifier)
+    assert len(set(map(id, googlifiers))) == len(googlifiers)
+    assert all(any(googlifier is preloaded for preloaded in api.preloaded_googlifiers) for googlifier in googlifiers)
+
+
+def test_select_image_format():
+    assert select_image_format(None, ".jpg") == ".jpg"
+    assert select_image_format("*/*", ".jpg") == ".jpg"
+    assert select_image_format("image/png", ".jpg") == ".png"
+    assert select_image_format("image/png;q=0.5, image/webp", ".jpg") == ".webp"
+    assert select_image_format("image/png;q=0, text/html", ".jpg") is None
+
+
+def test_googlify_video_endpoint(tmp_path):
+    """ Tests the API endpoint "googlify/video" with a video file and a multipart stream """
+    image = cv2.imread(os.getcwd() + "/tests/test_data/people_test_image.jpg", cv2.IMREAD_COLOR)
+    image = cv2.resize(image, (320, 240))
+
+    # Test with a video file
+    video_path = str(tmp_path / "video.avi")
+    writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*"MJPG"), 10, (320, 240))
+    for _ in range(5):
+        writer.write(image)
+    writer.release()
+    with open(video_path, "rb") as video_file:
+        response = client.post("/googlify/video", content=video_file.read(),
+                               headers={"content-type": "video/x-msvideo"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("multipart/x-mixed-replace")
+    assert response.content.count(b"Content-Type: image/jpeg") == 5
+    assert b"X-Frames-Per-Second" in response.content
+
+    # Test with a multipart stream of images
+    _, image_jpg = cv2.imencode(".jpg", image)
+    body = b"".join(b"--stream\r\nContent-Type: image/jpeg\r\n\r\n" + image_jpg.tobytes() + b"\r\n" for _ in range(3))
+    response = client.post("/googlify/video", content=body,
+                           headers={"content-type": "multipart/x-mixed-replace; boundary=stream"})
+    assert response.status_code == 200
+    assert response.content.count(b"Content-Type: image/jpeg") == 3
+
+    # Test invalid input
+    response = client.post("/googlify/video", content=b"not a video", headers={"content-type": "video/mp4"})
+    assert response.status_code == 400
+
+
+def test_googlify_video_endpoint_live_stream():
+    """ Tests that the frames of a multipart stream are googlified while the rest of the body is still being sent """
+    image = cv2.resize(cv2.imread(os.getcwd() + "/tests/test_data/people_test_image.jpg", cv2.IMREAD_COLOR), (320, 240))
+    part = b"--stream\r\nContent-Type: image/jpeg\r\n\r\n" + cv2.imencode(".jpg", image)[1].tobytes() + b"\r\n"
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST", "scheme": "http",
+             "path": "/googlify/video", "raw_path": b"/googlify/video", "root_path": "", "query_string": b"",
+             "headers": [(b"content-type", b"multipart/x-mixed-replace; boundary=stream")],
+             "client": ("127.0.0.1", 1234), "server": ("testserver", 80)}
+
+    async def run() -> List[bytes]:
+        first_frame_sent = asyncio.Event()
+        response_complete = asyncio.Event()
+        messages = [{"type": "http.request", "body": part * 2, "more_body": True}]
+        bodies = []
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            if not first_frame_sent.is_set():
+                # The last part is only sent once the first frame came back
+                await asyncio.wait_for(first_frame_sent.wait(), timeout=30)
+                return {"type": "http.request", "body": part, "more_body": False}
+            await response_complete.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.body":
+                bodies.append(message.get("body", b""))
+                if b"Content-Type: image/jpeg" in bodies[-1]:
+                    first_frame_sent.set()
+                if not message.get("more_body", False):
+                    response_complete.set()
+
+        await app(scope, receive, send)
+        return bodies
+
+    assert b"".join(asyncio.run(run())).count(b"Content-Type: image/jpeg") == 3
+
+
+def test_googlify_batch_endpoint():
+    """ Tests the API endpoint "googlify/batch" with the different body formats and per image errors """
+    with open(os.getcwd() + "/tests/test_data/people_test_image.jpg", "rb") as image_file:
+        image_bytes = image_file.read()
+    image_base64 = base64.b64encode(image_bytes).decode('utf-8')
+
+    # Test a JSON body with a valid image, a corrupt image and an invalid base64 string
+    corrupt_base64 = base64.b64encode(b"corrupt").decode('utf-8')
+    response = client.post("/googlify/batch", json={"images": [{"base64_str": image_base64},
+                                                               {"base64_str": corrupt_base64},
+                                                               {"base64_str": "not base64!"}]})
+    assert response.status_code == 200
+    results = sorted([json.loads(line) for line in response.text.splitlines()], key=lambda result: result["index"])
+    assert [result["index"] for result in results] == [0, 1, 2]
+    assert "base64_str" in results[0]
+    assert results[1]["error"] == "Corrupt input file."
+    assert results[2]["error"] == "Unsupported file type."
+
+    # Test a NDJSON body
+    body = "\n".join(json.dumps({"base64_str": image_base64}) for _ in range(3))
+    response = client.post("/googlify/batch", content=body, headers={"content-type": "application/x-ndjson"})
+    assert response.status_code == 200
+    assert len(response.text.splitlines()) == 3
+
+    # Test a multipart body
+    files = [("files", ("image_" + str(i) + ".jpg", image_bytes, "image/jpeg")) for i in range(2)]
+    response = client.post("/googlify/batch", files=files)
+    assert response.status_code == 200
+    assert all("base64_str" in json.loads(line) for line in response.text.splitlines())
+
+    # Test an invalid body
+    response = client.post("/googlify/batch", json={"base64_str": image_base64})
+    assert response.status_code == 400
+
+
+def test_googlify_endpoints_too_large(monkeypatch):
+    """ Tests that the requests over the size limits are rejected before the images are decoded """
+    import src.api.api as api
+
+    with open(os.getcwd() + "/tests/test_data/people_test_image.jpg", "rb") as image_file:
+        image_bytes = image_file.read()
+
+    # Test a body larger than the limit, with and without Content-Length
+    monkeypatch.setattr(api, "max_request_bytes", len(image_bytes) - 1)
+    response = client.post("/googlify/raw", content=image_bytes, headers={"Content-Type": "image/jpeg"})
+    assert response.status_code == 413
+    response = client.post("/googlify/raw", content=iter([image_bytes]), headers={"Content-Type": "image/jpeg"})
+    assert response.status_code == 413
+
+    # Test multipart bodies without Content-Length, which are parsed as forms instead of read by the endpoints
+    boundary = "googly-boundary"
+    multipart_body = (b"--" + boundary.encode() + b"\r\nContent-Disposition: form-data; name=\"files\"; "
+                      b"filename=\"image.jpg\"\r\nContent-Type: image/jpeg\r\n\r\n" + image_bytes +
+                      b"\r\n--" + boundary.encode() + b"--\r\n")
+    response = client.post("/googlify/batch", content=iter([multipart_body]),
+                           headers={"Content-Type": "multipart/form-data; boundary=" + boundary})
+    assert response.status_code == 413
+    response = client.post("/jobs", content=iter([multipart_body]),
+                           headers={"Content-Type": "multipart/form-data; boundary=" + boundary})
+    assert response.status_code == 413
+    monkeypatch.setattr(api, "max_request_bytes", len(image_bytes) * 2)
+
+    # Test an image with more pixels than the limit
+    monkeypatch.setattr(api, "max_image_pixels", 100)
+    response = client.post("/googlify/raw", content=image_bytes, headers={"Content-Type": "image/jpeg"})
+    assert response.status_code == 413
+    response = call_api_image_base64(os.getcwd() + "/tests/test_data/people_test_image.jpg")
+    assert response.status_code == 413
+
+    # In a batch only the images that are too large fail
+    image_base64 = base64.b64encode(image_bytes).decode('utf-8')
+    response = client.post("/googlify/batch", json={"images": [{"base64_str": image_base64}]})
+    assert response.status_code == 200
+    assert json.loads(response.text)["error"] == "Image too large."
+
+
+def test_googlify_endpoints_latency_budget():
+    """ Tests that the requests report the degradation level used to meet their latency budget """
+    filename = os.getcwd() + "/tests/test_data/people_test_image.jpg"
+    with open(filename, "rb") as image_file:
+        contents = image_file.read()
+
+    # Without a budget the image is not degraded
+    response = client.post("/googlify/raw", content=contents)
+    assert response.status_code == 200
+    assert response.headers["X-Degradation-Level"] == "full"
+
+    # A budget that is already over gets the fastest level
+    response = client.post("/googlify/raw", content=contents, headers={"X-Latency-Budget-Ms": "0.001"})
+    assert response.status_code == 200
+    assert response.headers["X-Degradation-Level"] == "geometric_eyes"
+    response = client.post("/googlify/annotations", content=contents, headers={"X-Latency-Budget-Ms": "0.001"})
+    assert response.status_code == 200
+    assert response.headers["X-Degradation-Level"] == "geometric_eyes"
+
+    # Test an invalid budget
+    response = client.post("/googlify/raw", content=contents, headers={"X-Latency-Budget-Ms": "soon"})
+    assert response.status_code == 400
+
+
+def test_jobs_endpoints(monkeypatch):
+    """ Tests submitting a job, processing it and fetching its results """
+    import src.api.api as api
+    from src.job_queue import MemoryJobBackend
+
+    job_backend = MemoryJobBackend({})
+    monkeypatch.setattr(api, "job_backend", job_backend)
+    monkeypatch.setattr(api.job_processor, "backend", job_backend)
+    with open(os.getcwd() + "/tests/test_data/people_test_image.jpg", "rb") as image_file:
+        image_bytes = image_file.read()
+
+    # A single image keeps its format unless another one is requested
+    response = client.post("/jobs", content=image_bytes, headers={"Content-Type": "image/jpeg"})
+    assert response.status_code == 202
+    job_id = response.json()["id"]
+    assert response.headers["Location"] == "/jobs/" + job_id
+    assert client.get("/jobs/" + job_id).json()["status"] == "queued"
+    assert client.get("/jobs/" + job_id + "/images/0").status_code == 409
+
+    image_base64 = base64.b64encode(image_bytes).decode('utf-8')
+    response = client.post("/jobs?format=webp", json={"images": [{"base64_str": image_base64}] * 2})
+    assert response.status_code == 202
+    batch_job_id = response.json()["id"]
+
+    # Process the jobs in the test thread
+    while True:
+        job = job_backend.claim(job_timeout=60, max_attempts=3)
+        if job is None:
+            break
+        api.job_processor.run_job(api.preloaded_googlifiers[0], *job)
+
+    status = client.get("/jobs/" + job_id).json()
+    assert status["status"] == "done" and status["errors"] == [None]
+    response = client.get("/jobs/" + job_id + "/images/0")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/jpeg"
+    response = client.get("/jobs/" + batch_job_id + "/images/1")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/webp"
+
+    # Test a missing job or image and invalid requests
+    assert client.get("/jobs/missing").status_code == 404
+    assert client.get("/jobs/" + job_id + "/images/1").status_code == 404
+    assert client.post("/jobs", content=b"string").status_code == 400
+    assert client.post("/jobs?format=gif", content=image_bytes).status_code == 400
+    assert client.post("/jobs?webhook=file:///etc/passwd", content=image_bytes).status_code == 400
+    assert client.post("/jobs?webhook=http://169.254.169.254/latest", content=image_bytes).status_code == 400
+
+    # Test a full queue
+    monkeypatch.setattr(api, "max_pending_jobs", 0)
+    response = client.post("/jobs", content=image_bytes, headers={"Content-Type": "image/jpeg"})
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
@@ -0,0 +1,62 @@
+from src.degradation import DegradationPolicy, DEGRADATION_LEVELS, FULL, REDUCED, GEOMETRIC_EYES, GOOGLIFY, ANNOTATE
+
+
+def test_select_level():
+    policy = DegradationPolicy(smoothing=0.5)
+
+    # The levels that were never measured are expected to be fast enough
+    assert policy.select_level(1.0, 2.0) == FULL
+    # Once the deadline is over the fastest level is used
+    assert policy.select_level(0.0, 2.0) == GEOMETRIC_EYES == len(DEGRADATION_LEVELS) - 1
+
+    policy.record(FULL, 2.0, 2.0)
+    assert policy.select_level(1.0, 1.0) == FULL
+    assert policy.select_level(1.0, 2.0) == REDUCED
+
+    # When no level is expected to finish in time the fastest one is used
+    for level in range(len(DEGRADATION_LEVELS)):
+        policy.record(level, 4.0, 2.0)
+    assert policy.select_level(1.0, 2.0) == GEOMETRIC_EYES
+
+
+def test_select_level_after_spike():
+    policy = DegradationPolicy()
+
+    # A single slow image degrades the next ones, until the better level is expected to be fast enough again
+    policy.record(FULL, 2.0, 1.0)
+    assert policy.select_level(1.5, 1.0) == REDUCED
+    for _ in range(50):
+        level = policy.select_level(1.5, 1.0)
+        policy.record(level, 0.2, 1.0)
+    assert policy.select_level(1.5, 1.0) == FULL
+
+    # A level that is still slow when it is measured again is skipped again
+    policy = DegradationPolicy(smoothing=1.0)
+    policy.record(FULL, 2.0, 1.0)
+    while policy.select_level(1.5, 1.0) == REDUCED:
+        policy.record(REDUCED, 0.2, 1.0)
+    policy.record(FULL, 2.0, 1.0)
+    assert policy.select_level(1.5, 1.0) == REDUCED
+
+
+def test_record():
+    policy = DegradationPolicy(smoothing=0.5)
+    policy.record(FULL, 2.0, 2.0)
+    policy.record(FULL, 4.0, 2.0)
+
+    # The time per megapixel is averaged and tiny images count as MIN_MEGAPIXELS
+    assert policy.seconds_per_megapixel[GOOGLIFY][FULL] == 1.5
+    policy.record(REDUCED, 0.25, 0.01)
+    assert policy.seconds_per_megapixel[GOOGLIFY][REDUCED] == 1.0
+
+
+def test_select_level_per_operation():
+    policy = DegradationPolicy(smoothing=0.5)
+    policy.record(FULL, 2.0, 2.0, GOOGLIFY)
+
+    # The times of an operation do not change the level selected for the other one
+    assert policy.select_level(1.0, 2.0, GOOGLIFY) == REDUCED
+    assert policy.select_level(1.0, 2.0, ANNOTATE) == FULL
+    policy.record(FULL, 0.5, 2.0, ANNOTATE)
+    assert policy.select_level(1.0, 2.0, ANNOTATE) == FULL
+    assert policy.seconds_per_megapixel[ANNOTATE][FULL] == 0.25
@@ -0,0 +1,119 @@
+import cv2
+import numpy as np
+import onnxruntime as ort
+
+from src.detection_helpers import eye_keypoints_to_boxes
+from src.detectors.face_detector_onnx import FaceDetectorONNX
+from src.detectors.eyes_detector_yunet import EyesDetectorYuNet
+from src.detectors.face_eyes_detector_yunet import FaceEyesDetectorYuNet
+
+
+class FakeInput:
+    name = "input"
+
+
+class FakeInferenceSession:
+    """ Stub of an ONNX Runtime session that finds a face in the middle of every image, plus one under the threshold """
+
+    def __init__(self, model_path, options=None, providers=None):
+        self.model_path = model_path
+        self.batch_sizes = []
+
+    def get_inputs(self):
+        return [FakeInput()]
+
+    def run(self, output_names, inputs):
+        blob = inputs["input"]
+        self.batch_sizes.append(len(blob))
+        scores = np.tile(np.array([[0.1, 0.9], [0.8, 0.2]], dtype=np.float32), (len(blob), 1, 1))
+        boxes = np.tile(np.array([[0.25, 0.25, 0.75, 0.75], [0.0, 0.0, 0.5, 0.5]], dtype=np.float32),
+                        (len(blob), 1, 1))
+        return [scores, boxes]
+
+
+class FakeFaceDetectorYN:
+    """ Stub of the YuNet face detector of OpenCV that returns fixed rows in the coordinates of its input """
+
+    detections = None
+    input_sizes = []
+
+    @staticmethod
+    def create(model_path, config, input_size, score_threshold=0.9, nms_threshold=0.3, top_k=5000):
+        return FakeFaceDetectorYN()
+
+    def setInputSize(self, input_size):
+        FakeFaceDetectorYN.input_sizes.append(tuple(input_size))
+
+    def detect(self, image):
+        return 1, FakeFaceDetectorYN.detections
+
+
+def yunet_row(box, right_eye, left_eye, score):
+    return list(box) + list(right_eye) + list(left_eye) + [0.0] * 6 + [score]
+
+
+def test_face_detector_onnx(monkeypatch):
+    monkeypatch.setattr(ort, "InferenceSession", FakeInferenceSession)
+    monkeypatch.setattr(FaceDetectorONNX, "_sessions", {})
+    config = {"model_path": "/models/fake.onnx", "confidence_thresh": 0.5, "enlarge_face_percentage": 0.2,
+              "input_size": "(320, 240)", "mean_normalization": "(127, 127, 127)", "scale_factor": 1 / 128,
+              "batch_size": 2}
+    face_detector = FaceDetectorONNX(config)
+    assert len(face_detector.model_loads) == 1
+
+    # The session is shared by the instances with the same model
+    assert FaceDetectorONNX(config).session is face_detector.session
+    assert len(face_detector.model_loads) == 1
+
+    # The images are run in batches of batch_size and the faces are scaled to the size of each image, then enlarged by
+    # 20% of their size on each side
+    images = [np.zeros((100, 200, 3), dtype=np.uint8), np.zeros((400, 400, 3), dtype=np.uint8),
+              np.zeros((60, 80, 3), dtype=np.uint8)]
+    faces = face_detector.detect_many(images)
+    assert face_detector.session.batch_sizes == [2, 1]
+    assert faces == [[(30, 15, 140, 70)], [(60, 60, 280, 280)], [(12, 9, 56, 42)]]
+    assert face_detector.detect(images[0]) == faces[0]
+
+
+def test_eyes_detector_yunet(monkeypatch):
+    monkeypatch.setattr(cv2, "FaceDetectorYN", FakeFaceDetectorYN)
+    monkeypatch.setattr(FakeFaceDetectorYN, "input_sizes", [])
+    eyes_detector = EyesDetectorYuNet({"model_path": "/models/fake.onnx", "confidence_thresh": 0.5,
+                                       "roi_size": 160})
+    image = np.zeros((300, 400, 3), dtype=np.uint8)
+
+    # The face is cropped with a margin of 10% of its size on each side, from (92, 42) to (188, 138), and resized to
+    # 160x160. The keypoints of the best row are moved back from the crop to the image
+    monkeypatch.setattr(FakeFaceDetectorYN, "detections", np.array(
+        [yunet_row((0, 0, 160, 160), (40, 60), (120, 60), 0.95),
+         yunet_row((0, 0, 80, 80), (10, 10), (20, 10), 0.6)], dtype=np.float32))
+    keypoints = eyes_detector.detect_eye_keypoints(image, (100, 50, 80, 80))
+    assert FakeFaceDetectorYN.input_sizes == [(160, 160)]
+    assert np.allclose(keypoints, [[116, 78], [164, 78]])
+
+    eyes = eyes_detector.detect(image, [(100, 50, 80, 80)])
+    assert eyes == [tuple(eye) for eye in eye_keypoints_to_boxes(keypoints[np.newaxis], 0.45, 0.25).tolist()]
+
+    # The faces without keypoints are skipped
+    monkeypatch.setattr(FakeFaceDetectorYN, "detections", None)
+    assert eyes_detector.detect(image, [(100, 50, 80, 80)]) == []
+
+
+def test_face_eyes_detector_yunet(monkeypatch):
+    monkeypatch.setattr(cv2, "FaceDetectorYN", FakeFaceDetectorYN)
+    monkeypatch.setattr(FakeFaceDetectorYN, "input_sizes", [])
+    detector = FaceEyesDetectorYuNet({"model_path": "/models/fake.onnx", "confidence_thresh": 0.5})
+    image = np.zeros((200, 300, 3), dtype=np.uint8)
+
+    # Each row gives a face box and the keypoints of its eyes, the boxes are clipped to the image
+    monkeypatch.setattr(FakeFaceDetectorYN, "detections", np.array(
+        [yunet_row((10, 20, 100, 120), (40, 60), (80, 60), 0.9),
+         yunet_row((250, 150, 80, 80), (270, 180), (300, 180), 0.8)], dtype=np.float32))
+    faces, eyes = detector.detect_faces_and_eyes(image)
+    assert FakeFaceDetectorYN.input_sizes == [(300, 200)]
+    assert faces == [(10, 20, 100, 120), (250, 150, 50, 50)]
+    assert len(eyes) == 4
+    assert eyes[:2] == [(31, 55, 18, 10), (71, 55, 18, 10)]
+
+    monkeypatch.setattr(FakeFaceDetectorYN, "detections", None)
+    assert detector.detect_faces_and_eyes(image) == ([], [])
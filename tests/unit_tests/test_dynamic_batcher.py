@@ -0,0 +1,45 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.dynamic_batcher import DynamicBatcher
+
+
+def test_submit_groups_concurrent_items():
+    batch_sizes = []
+
+    def process_batch(items):
+        batch_sizes.append(len(items))
+        return [item * 2 for item in items]
+
+    batcher = DynamicBatcher(process_batch, batch_size=4, max_wait_ms=200)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(batcher.submit, range(8)))
+
+    # Each caller gets its own result back and the items were processed in batches
+    assert results == [item * 2 for item in range(8)]
+    assert max(batch_sizes) <= 4
+    assert len(batch_sizes) < 8
+
+
+def test_submit_propagates_errors():
+    def process_batch(items):
+        raise ValueError("Invalid batch.")
+
+    batcher = DynamicBatcher(process_batch, batch_size=2, max_wait_ms=1)
+    with pytest.raises(ValueError):
+        batcher.submit(1)
+
+
+def test_submit_many():
+    batch_sizes = []
+
+    def process_batch(items):
+        batch_sizes.append(len(items))
+        return [item * 2 for item in items]
+
+    batcher = DynamicBatcher(process_batch, batch_size=3, max_wait_ms=50)
+
+    # The items are split in full batches and the results keep their order
+    assert batcher.submit_many(list(range(7))) == [item * 2 for item in range(7)]
+    assert batch_sizes == [3, 3, 1]
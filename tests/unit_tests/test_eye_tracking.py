@@ -0,0 +1,50 @@
+import numpy as np
+from src.eye_tracking import EyeTracker, PupilState
+
+
+def test_pupil_stays_inside_eye():
+    pupil = PupilState(0.5)
+    for i in range(100):
+        pupil.update(np.array([0.3, -0.2]) if i % 10 < 5 else np.array([-0.3, 0.2]))
+        assert np.linalg.norm(pupil.offset) <= pupil.get_max_offset() + 1e-9
+
+
+def test_track_eyes():
+    rng = np.random.default_rng(0)
+    frame = np.zeros((120, 160, 3), dtype=np.uint8)
+    frame[20:100, 40:120] = rng.integers(0, 255, (80, 80, 1), dtype=np.uint8)
+
+    tracker = EyeTracker(max_tracking_error=30)
+    tracker.update_detections([(60, 50, 10, 10)], frame)
+    pupil = tracker.pupils[0]
+
+    # The eye follows the content of the frame and keeps its pupil
+    assert tracker.track(np.roll(frame, (2, 3), axis=(0, 1)))
+    assert tracker.eyes == [(63, 52, 10, 10)]
+    assert tracker.pupils[0] is pupil
+    assert tracker.frames_since_detection == 1
+
+    # A new detection of the same eye keeps its pupil and a new eye gets a new one
+    tracker.update_detections([(64, 52, 10, 10), (10, 10, 8, 8)], frame)
+    assert tracker.pupils[0] is pupil
+    assert tracker.pupils[1] is not pupil
+    assert len(tracker.get_googly_eyes()) == 2
+
+    # Frames with a different size can not be tracked
+    assert not tracker.track(frame[:60])
+
+
+def test_seeded_pupils():
+    frame = np.zeros((120, 160, 3), dtype=np.uint8)
+    eyes = [(60, 50, 10, 10), (10, 10, 8, 8)]
+
+    # Trackers with generators of the same seed give the same pupils to the same eyes
+    googly_eyes = []
+    for _ in range(2):
+        tracker = EyeTracker(max_tracking_error=30, rng=np.random.default_rng(7))
+        tracker.update_detections(eyes, frame)
+        googly_eyes.append(tracker.get_googly_eyes())
+    assert googly_eyes[0] == googly_eyes[1]
+
+    pupil = PupilState(0.5, np.random.default_rng(7))
+    assert np.array_equal(pupil.offset, PupilState(0.5, np.random.default_rng(7)).offset)
@@ -1,7 +1,14 @@
 import cv2
+import numpy as np
 from src.googlifier import Googlifier
 from src.constants import *
-from src.detection_helpers import make_bbox_larger, clip_detections
+from src.detection_helpers import make_bbox_larger, clip_detections, non_max_suppression, ssd_detections_to_boxes, \
+    scores_and_boxes_to_ssd_detections, get_rois_bounds, eye_keypoints_to_boxes, estimate_eye_keypoints, \
+    get_largest_boxes_indices, get_tiles, tile_ssd_detections_to_image
+from src.jpeg_splicing import read_jpeg_layout
+from src.degradation import DegradationPolicy, FULL, REDUCED, GEOMETRIC_EYES, GOOGLIFY, ANNOTATE
+from src.image_operations import generate_googly_eyes, read_image_size, get_decode_reduction, detect_image_format, \
+    render_googly_eyes, quantize_radius
 
 
 def test_clip_detections():
@@ -21,6 +28,24 @@ def test_make_bbox_larger():
     assert new_coordinates == (2.5, 2.5, 12.5, 12.5)
 
 
+def test_non_max_suppression():
+    boxes = np.array([[0, 0, 10, 10], [1, 1, 11, 11], [20, 20, 30, 30]], dtype=np.float64)
+    scores = np.array([0.5, 0.9, 0.7])
+
+    assert non_max_suppression(boxes, scores, 0.5).tolist() == [1, 2]
+    assert non_max_suppression(boxes, scores, 0.9).tolist() == [1, 2, 0]
+
+
+def test_ssd_detections_to_boxes():
+    detections = np.array([[0, 1, 0.9, 0.25, 0.25, 0.75, 0.75],
+                           [0, 1, 0.2, 0.25, 0.25, 0.75, 0.75],
+                           [0, 1, 0.8, -0.5, -0.5, -0.1, -0.1]], dtype=np.float32)
+    faces = ssd_detections_to_boxes(detections, (100, 200, 3), confidence_thresh=0.4, enlarge_percentage=0)
+
+    # Only the confident detection inside the image is kept
+    assert faces.tolist() == [[50, 25, 100, 50]]
+
+
 def test_detect_faces():
     googly = Googlifier(CONFIG_FILE_PATH)
 
@@ -41,6 +66,40 @@ def test_detect_faces():
     assert faces == []
 
 
+def test_get_tiles():
+    tiles = get_tiles((300, 500, 3), 200, 0.25)
+
+    # Three tiles across the width and two down the height, the last ones touching the sides of the image
+    assert tiles == [(0, 0, 200, 200), (150, 0, 200, 200), (300, 0, 200, 200),
+                     (0, 100, 200, 200), (150, 100, 200, 200), (300, 100, 200, 200)]
+    assert get_tiles((100, 500, 3), 200, 0.5) == [(0, 0, 200, 100), (100, 0, 200, 100), (200, 0, 200, 100),
+                                                  (300, 0, 200, 100)]
+
+
+def test_tile_ssd_detections_to_image():
+    detections = np.array([[0, 1, 0.9, 0.25, 0.25, 0.75, 0.75],
+                           [0, 1, 0.9, 0.0, 0.25, 0.5, 0.75],
+                           [0, 1, 0.9, 0.5, 0.5, 1.0, 1.0]], dtype=np.float32)
+    # Tile on the right side of the image, only its left side is inside the image
+    image_detections = tile_ssd_detections_to_image(detections, (100, 0, 100, 100), (100, 200, 3), 0.01)
+
+    # The detection cut by the left side of the tile is removed, the one touching the side of the image is kept
+    assert image_detections[:, 3:].tolist() == [[0.625, 0.25, 0.875, 0.75], [0.75, 0.5, 1.0, 1.0]]
+
+
+def test_detect_faces_tiled():
+    googly = Googlifier(CONFIG_FILE_PATH)
+    filename = os.getcwd() + "/tests/test_data/people_test_image.jpg"
+    image = cv2.imread(filename, cv2.IMREAD_COLOR)
+    faces = googly.face_detector.detect(image)
+
+    # The tiles find the faces of the whole image and the smaller ones lost when it is shrunk
+    googly.face_detector.tile_size = max(image.shape[:2]) // 2
+    tiled_faces = googly.face_detector.detect(image)
+    assert len(tiled_faces) >= len(faces) > 0
+    assert googly.face_detector.detect_many([image, image]) == [tiled_faces, tiled_faces]
+
+
 def test_detect_eyes():
     googly = Googlifier(CONFIG_FILE_PATH)
 
@@ -51,3 +110,235 @@ def test_detect_eyes():
     eyes = googly.detect_eyes(image, faces)
 
     assert len(eyes) > 0
+
+
+def test_detect_eyes_in_chunks():
+    googly = Googlifier(CONFIG_FILE_PATH)
+    eyes_detector = googly.eyes_detector
+    filename = os.getcwd() + "/tests/test_data/people_test_image.jpg"
+    image = cv2.imread(filename, cv2.IMREAD_COLOR)
+    faces = [(x, y, 60, 60) for y in range(0, 240, 80) for x in range(0, 320, 80)]
+    eyes_detector.fit_workers, eyes_detector.fit_executor = 0, None
+    eyes = eyes_detector.detect(image, faces)
+
+    # The faces fitted in chunks by several threads give the same eyes, in the order of the faces
+    googly = Googlifier(CONFIG_FILE_PATH)
+    assert googly.eyes_detector.fit_executor is not None
+    googly.eyes_detector.min_faces_per_chunk = 1
+    assert googly.eyes_detector.detect(image, faces) == eyes
+    assert len(eyes) == 2 * len(faces)
+
+    # Without a minimum number of faces per chunk all the faces are fitted at once
+    for min_faces_per_chunk in [0, -1]:
+        googly.eyes_detector.min_faces_per_chunk = min_faces_per_chunk
+        assert googly.eyes_detector.detect(image, faces) == eyes
+
+    # The faces that are too small are skipped and only the largest faces are kept
+    googly.eyes_detector.max_faces = 2
+    googly.eyes_detector.min_face_size = 50
+    assert googly.eyes_detector.detect(image, [(0, 0, 40, 40), (0, 0, 80, 80), (80, 80, 60, 60), (0, 0, 70, 70)]) == \
+        googly.eyes_detector.detect(image, [(0, 0, 80, 80), (0, 0, 70, 70)])
+
+
+def test_generate_googly_eyes():
+    googly_eyes = generate_googly_eyes([(10, 20, 8, 4)])
+
+    assert len(googly_eyes) == 1
+    assert googly_eyes[0].eye_center == (14, 22)
+    assert googly_eyes[0].eye_radius == 9
+    # The pupil is smaller than the eye and stays close to its center
+    assert googly_eyes[0].pupil_radius <= googly_eyes[0].eye_radius // 2
+    assert abs(googly_eyes[0].pupil_center[0] - 14) <= googly_eyes[0].pupil_radius
+    assert abs(googly_eyes[0].pupil_center[1] - 22) <= googly_eyes[0].pupil_radius
+
+
+def test_generate_googly_eyes_with_seed():
+    eyes = [(10, 20, 8, 4), (40, 20, 10, 6)]
+
+    # The same seed always gives the same pupils
+    assert generate_googly_eyes(eyes, np.random.default_rng(7)) == generate_googly_eyes(eyes, np.random.default_rng(7))
+    assert generate_googly_eyes([]) == []
+
+
+def test_render_googly_eyes():
+    image = np.full((60, 60, 3), 128, dtype=np.uint8)
+    googly_eyes = generate_googly_eyes([(20, 20, 16, 8), (-30, -30, 8, 4)], np.random.default_rng(0))
+    rendered_image = render_googly_eyes(googly_eyes, image)
+
+    # The googly eyes are drawn in place and the ones outside the image are skipped
+    assert rendered_image is image
+    eye_center, pupil_center = googly_eyes[0].eye_center, googly_eyes[0].pupil_center
+    assert image[pupil_center[1], pupil_center[0]].tolist() == [0, 0, 0]
+    assert image[eye_center[1] + googly_eyes[0].eye_radius - 2, eye_center[0]].tolist() == [255, 255, 255]
+    assert image[0, 59].tolist() == [128, 128, 128]
+
+
+def test_quantize_radius():
+    assert [quantize_radius(radius) for radius in [0, 5, 63]] == [0, 5, 63]
+    assert quantize_radius(101) == 102
+    assert abs(quantize_radius(1001) - 1001) <= 1001 / 64
+
+
+def test_read_image_size():
+    image = np.zeros((30, 40, 3), dtype=np.uint8)
+    for image_format in [".jpg", ".png", ".webp"]:
+        image_bytes = cv2.imencode(image_format, image)[1].tobytes()
+        assert read_image_size(image_bytes) == (40, 30)
+        # Memory-mapped files are read through the buffer protocol
+        assert detect_image_format(memoryview(image_bytes)) == image_format
+        assert read_image_size(memoryview(image_bytes)) == (40, 30)
+
+    assert read_image_size(b"string") is None
+
+
+def test_get_decode_reduction():
+    assert get_decode_reduction((4000, 3000), 1280) == 2
+    assert get_decode_reduction((12000, 9000), 1280) == 8
+    assert get_decode_reduction((1000, 800), 1280) == 1
+    assert get_decode_reduction(None, 1280) == 1
+
+
+def test_detect_eyes_and_annotate():
+    googly = Googlifier(CONFIG_FILE_PATH)
+    googly.result_cache = None
+    googly.degradation_policy = DegradationPolicy()
+
+    # The annotations of a large image are in the coordinates of the full resolution image
+    filename = os.getcwd() + "/tests/test_data/people_test_image.jpg"
+    image = cv2.resize(cv2.imread(filename, cv2.IMREAD_COLOR), (3072, 2048))
+    success, annotations = googly.detect_eyes_and_annotate(cv2.imencode(".jpg", image)[1].tobytes())
+
+    assert success
+    assert (annotations["width"], annotations["height"]) == (3072, 2048)
+    assert len(annotations["faces"]) > 0
+    assert all(x + w <= 3072 and y + h <= 2048 for x, y, w, h in annotations["faces"])
+
+    # The time of the annotations is measured apart from the time of the googlified images
+    assert googly.degradation_policy.seconds_per_megapixel[ANNOTATE][FULL] is not None
+    assert googly.degradation_policy.seconds_per_megapixel[GOOGLIFY][FULL] is None
+
+
+def test_googlify_frame():
+    googly = Googlifier(CONFIG_FILE_PATH)
+    eye_tracker = googly.create_eye_tracker()
+
+    filename = os.getcwd() + "/tests/test_data/people_test_image.jpg"
+    image = cv2.imread(filename, cv2.IMREAD_COLOR)
+    for i in range(googly.detection_interval + 1):
+        frame = googly.googlify_frame(image.copy(), eye_tracker)
+        assert frame.shape == image.shape
+        assert len(eye_tracker.get_googly_eyes()) > 0
+
+    # The detectors ran again after detection_interval frames
+    assert eye_tracker.frames_since_detection == 0
+
+    # With a rendering seed the same frames get the same googly eyes
+    googly.rendering_seed = 7
+    frames = [googly.googlify_frame(image.copy(), googly.create_eye_tracker()) for _ in range(2)]
+    assert np.array_equal(frames[0], frames[1])
+
+
+def test_detect_eyes_and_googlify_many():
+    googly = Googlifier(CONFIG_FILE_PATH)
+    googly.result_cache = None
+
+    with open(os.getcwd() + "/tests/test_data/people_test_image.jpg", "rb") as image_file:
+        image_with_faces = image_file.read()
+    with open(os.getcwd() + "/tests/test_data/no_faces_test_image.jpg", "rb") as image_file:
+        image_without_faces = image_file.read()
+    images = [image_with_faces, b"corrupt", image_without_faces] * 4
+
+    results = sorted(googly.detect_eyes_and_googlify_many(images, ".png"))
+    assert [index for index, _, _ in results] == list(range(len(images)))
+
+    # Each image gets the same result as when it is googlified alone, except the random googly eyes
+    for index, success, image_bytes in results:
+        expected_success, expected_bytes = googly.detect_eyes_and_googlify(images[index], ".png")
+        assert success == expected_success
+        assert detect_image_format(image_bytes) == detect_image_format(expected_bytes)
+
+    # The batches of all the Googlifier instances of the process run on the same threads
+    assert Googlifier(CONFIG_FILE_PATH).batch_executor is googly.batch_executor
+
+
+def test_scores_and_boxes_to_ssd_detections():
+    scores = np.array([[0.1, 0.9], [0.8, 0.2]], dtype=np.float32)
+    boxes = np.array([[0.25, 0.25, 0.75, 0.75], [0, 0, 0.5, 0.5]], dtype=np.float32)
+    detections = scores_and_boxes_to_ssd_detections(scores, boxes)
+
+    # Only the anchor with a face score over the threshold is kept
+    faces = ssd_detections_to_boxes(detections, (100, 200, 3), confidence_thresh=0.5, enlarge_percentage=0)
+    assert faces.tolist() == [[50, 25, 100, 50]]
+
+
+def test_get_rois_bounds():
+    rois = [(10, 10, 20, 20), (50, 40, 10, 10)]
+    assert get_rois_bounds(rois, (100, 100, 3), 0) == (10, 10, 60, 50)
+    # The margin is proportional to each roi and the bounds are clipped to the image
+    assert get_rois_bounds(rois, (100, 55, 3), 0.5) == (0, 0, 55, 55)
+
+
+def test_eye_keypoints_to_boxes():
+    eye_keypoints = np.array([[[20, 50], [60, 50]]])
+    eyes = eye_keypoints_to_boxes(eye_keypoints, width_ratio=0.5, height_ratio=0.25)
+    assert eyes.tolist() == [[10, 45, 20, 10], [50, 45, 20, 10]]
+
+
+def test_estimate_eye_keypoints():
+    eye_keypoints = estimate_eye_keypoints([(10, 20, 100, 50)], (0.25, 0.75), 0.4)
+
+    assert eye_keypoints.tolist() == [[[35, 40], [85, 40]]]
+
+
+def test_get_largest_boxes_indices():
+    boxes = [(0, 0, 10, 10), (0, 0, 30, 30), (0, 0, 5, 5), (0, 0, 20, 20)]
+
+    assert get_largest_boxes_indices(boxes, 2) == [1, 3]
+    assert get_largest_boxes_indices(boxes, 8) == [0, 1, 2, 3]
+
+
+def test_detect_eyes_and_googlify_degraded():
+    googly = Googlifier(CONFIG_FILE_PATH)
+    filename = os.getcwd() + "/tests/test_data/people_test_image.jpg"
+    image = cv2.imread(filename, cv2.IMREAD_COLOR)
+    with open(filename, "rb") as image_file:
+        image_bytes = image_file.read()
+
+    # Without a deadline the image is never degraded
+    assert googly.select_degradation_level(image_bytes, None) == FULL
+
+    # The degraded levels use a smaller working size and faster encoding
+    assert googly.get_working_size(REDUCED) == min(googly.max_working_size, googly.degraded_working_size)
+    assert googly.get_encoding_quality(".jpg", REDUCED) == googly.degraded_encoding_quality[".jpg"]
+
+    # The fastest level keeps the largest faces and places their eyes from the face boxes
+    faces, eyes = googly.detect_faces_and_eyes(image, degradation_level=GEOMETRIC_EYES)
+    assert 0 < len(faces) <= googly.degraded_max_faces
+    assert len(eyes) == 2 * len(faces)
+    for index, (x, y, width, height) in enumerate(eyes):
+        face_x, face_y, face_width, face_height = faces[index // 2]
+        assert face_x <= x and x + width <= face_x + face_width
+        assert face_y <= y and y + height <= face_y + face_height
+
+    success, output_bytes = googly.detect_eyes_and_googlify(image_bytes, ".jpg", GEOMETRIC_EYES)
+    assert success
+    assert detect_image_format(output_bytes) == ".jpg"
+
+
+def test_detect_eyes_and_googlify_jpeg_regions():
+    googly = Googlifier(CONFIG_FILE_PATH)
+    filename = os.getcwd() + "/tests/test_data/people_test_image.jpg"
+    image = cv2.imread(filename, cv2.IMREAD_COLOR)
+    image_bytes = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_RST_INTERVAL, 2])[1].tobytes()
+
+    # The restart markers of the input are kept, since only the intervals around the eyes are encoded again
+    googly.jpeg_region_encoding = True
+    success, output_bytes = googly.detect_eyes_and_googlify(image_bytes, ".jpg")
+    assert success
+    assert output_bytes != image_bytes
+    assert read_jpeg_layout(output_bytes) is not None
+
+    googly.jpeg_region_encoding = False
+    success, output_bytes = googly.detect_eyes_and_googlify(image_bytes + b"\0", ".jpg")
+    assert success
+    assert read_jpeg_layout(output_bytes) is None
@@ -0,0 +1,63 @@
+import asyncio
+import threading
+
+import pytest
+
+from src.inference_pool import InferencePool, PoolSaturatedError
+
+
+def test_run_uses_one_worker_per_thread():
+    pool = InferencePool(threading.get_ident, max_workers=2, max_queue_size=6)
+
+    async def run_many():
+        return await asyncio.gather(*[pool.run(lambda worker: (worker, threading.get_ident())) for _ in range(8)])
+
+    results = asyncio.run(run_many())
+    pool.shutdown()
+
+    # Every call receives the worker created by the thread it runs in
+    assert all(worker == thread_id for worker, thread_id in results)
+    assert pool.in_flight == 0
+
+
+def test_run_rejects_when_saturated():
+    release = threading.Event()
+    pool = InferencePool(object, max_workers=1, max_queue_size=1)
+
+    async def run_saturated():
+        running = [asyncio.ensure_future(pool.run(lambda worker: release.wait())) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(PoolSaturatedError):
+            await pool.run(lambda worker: None)
+        release.set()
+        await asyncio.gather(*running)
+
+    asyncio.run(run_saturated())
+    pool.shutdown()
+    assert pool.in_flight == 0
+
+
+def test_run_uses_preloaded_workers():
+    preloaded_worker = object()
+    pool = InferencePool(object, max_workers=1, max_queue_size=1, preloaded_workers=[preloaded_worker])
+
+    async def run_twice():
+        return [await pool.run(lambda worker: worker) for _ in range(2)]
+
+    results = asyncio.run(run_twice())
+    pool.shutdown()
+
+    # The only thread of the pool takes the preloaded worker instead of creating one
+    assert results == [preloaded_worker, preloaded_worker]
+
+
+def test_run_on_all_workers():
+    preloaded_worker = object()
+    pool = InferencePool(object, max_workers=3, max_queue_size=1, preloaded_workers=[preloaded_worker])
+
+    workers = pool.run_on_all_workers(lambda worker: worker)
+    pool.shutdown()
+
+    # Each thread runs the function once with its own worker, including the preloaded one
+    assert len(set(map(id, workers))) == 3
+    assert preloaded_worker in workers
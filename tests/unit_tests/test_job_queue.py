@@ -0,0 +1,132 @@
+import threading
+import pytest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from src.job_queue import MemoryJobBackend, SqliteJobBackend, JobProcessor, QUEUED, RUNNING, DONE, FAILED, \
+    TIMED_OUT_ERROR, is_webhook_allowed, is_public_host
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryJobBackend({})
+    return SqliteJobBackend({"path": str(tmp_path / "jobs.sqlite")})
+
+
+def test_job_backend(backend):
+    backend.add("first", [b"image 1", b"image 2"], {"format": ".png"})
+    backend.add("second", [b"image 3"], {"format": None})
+    assert backend.count_pending() == 2
+    assert backend.get("first")["status"] == QUEUED
+    assert backend.get("missing") is None
+
+    # The oldest job is claimed first and only once
+    job_id, images, parameters, _, attempt = backend.claim(job_timeout=60, max_attempts=3)
+    assert (job_id, images, parameters, attempt) == ("first", [b"image 1", b"image 2"], {"format": ".png"}, 1)
+    assert backend.get("first")["status"] == RUNNING
+    assert backend.claim(job_timeout=60, max_attempts=3)[0] == "second"
+    assert backend.claim(job_timeout=60, max_attempts=3) is None
+
+    # A job running for longer than the timeout is claimed again, and only its last attempt can finish it
+    job_id, _, _, _, attempt = backend.claim(job_timeout=-1, max_attempts=3)
+    assert (job_id, attempt) == ("first", 2)
+    assert not backend.finish("first", 1, [b"output 1", None], [None, "Corrupt input file."])
+    assert backend.get("first")["status"] == RUNNING
+    assert backend.finish("first", 2, [b"output 1", None], [None, "Corrupt input file."])
+    assert not backend.finish("first", 2, [b"output 1", None], [None, "Corrupt input file."])
+    assert backend.finish("second", 1, [None], ["Corrupt input file."])
+    status = backend.get("first")
+    assert status["status"] == DONE and status["images"] == 2
+    assert status["errors"] == [None, "Corrupt input file."]
+    assert backend.get("second")["status"] == FAILED
+    assert backend.get_output("first", 0) == b"output 1"
+    assert backend.get_output("first", 1) is None
+    assert backend.count_pending() == 0
+
+    # Finished jobs are deleted once they expire
+    assert backend.delete_expired(max_age=60) == 0
+    assert backend.delete_expired(max_age=-1) == 2
+    assert backend.get("first") is None
+
+
+def test_job_backend_max_attempts(backend):
+    backend.add("job", [b"image 1", b"image 2"], {})
+    assert backend.claim(job_timeout=-1, max_attempts=2)[4] == 1
+    assert backend.claim(job_timeout=-1, max_attempts=2)[4] == 2
+
+    # A job that timed out in all its attempts fails instead of being claimed again
+    assert backend.claim(job_timeout=-1, max_attempts=2) is None
+    status = backend.get("job")
+    assert status["status"] == FAILED
+    assert status["errors"] == [TIMED_OUT_ERROR, TIMED_OUT_ERROR]
+    assert not backend.finish("job", 2, [b"output", b"output"], [None, None])
+    assert backend.count_pending() == 0
+
+
+def test_job_processor():
+    backend = MemoryJobBackend({})
+    workers = []
+
+    def process_job(worker, images, parameters):
+        if images == [b"fail"]:
+            raise ValueError("Cannot process the job.")
+        return [image.upper() for image in images], [None] * len(images)
+
+    processor = JobProcessor(backend, lambda: workers.append(object()) or workers[-1], process_job, processors=2,
+                             poll_interval=0.01, job_timeout=60, max_attempts=3, result_ttl=60, webhook_timeout=1)
+    backend.add("success", [b"image"], {})
+    backend.add("failure", [b"fail"], {})
+    processor.start()
+    try:
+        for _ in range(500):
+            if backend.count_pending() == 0:
+                break
+            processor._stop.wait(0.01)
+    finally:
+        processor.stop()
+
+    assert backend.get_output("success", 0) == b"IMAGE"
+    assert backend.get("failure")["status"] == FAILED
+    # Each thread creates its worker once, when it gets its first job
+    assert 1 <= len(workers) <= 2
+
+
+def test_webhook_checks():
+    # Only the http and https urls of the allowed hosts are webhooks
+    assert is_webhook_allowed("https://hooks.example.com/job", ["hooks.example.com"])
+    assert is_webhook_allowed("http://HOOKS.example.com:8080/job", ["hooks.example.com"])
+    assert not is_webhook_allowed("https://other.example.com/job", ["hooks.example.com"])
+    assert not is_webhook_allowed("file:///etc/passwd", ["hooks.example.com"])
+    assert not is_webhook_allowed("https://hooks.example.com/job", [])
+
+    # The loopback, private, link-local and metadata addresses are refused
+    for host in ["127.0.0.1", "localhost", "10.0.0.1", "192.168.1.1", "169.254.169.254", "::1", "::ffff:127.0.0.1"]:
+        assert not is_public_host(host, 80)
+    assert is_public_host("8.8.8.8", 80)
+
+
+def test_job_processor_refuses_private_webhooks():
+    requests = []
+
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            requests.append(self.path)
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), WebhookHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        processor = JobProcessor(MemoryJobBackend({}), object, lambda *_: ([], []), processors=0, poll_interval=0.01,
+                                 job_timeout=60, max_attempts=3, result_ttl=60, webhook_timeout=1,
+                                 webhook_hosts=["127.0.0.1"])
+        # Even an allowed host is not called when it resolves to the loopback address
+        processor.call_webhook("http://127.0.0.1:" + str(server.server_port) + "/job", {"id": "job"})
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert requests == []
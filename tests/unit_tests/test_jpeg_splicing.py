@@ -0,0 +1,65 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from src.image_operations import generate_googly_eyes, render_googly_eyes, get_googly_eyes_bounds
+from src.jpeg_splicing import encode_jpeg_regions, read_jpeg_layout, get_bit_lengths, get_magnitude_bits
+
+SAMPLING_FACTORS = {"420": cv2.IMWRITE_JPEG_SAMPLING_FACTOR_420, "422": cv2.IMWRITE_JPEG_SAMPLING_FACTOR_422,
+                    "444": cv2.IMWRITE_JPEG_SAMPLING_FACTOR_444}
+
+
+def read_test_image(grayscale: bool = False) -> np.ndarray:
+    filename = os.getcwd() + "/tests/test_data/people_test_image.jpg"
+    image = cv2.resize(cv2.imread(filename, cv2.IMREAD_COLOR), (1600, 1200))
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if grayscale else image
+
+
+def encode_with_restart_markers(image: np.ndarray, sampling_factor: str = "420") -> bytes:
+    return cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 90, cv2.IMWRITE_JPEG_RST_INTERVAL, 4,
+                                        cv2.IMWRITE_JPEG_SAMPLING_FACTOR, SAMPLING_FACTORS[sampling_factor]])[1]
+
+
+def test_get_bit_lengths_and_magnitude_bits():
+    values = np.array([0, 1, -1, 2, -3, 255, -1024])
+    sizes = get_bit_lengths(values)
+
+    assert sizes.tolist() == [0, 1, 1, 2, 2, 8, 11]
+    assert get_magnitude_bits(values, sizes).tolist() == [0, 1, 0, 2, 0, 255, 1023]
+
+
+@pytest.mark.parametrize("sampling_factor,grayscale", [("420", False), ("422", False), ("444", False),
+                                                       ("420", True)])
+def test_encode_jpeg_regions(sampling_factor, grayscale):
+    image_bytes = encode_with_restart_markers(read_test_image(grayscale), sampling_factor).tobytes()
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    googly_eyes = generate_googly_eyes([(600, 500, 40, 20), (700, 500, 40, 20)], np.random.default_rng(0))
+    googlified_image = render_googly_eyes(googly_eyes, image.copy())
+
+    output_bytes = encode_jpeg_regions(image_bytes, googlified_image, get_googly_eyes_bounds(googly_eyes))
+    assert output_bytes is not None
+    output_image = cv2.imdecode(np.frombuffer(output_bytes, np.uint8), cv2.IMREAD_COLOR)
+
+    # The googly eyes are encoded with the tables of the input
+    assert np.abs(output_image.astype(int) - googlified_image.astype(int))[450:570, 550:800].mean() < 2
+    assert abs(len(output_bytes) - len(image_bytes)) < 0.05 * len(image_bytes)
+
+    # Away from the eyes the image is not encoded again, so it decodes to the same pixels as the input
+    output_image[420:600, 480:800] = image[420:600, 480:800]
+    assert np.array_equal(output_image, image)
+
+
+def test_encode_jpeg_regions_fallback():
+    image = read_test_image()
+    image_bytes = encode_with_restart_markers(image).tobytes()
+    layout = read_jpeg_layout(image_bytes)
+    assert (layout.width, layout.height, layout.restart_interval, len(layout.components)) == (1600, 1200, 4, 3)
+
+    # Images without restart markers, that do not match the input or mostly changed must be encoded as a whole
+    assert read_jpeg_layout(cv2.imencode(".jpg", image)[1].tobytes()) is None
+    assert encode_jpeg_regions(cv2.imencode(".jpg", image)[1].tobytes(), image, [(0, 0, 10, 10)]) is None
+    assert encode_jpeg_regions(image_bytes, image[:-8], [(0, 0, 10, 10)]) is None
+    assert encode_jpeg_regions(image_bytes, image, [(0, 0, 1600, 1200)]) is None
+    assert encode_jpeg_regions(image_bytes, image, []) == image_bytes
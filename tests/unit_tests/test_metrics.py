@@ -0,0 +1,47 @@
+import json
+import os
+
+from src.metrics import MetricsRegistry, Counter, Gauge, Histogram
+
+
+def create_metrics(registry: MetricsRegistry):
+    """ Creates one metric of each type registered in the given registry instead of the global one. """
+    return (Counter("test_total", "Test counter.", labelnames=("result",), registry=registry),
+            Gauge("test_in_flight", "Test gauge.", registry=registry),
+            Histogram("test_seconds", "Test histogram.", buckets=(0.1, 1), registry=registry))
+
+
+def test_generate_latest():
+    registry = MetricsRegistry()
+    counter, gauge, histogram = create_metrics(registry)
+    counter.inc(result="ok")
+    counter.inc(2, result="ok")
+    gauge.set(3)
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+
+    lines = registry.generate_latest().splitlines()
+    assert 'test_total{result="ok"} 3.0' in lines
+    assert "test_in_flight 3.0" in lines
+    assert 'test_seconds_bucket{le="0.1"} 1.0' in lines
+    assert 'test_seconds_bucket{le="1.0"} 2.0' in lines
+    assert 'test_seconds_bucket{le="+Inf"} 3.0' in lines
+    assert "test_seconds_count 3.0" in lines
+
+
+def test_collect_aggregates_processes(tmp_path):
+    registry = MetricsRegistry(str(tmp_path))
+    counter, gauge, _ = create_metrics(registry)
+    counter.inc(result="ok")
+    gauge.set(1)
+
+    # Snapshot of another process that is still running (the parent) and of one that has finished
+    snapshot = {"test_total": {json.dumps(["ok"]): 2}, "test_in_flight": {json.dumps([]): 4}}
+    for pid in [os.getppid(), 2 ** 22 + 1]:
+        with open(os.path.join(tmp_path, str(pid) + ".json"), "w") as file_object:
+            json.dump(snapshot, file_object)
+
+    metrics = registry.collect()
+    assert metrics["test_total"] == {json.dumps(["ok"]): 5}
+    assert metrics["test_in_flight"] == {json.dumps([]): 5}
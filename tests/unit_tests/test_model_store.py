@@ -0,0 +1,48 @@
+import cv2
+import numpy as np
+
+from src.model_store import get_binary_model_path, load_file_storage_model
+
+
+def write_model(path: str, matrix: np.ndarray):
+    file_storage = cv2.FileStorage(path, cv2.FILE_STORAGE_WRITE)
+    file_storage.write("name", "model")
+    file_storage.startWriteStruct("params", cv2.FileNode_MAP)
+    file_storage.write("n_landmarks", 68)
+    file_storage.write("shape_offset", 0.5)
+    file_storage.startWriteStruct("feats_m", cv2.FileNode_SEQ)
+    for value in [500, 400]:
+        file_storage.write("", value)
+    file_storage.endWriteStruct()
+    file_storage.endWriteStruct()
+    file_storage.write("tree_0", matrix)
+    file_storage.release()
+
+
+def test_get_binary_model_path(tmp_path):
+    model_path = str(tmp_path / "model.yaml")
+    matrix = np.random.default_rng(0).random((50, 4))
+    write_model(model_path, matrix)
+
+    binary_path = get_binary_model_path(model_path, str(tmp_path / "cache"))
+    assert get_binary_model_path(model_path, str(tmp_path / "cache")) == binary_path
+
+    # The binary copy has the same content with the matrices in base64
+    file_storage = cv2.FileStorage(binary_path, cv2.FILE_STORAGE_READ)
+    assert file_storage.getNode("name").string() == "model"
+    assert file_storage.getNode("params").getNode("n_landmarks").real() == 68
+    assert file_storage.getNode("params").getNode("shape_offset").real() == 0.5
+    assert file_storage.getNode("params").getNode("feats_m").at(1).real() == 400
+    assert np.array_equal(file_storage.getNode("tree_0").mat(), matrix)
+    file_storage.release()
+    with open(binary_path, "r") as file_object:
+        assert "!!binary" in file_object.read()
+
+
+def test_load_file_storage_model(tmp_path):
+    model_loads = []
+
+    # The original file is loaded when the binary copy can not be created
+    model_path = str(tmp_path / "missing.yaml")
+    assert load_file_storage_model("model", model_path, lambda path: path, model_loads, str(tmp_path)) == model_path
+    assert [model_load.name for model_load in model_loads] == ["model"]
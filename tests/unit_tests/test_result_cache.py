@@ -0,0 +1,81 @@
+import pytest
+
+from src.detectors.base_detector import load_class
+from src.result_cache import ResultCache, SqliteCacheBackend
+
+
+def test_result_cache_lru_eviction():
+    cache = ResultCache(max_bytes=10, store_rendered=True)
+    cache.set("a", b"12345")
+    cache.set("b", b"12345")
+    assert cache.get("a") == b"12345"
+
+    # Adding a new entry evicts the least recently used one
+    cache.set("c", b"12345")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"12345"
+    assert cache.get("c") == b"12345"
+
+    assert cache.get_stats() == {"hits": 3, "misses": 1, "evictions": 1, "backend_evictions": 0, "size": 10}
+
+
+def test_result_cache_detections():
+    cache = ResultCache(max_bytes=1000, store_rendered=False)
+    key = ResultCache.get_key(b"image")
+    cache.set_detections(key, 40, 30, [(1, 2, 3, 4)], [(1, 2, 1, 1), (3, 2, 1, 1)])
+
+    assert cache.get_detections(key) == {"width": 40, "height": 30, "faces": [(1, 2, 3, 4)],
+                                         "eyes": [(1, 2, 1, 1), (3, 2, 1, 1)]}
+    assert cache.get_detections(ResultCache.get_key(b"other image")) is None
+    # The same image processed with another configuration or degradation level has another key
+    assert cache.get_detections(ResultCache.get_key(b"image", "other configuration:0")) is None
+
+    # Rendered images are not cached when store_rendered is disabled
+    cache.set_rendered(key, ".png", b"rendered")
+    assert cache.get_rendered(key, ".png") is None
+
+
+def test_result_cache_shared_backend(tmp_path):
+    config = {"path": str(tmp_path / "cache.sqlite"), "max_bytes": 10}
+    cache = ResultCache(max_bytes=100, store_rendered=True, backend=SqliteCacheBackend(config))
+    cache.set("a", b"12345")
+    cache.flush()
+
+    # Another process sees the entries through the backend
+    other_cache = ResultCache(max_bytes=100, store_rendered=True, backend=SqliteCacheBackend(config))
+    assert other_cache.get("a") == b"12345"
+
+    # The backend evicts the least recently used entries when it is full
+    other_cache.set("b", b"12345")
+    other_cache.set("c", b"12345")
+    other_cache.flush()
+    assert other_cache.backend.get("a") is None
+    assert other_cache.backend.evictions == 1
+
+
+def test_sqlite_cache_backend_eviction(tmp_path):
+    config = {"path": str(tmp_path / "cache.sqlite"), "max_bytes": 20, "access_update_interval": 1e-9}
+    backend = SqliteCacheBackend(config)
+    for key in "abcd":
+        backend.set(key, b"12345")
+    # Reading an entry moves it to the end of the eviction order
+    assert backend.get("a") == b"12345"
+
+    # A large entry evicts as many of the least recently used entries as needed at once
+    backend.set("e", b"1234567890")
+    assert [backend.get(key) for key in "bcd"] == [None, None, b"12345"]
+    assert backend.get("a") == b"12345"
+    assert backend.evictions == 2
+
+    # Replacing an entry only adds the difference of sizes to the total
+    backend.set("e", b"12345")
+    backend.set("f", b"12345")
+    assert backend.evictions == 2
+    assert backend._get_connection().execute("SELECT size FROM cache_size").fetchone()[0] == 20
+
+
+def test_load_backend_class():
+    # The backends are loaded by name from the config file like the detectors
+    assert load_class("src.result_cache.SqliteCacheBackend") is SqliteCacheBackend
+    with pytest.raises(Exception):
+        load_class("src.result_cache.ACCESS_UPDATE_INTERVAL")
@@ -0,0 +1,32 @@
+import io
+import os
+
+import cv2
+from src.googlifier import Googlifier
+from src.constants import *
+from src.video_processing import read_multipart_frames, encode_multipart_part, googlify_video_frames, \
+    MULTIPART_BOUNDARY
+
+
+def test_read_multipart_frames():
+    image = cv2.imread(os.getcwd() + "/tests/test_data/people_test_image.jpg", cv2.IMREAD_COLOR)
+    _, image_png = cv2.imencode(".png", image)
+    parts = [encode_multipart_part(image_png.tobytes(), "image/png"), encode_multipart_part(b"corrupt", "image/png"),
+             encode_multipart_part(image_png.tobytes(), "image/png", {"X-Frame-Index": 2})]
+    stream = b"".join(parts) + b"--" + MULTIPART_BOUNDARY.encode() + b"--\r\n"
+
+    # Read with small chunks so the parts are split between reads, the corrupt part is skipped
+    frames = list(read_multipart_frames(io.BytesIO(stream), MULTIPART_BOUNDARY, chunk_size=1000))
+    assert len(frames) == 2
+    assert all((frame == image).all() for frame in frames)
+
+
+def test_googlify_video_frames():
+    googly = Googlifier(CONFIG_FILE_PATH)
+    image = cv2.imread(os.getcwd() + "/tests/test_data/people_test_image.jpg", cv2.IMREAD_COLOR)
+    frames = [image.copy() for _ in range(10)]
+
+    # The encoded frames keep the order of the input frames
+    encoded_frames = list(googlify_video_frames(googly, iter(frames), lambda frame: frame.shape, encode_workers=3,
+                                                queue_size=2))
+    assert encoded_frames == [image.shape] * 10